@@ -0,0 +1,233 @@
+import math
+import atexit
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from article.models import Article
+
+
+# add hits to the articles, one UPDATE per distinct delta
+def write_hits(hits):
+    article_ids = defaultdict(list)
+    for article_id, n in hits.items():
+        article_ids[n].append(article_id)
+    for n, ids in article_ids.items():
+        Article.objects.filter(id__in=ids).update(hit=F("hit") + n)
+
+
+# buffers article hits and writes them with F("hit") + n in batches
+class HitCounter(ABC):
+    @abstractmethod
+    def incr(self, article_id, n=1):
+        pass
+
+    # hits not flushed yet
+    @abstractmethod
+    def pending(self, article_id):
+        pass
+
+    # {article_id: hits not flushed yet} of the articles
+    @abstractmethod
+    def pending_many(self, article_ids):
+        pass
+
+    # take every pending hit, {article_id: n}
+    @abstractmethod
+    def drain(self):
+        pass
+
+    def flush(self):
+        hits = self.drain()
+        try:
+            write_hits(hits)
+        except Exception:
+            # keep hits for the next flush
+            for article_id, n in hits.items():
+                self.incr(article_id, n)
+            raise
+        return sum(hits.values())
+
+
+# in-process counter, flushed periodically by a background thread
+class LocalHitCounter(HitCounter):
+    def __init__(self, flush_interval=None, **kwargs):
+        self.hits = defaultdict(int)
+        self.lock = threading.Lock()
+        self.flush_interval = flush_interval
+        self.timer = None
+
+    def incr(self, article_id, n=1):
+        with self.lock:
+            self.hits[article_id] += n
+            if self.flush_interval and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.periodic_flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def pending(self, article_id):
+        with self.lock:
+            return self.hits.get(article_id, 0)
+
+    def pending_many(self, article_ids):
+        with self.lock:
+            return {article_id: self.hits.get(article_id, 0) for article_id in article_ids}
+
+    def drain(self):
+        with self.lock:
+            hits, self.hits = self.hits, defaultdict(int)
+            return dict(hits)
+
+    def periodic_flush(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        finally:
+            connection.close()
+
+
+# rename the hash of hits to the draining hash and return the draining hash.
+# a draining hash left by a failed or killed flush is returned again instead
+DRAIN_SCRIPT = """
+if redis.call("exists", KEYS[2]) == 0 then
+    if redis.call("exists", KEYS[1]) == 0 then
+        return {}
+    end
+    redis.call("rename", KEYS[1], KEYS[2])
+end
+return redis.call("hgetall", KEYS[2])
+"""
+
+
+# counter shared by workers in a redis hash, flushed by the flush_hits command.
+# hits being flushed stay in a draining hash until they are written, so a flush
+# that dies is resumed by the next one and pending hits still count them.
+# one killed between the write and the delete counts its hits twice
+class RedisHitCounter(HitCounter):
+    KEY = "article:hits"
+    DRAINING_KEY = "article:hits:draining"
+    LOCK_KEY = "article:hits:lock"
+
+    def __init__(self, location="redis://127.0.0.1:6379/0", **kwargs):
+        import redis
+
+        self.client = redis.Redis.from_url(location)
+        self.drain_script = self.client.register_script(DRAIN_SCRIPT)
+
+    def incr(self, article_id, n=1):
+        self.client.hincrby(self.KEY, article_id, n)
+
+    def pending(self, article_id):
+        return self.pending_many([article_id])[article_id]
+
+    def pending_many(self, article_ids):
+        if not article_ids:
+            return {}
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.hmget(self.KEY, article_ids)
+        pipeline.hmget(self.DRAINING_KEY, article_ids)
+        hits, draining = pipeline.execute()
+        return {
+            article_id: int(n or 0) + int(m or 0)
+            for article_id, n, m in zip(article_ids, hits, draining)
+        }
+
+    def drain(self):
+        hits = self.drain_script(keys=[self.KEY, self.DRAINING_KEY])
+        return {int(article_id): int(n) for article_id, n in zip(hits[::2], hits[1::2])}
+
+    def flush(self):
+        lock = self.client.lock(self.LOCK_KEY, timeout=60)
+        if not lock.acquire(blocking=False):
+            # another process is flushing
+            return 0
+        try:
+            hits = self.drain()
+            # a failed write leaves the draining hash for the next flush
+            write_hits(hits)
+            self.client.delete(self.DRAINING_KEY)
+            return sum(hits.values())
+        finally:
+            if lock.owned():
+                lock.release()
+
+
+_counter = {}
+
+
+def get_hit_counter():
+    if "counter" not in _counter:
+        options = {
+            key.lower(): value for key, value in getattr(settings, "HIT_COUNTER", {}).items()
+        }
+        backend = options.pop("backend", "article.counters.LocalHitCounter")
+        _counter["counter"] = import_string(backend)(**options)
+    return _counter["counter"]
+
+
+# do not lose hits of this worker on shutdown
+@atexit.register
+def flush_hit_counter():
+    counter = _counter.get("counter")
+    if isinstance(counter, LocalHitCounter):
+        counter.flush()
+
+
+# views of (user, article) in the current hour, a view is counted once per hour.
+# bloom filter sized by capacity and error rate, reset when the hour changes
+class HourlyViewFilter:
+    def __init__(self, capacity=100000, error_rate=0.001, **kwargs):
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_cnt = max(1, round(self.size / capacity * math.log(2)))
+        self.lock = threading.Lock()
+        self.bucket = None
+        self.bits = bytearray(math.ceil(self.size / 8))
+
+    def clear(self):
+        with self.lock:
+            self.bucket = None
+            self.bits = bytearray(len(self.bits))
+
+    @classmethod
+    def hour_bucket(cls, now=None):
+        now = timezone.localtime(now)
+        return now.replace(minute=0, second=0, microsecond=0)
+
+    def positions(self, article_id, user_id, bucket):
+        key = ("%s&%s&%s" % (article_id, user_id, bucket.isoformat())).encode()
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big")
+        return [(h1 + i * h2) % self.size for i in range(self.hash_cnt)]
+
+    # mark the view, True if it was already seen in this hour
+    def seen(self, article_id, user_id, now=None):
+        bucket = self.hour_bucket(now)
+        with self.lock:
+            if bucket != self.bucket:
+                self.bucket = bucket
+                self.bits = bytearray(len(self.bits))
+
+            seen = True
+            for position in self.positions(article_id, user_id, bucket):
+                byte, bit = divmod(position, 8)
+                if not self.bits[byte] & (1 << bit):
+                    seen = False
+                    self.bits[byte] |= 1 << bit
+            return seen
+
+
+def get_view_filter():
+    if "view_filter" not in _counter:
+        options = {
+            key.lower(): value for key, value in getattr(settings, "VIEW_FILTER", {}).items()
+        }
+        _counter["view_filter"] = HourlyViewFilter(**options)
+    return _counter["view_filter"]
@@ -0,0 +1,201 @@
+import os
+import hashlib
+import logging
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+from imagekit.processors import ResizeToFit
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+
+from article.models import ProductImage
+
+
+logger = logging.getLogger(__name__)
+
+# heights of the generated variants, the smallest jpeg is the product thumbnail
+IMAGE_VARIANT_SIZES = (120, 360, 720)
+IMAGE_VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+IMAGE_ORIGINAL_FORMATS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp", "BMP": "bmp"}
+
+_executor = {}
+
+
+# worker pool shared by uploads of this process, None runs everything inline
+def get_image_executor():
+    workers = getattr(settings, "PRODUCT_IMAGE_WORKERS", 4)
+    if not workers:
+        return None
+    if workers not in _executor:
+        _executor[workers] = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="product_image"
+        )
+    return _executor[workers]
+
+
+def image_storage():
+    return ProductImage._meta.get_field("product_image").storage
+
+
+def content_hash_of(image):
+    digest = hashlib.sha256()
+    for chunk in image.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# extension of the stored original, storages like S3 derive the content type from it
+def extension_of(image):
+    try:
+        image.seek(0)
+        ext = IMAGE_ORIGINAL_FORMATS.get(Image.open(image).format)
+    except (OSError, ValueError):
+        ext = None
+    image.seek(0)
+    return ext or os.path.splitext(image.name or "")[1][1:].lower()
+
+
+# files are keyed by the sha256 of the original, identical uploads share them
+def original_name(content_hash, ext=""):
+    if not ext:
+        return "product_image/%s" % content_hash
+    return "product_image/%s.%s" % (content_hash, ext)
+
+
+def variant_name(content_hash, size, ext):
+    return "product_image/variants/%s_%d.%s" % (content_hash, size, ext)
+
+
+def variant_names(content_hash):
+    return {
+        size: {ext: variant_name(content_hash, size, ext) for ext in IMAGE_VARIANT_FORMATS}
+        for size in IMAGE_VARIANT_SIZES
+    }
+
+
+# content addressed keys are written in place, a concurrent upload of the same
+# bytes may overwrite it safely. storage.save would pick a suffixed free name
+# (S3 without AWS_S3_FILE_OVERWRITE) and leave a duplicate object behind
+def save_content(storage, name, content):
+    saved = storage._save(name, content)
+    if saved != name:
+        # FileSystemStorage never overwrites, the copy it renamed is dropped
+        storage.delete(saved)
+    return name
+
+
+# stream the upload to storage unless the same bytes are stored already,
+# temporary uploads are moved instead of copied
+def store_original(image):
+    storage = image_storage()
+    content_hash = content_hash_of(image)
+    name = original_name(content_hash, extension_of(image))
+    if not storage.exists(name):
+        save_content(storage, name, image)
+    return content_hash, name
+
+
+# store originals in parallel and write rows in one insert, variants are
+# generated by the pool once the article is committed and only for new content
+def ingest_product_images(article, images):
+    executor = get_image_executor()
+    run = executor.map if executor else map
+    stored = list(run(store_original, images))
+    thumbnails = dict(
+        ProductImage.objects.filter(
+            content_hash__in={content_hash for content_hash, name in stored},
+            thumbnail_status="ready",
+        ).values_list("content_hash", "product_thumbnail")
+    )
+    ProductImage.objects.bulk_create(
+        [
+            ProductImage(
+                article=article,
+                product_image=name,
+                content_hash=content_hash,
+                product_thumbnail=thumbnails.get(content_hash),
+                thumbnail_status="ready" if content_hash in thumbnails else "pending",
+            )
+            for content_hash, name in stored
+        ]
+    )
+    # chat.signals gives the images to chat rooms of the article on its next save
+    article._product_images_added = True
+    names = [name for content_hash, name in stored if content_hash not in thumbnails]
+    if names:
+        transaction.on_commit(lambda: schedule_thumbnails(names))
+    return [name for content_hash, name in stored]
+
+
+def schedule_thumbnails(names):
+    executor = get_image_executor()
+    if executor is None:
+        generate_thumbnails(names)
+        return
+    for name in names:
+        executor.submit(run_thumbnail_job, [name])
+
+
+def run_thumbnail_job(names):
+    try:
+        generate_thumbnails(names)
+    finally:
+        connection.close()
+
+
+# names=None regenerates every pending thumbnail
+def generate_thumbnails(names=None, status=("pending",)):
+    product_images = ProductImage.objects.filter(thumbnail_status__in=status)
+    if names is not None:
+        product_images = product_images.filter(product_image__in=names)
+    generated = 0
+    for product_image in product_images.iterator():
+        generated += generate_thumbnail(product_image)
+    return generated
+
+
+def generate_thumbnail(product_image):
+    try:
+        with product_image.product_image.open("rb") as original:
+            content_hash = product_image.content_hash or content_hash_of(original)
+            generate_variants(content_hash, original)
+    except Exception:
+        logger.exception("thumbnail of product image %s failed", product_image.id)
+        ProductImage.objects.filter(id=product_image.id).update(thumbnail_status="failed")
+        return 0
+    ProductImage.objects.filter(id=product_image.id).update(
+        content_hash=content_hash,
+        product_thumbnail=variant_name(content_hash, IMAGE_VARIANT_SIZES[0], "jpeg"),
+        thumbnail_status="ready",
+    )
+    return 1
+
+
+# encode the variants missing from storage, each content is encoded once
+def generate_variants(content_hash, original):
+    storage = image_storage()
+    missing = [
+        (size, ext)
+        for size in IMAGE_VARIANT_SIZES
+        for ext in IMAGE_VARIANT_FORMATS
+        if not storage.exists(variant_name(content_hash, size, ext))
+    ]
+    if not missing:
+        return 0
+    original.seek(0)
+    image = Image.open(original)
+    image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    for size, ext in missing:
+        # the thumbnail keeps the upscaling of the former ResizeToFit(height=120)
+        # field, larger variants stop at the size of the original
+        upscale = size == IMAGE_VARIANT_SIZES[0]
+        variant = ResizeToFit(height=size, upscale=upscale).process(image)
+        content = BytesIO()
+        variant.save(content, format=IMAGE_VARIANT_FORMATS[ext], quality=85)
+        save_content(storage, variant_name(content_hash, size, ext), ContentFile(content.getvalue()))
+    return len(missing)
@@ -0,0 +1,134 @@
+import random
+import signal
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+
+from location.models import Location
+from article.models import Article, ArticleSearchToken
+from article.search import get_search_backend
+
+
+WORDS = [
+    "맥북", "아이폰", "갤럭시", "의자", "책상", "자전거", "캠핑", "텐트", "운동화", "패딩",
+    "코트", "유모차", "모니터", "키보드", "마우스", "냉장고", "세탁기", "화분", "선인장", "소설",
+    "판매", "팝니다", "새상품", "중고", "급처", "정품", "미개봉", "상태", "좋아요", "깨끗",
+]
+KEYWORDS = ["맥북", "자전거", "미개봉", "캠핑 텐트", "선인장"]
+SYLLABLES = "가나다라마바사아자차카타파하거너더러머버서어저처커터퍼허고노도로모보소오조초"
+
+
+# mostly filler words, so that keywords are as selective as in real articles
+def random_word():
+    if random.random() < 0.02:
+        return random.choice(WORDS)
+    return "".join(random.choices(SYLLABLES, k=random.randint(2, 3)))
+
+
+def random_text(word_cnt):
+    return " ".join(random_word() for _ in range(word_cnt))
+
+
+class Command(BaseCommand):
+    help = "Compare LIKE search with the search backend on synthetic articles"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--database",
+            required=True,
+            help="name of the default database, synthetic articles are written to it",
+        )
+
+    def handle(self, *args, **options):
+        # the name is typed on purpose, settings point to the production database
+        if options["database"] != connection.settings_dict["NAME"]:
+            raise CommandError(
+                "benchmark_search writes up to %d articles to database %s, "
+                "pass its name with --database to run it there"
+                % (max(options["sizes"]), connection.settings_dict["NAME"])
+            )
+        backend = get_search_backend()
+        # articles left by a run that was killed before its cleanup
+        for location in Location.objects.filter(code="benchmark"):
+            self.cleanup(location)
+        # a terminated run still removes its articles in finally
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+        # synthetic articles are committed (FULLTEXT indexes only committed rows) and removed at the end
+        location = Location.objects.create(code="benchmark", place_name="benchmark")
+        try:
+            article_cnt = 0
+            for size in sorted(options["sizes"]):
+                self.create_articles(location, size - article_cnt, options["batch_size"])
+                article_cnt = size
+                backend.rebuild(
+                    Article.objects.filter(location=location), batch_size=options["batch_size"]
+                )
+                self.report(backend, location, size, options["repeat"])
+        finally:
+            self.cleanup(location)
+
+    def create_articles(self, location, article_cnt, batch_size):
+        while article_cnt > 0:
+            batch = min(article_cnt, batch_size)
+            Article.objects.bulk_create(
+                [
+                    Article(
+                        location=location,
+                        title=random_text(3)[:20],
+                        content=random_text(20),
+                        category="기타 중고물품",
+                    )
+                    for _ in range(batch)
+                ]
+            )
+            article_cnt -= batch
+
+    def report(self, backend, location, size, repeat):
+        articles = Article.objects.filter(location=location)
+        for keyword in KEYWORDS:
+            like = self.measure(
+                lambda: list(
+                    articles.filter(Q(title__contains=keyword) | Q(content__contains=keyword))
+                    .order_by("-created_at")
+                    .values_list("id", flat=True)[:15]
+                ),
+                repeat,
+            )
+            index = self.measure(
+                lambda: list(
+                    backend.search(articles, keyword)
+                    .order_by("-search_rank", "-created_at")
+                    .values_list("id", flat=True)[:15]
+                ),
+                repeat,
+            )
+            self.stdout.write(
+                "%8d articles  %-10s LIKE %8.2fms  %s %8.2fms"
+                % (size, keyword, like, type(backend).__name__, index)
+            )
+
+    def measure(self, query, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            query()
+        return (time.perf_counter() - start) * 1000 / repeat
+
+    def cleanup(self, location):
+        # raw delete, the ORM would load every synthetic article to send signals
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM %s WHERE article_id IN (SELECT id FROM %s WHERE location_id = %%s)"
+                % (ArticleSearchToken._meta.db_table, Article._meta.db_table),
+                [location.id],
+            )
+            cursor.execute(
+                "DELETE FROM %s WHERE location_id = %%s" % Article._meta.db_table,
+                [location.id],
+            )
+        location.delete()
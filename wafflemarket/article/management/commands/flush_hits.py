@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from article.counters import LocalHitCounter, get_hit_counter
+
+
+class Command(BaseCommand):
+    help = "Write buffered article hits of a shared hit counter to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float, default=None, help="keep flushing every interval seconds"
+        )
+
+    def handle(self, *args, **options):
+        counter = get_hit_counter()
+        if isinstance(counter, LocalHitCounter):
+            # hits of LocalHitCounter live in the worker processes, not in this one
+            raise CommandError(
+                "flush_hits needs a shared HIT_COUNTER backend like article.counters.RedisHitCounter"
+            )
+        interval = options["interval"]
+        while True:
+            hit_cnt = counter.flush()
+            self.stdout.write("flushed %d hits" % hit_cnt)
+            if interval is None:
+                break
+            time.sleep(interval)
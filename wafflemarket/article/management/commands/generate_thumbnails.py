@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from article.images import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate product image thumbnails left pending, e.g. after a worker restart"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--failed", action="store_true", help="retry failed thumbnails as well"
+        )
+
+    def handle(self, *args, **options):
+        status = ("pending", "failed") if options["failed"] else ("pending",)
+        generated = generate_thumbnails(status=status)
+        self.stdout.write("generated %d thumbnails" % generated)
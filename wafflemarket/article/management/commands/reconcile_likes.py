@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from article.services import reconcile_likes
+
+
+class Command(BaseCommand):
+    help = "Recompute like count of every article from liked users"
+
+    def handle(self, *args, **options):
+        drifted = reconcile_likes()
+        self.stdout.write(self.style.SUCCESS("fixed like count of %d articles" % drifted))
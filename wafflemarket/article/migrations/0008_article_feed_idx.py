@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0007_article_hit'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['location', 'category', 'created_at', 'id'], name='article_feed_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            "CREATE FULLTEXT INDEX article_fulltext_idx "
+            "ON article_article (title, content) WITH PARSER ngram"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP INDEX article_fulltext_idx ON article_article")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0008_article_feed_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=20)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='article.article')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='articlesearchtoken',
+            index=models.Index(fields=['token', 'article'], name='article_search_token_idx'),
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0011_productimage_content_hash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['article', 'parent', 'created_at'], name='comment_thread_idx'),
+        ),
+    ]
@@ -1,7 +1,7 @@
 from imagekit.models import ProcessedImageField
 from imagekit.processors import ResizeToFit
 
-from django.db import models
+from django.db import models, transaction
 
 from user.models import User
 from user.services import upload_product_image
@@ -30,6 +30,21 @@ class Article(models.Model):
     hit = models.PositiveBigIntegerField(default=0)
     like = models.PositiveBigIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # neighborhood feed, paginated by (created_at, id)
+            models.Index(
+                fields=["location", "category", "created_at", "id"],
+                name="article_feed_idx",
+            ),
+        ]
+
+    # post_save handlers, like the temparature deltas of review.signals, commit
+    # with the row. deletes run in the transaction of the collector already
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     def update(
         self, title=None, content=None, product_image=None, category=None, price=None, **kwargs,
     ):
@@ -59,8 +74,23 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     deleted_at = models.DateTimeField(null=True, default=None)
 
+    class Meta:
+        indexes = [
+            # comment pages and replies of an article, ordered by created_at
+            models.Index(
+                fields=["article", "parent", "created_at"], name="comment_thread_idx"
+            ),
+        ]
+
 
 class ProductImage(models.Model):
+
+    THUMBNAIL_STATUS_CHOICES = (
+        ("pending", "pending"),
+        ("ready", "ready"),
+        ("failed", "failed"),
+    )
+
     article = models.ForeignKey(
         Article, related_name="product_images", null=False, on_delete=models.CASCADE
     )
@@ -71,3 +101,23 @@ class ProductImage(models.Model):
         processors=[ResizeToFit(height=120)],
         format="JPEG",
     )
+    # sha256 of the original, names the original and its variants (article.images)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # thumbnails are generated after the upload by article.images
+    thumbnail_status = models.CharField(
+        max_length=10, choices=THUMBNAIL_STATUS_CHOICES, default="ready"
+    )
+
+
+# inverted index of article title and content, used by article.search.TokenSearchBackend
+class ArticleSearchToken(models.Model):
+    article = models.ForeignKey(
+        Article, related_name="search_tokens", on_delete=models.CASCADE
+    )
+    token = models.CharField(max_length=20)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["token", "article"], name="article_search_token_idx"),
+        ]
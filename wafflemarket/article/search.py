@@ -0,0 +1,124 @@
+from abc import ABC, abstractmethod
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from article.models import Article, ArticleSearchToken
+
+
+# same token size as MySQL ngram parser (ngram_token_size=2)
+NGRAM_SIZE = 2
+TITLE_WEIGHT = 2
+CONTENT_WEIGHT = 1
+
+
+def tokenize(text):
+    tokens = Counter()
+    for word in text.lower().split():
+        for i in range(len(word) - NGRAM_SIZE + 1):
+            tokens[word[i : i + NGRAM_SIZE]] += 1
+    return tokens
+
+
+class SearchBackend(ABC):
+    # keep index in sync with the article
+    def index(self, article):
+        pass
+
+    # (re)build index of given articles, every article if None
+    def rebuild(self, articles=None, batch_size=1000):
+        pass
+
+    # filter articles matching keyword in title or content, annotated with search_rank
+    @abstractmethod
+    def search(self, articles, keyword):
+        pass
+
+    # keywords shorter than a token are not indexed
+    def search_short(self, articles, keyword):
+        articles = articles.filter(Q(title__contains=keyword) | Q(content__contains=keyword))
+        return articles.annotate(search_rank=Value(0))
+
+
+# FULLTEXT index with ngram parser, maintained by MySQL itself
+class MySQLSearchBackend(SearchBackend):
+    def search(self, articles, keyword):
+        keyword = keyword.strip()
+        if len(keyword) < NGRAM_SIZE:
+            return self.search_short(articles, keyword)
+
+        # phrase search, every ngram of keyword should match in order
+        phrase = '"%s"' % keyword.replace('"', " ")
+        match = "MATCH (%s.title, %s.content) AGAINST (%%s IN BOOLEAN MODE)" % (
+            (Article._meta.db_table,) * 2
+        )
+        return articles.annotate(search_rank=RawSQL(match, (phrase,))).filter(
+            search_rank__gt=0
+        )
+
+
+# inverted index of ngram tokens in ArticleSearchToken, for databases without FULLTEXT
+class TokenSearchBackend(SearchBackend):
+    def article_tokens(self, article):
+        tokens = Counter()
+        for token, count in tokenize(article.title).items():
+            tokens[token] += count * TITLE_WEIGHT
+        for token, count in tokenize(article.content).items():
+            tokens[token] += count * CONTENT_WEIGHT
+        return [
+            ArticleSearchToken(article_id=article.id, token=token, weight=weight)
+            for token, weight in tokens.items()
+        ]
+
+    def index(self, article):
+        ArticleSearchToken.objects.filter(article_id=article.id).delete()
+        ArticleSearchToken.objects.bulk_create(self.article_tokens(article))
+
+    def rebuild(self, articles=None, batch_size=1000):
+        if articles is None:
+            articles = Article.objects.all()
+            ArticleSearchToken.objects.all().delete()
+        else:
+            ArticleSearchToken.objects.filter(article__in=articles).delete()
+
+        tokens = []
+        for article in articles.only("id", "title", "content").iterator():
+            tokens += self.article_tokens(article)
+            if len(tokens) >= batch_size:
+                ArticleSearchToken.objects.bulk_create(tokens, batch_size=batch_size)
+                tokens = []
+        ArticleSearchToken.objects.bulk_create(tokens, batch_size=batch_size)
+
+    def search(self, articles, keyword):
+        tokens = list(tokenize(keyword))
+        if not tokens:
+            return self.search_short(articles, keyword.strip())
+
+        # articles having every token of keyword
+        matched = (
+            ArticleSearchToken.objects.filter(token__in=tokens)
+            .values("article")
+            .annotate(token_cnt=Count("id"))
+            .filter(token_cnt=len(tokens))
+            .values("article")
+        )
+        rank = (
+            ArticleSearchToken.objects.filter(article=OuterRef("pk"), token__in=tokens)
+            .values("article")
+            .annotate(rank=Sum("weight"))
+            .values("rank")
+        )
+        return articles.filter(id__in=matched).annotate(search_rank=Subquery(rank))
+
+
+def get_search_backend():
+    backend = getattr(settings, "ARTICLE_SEARCH_BACKEND", None)
+    if backend is not None:
+        return import_string(backend)()
+    if connection.vendor == "mysql":
+        return MySQLSearchBackend()
+    return TokenSearchBackend()
@@ -2,9 +2,20 @@ import time
 
 from rest_framework import serializers
 
+from django.db import models
+
 from user.serializers import UserSimpleSerializer
 from location.serializers import LocationSerializer
 from article.models import Article, Comment, ProductImage
+from article.counters import get_hit_counter
+from article.images import variant_names
+from article.services import (
+    ARTICLE_PAGE_SIZE,
+    ARTICLE_MAX_PAGE_SIZE,
+    COMMENT_PAGE_SIZE,
+    COMMENT_MAX_PAGE_SIZE,
+    decode_cursor,
+)
 from review.models import Review
 
 
@@ -81,6 +92,7 @@ class ArticleSerializer(serializers.ModelSerializer):
     
     user_liked = serializers.SerializerMethodField(read_only=True)
     review_exists =  serializers.SerializerMethodField(read_only=True)
+    hit = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Article
@@ -140,6 +152,10 @@ class ArticleSerializer(serializers.ModelSerializer):
         user = self.context["user"]
         return user in article.liked_users.all()
     
+    def get_hit(self, article):
+        # including hits not flushed yet
+        return article.hit + get_hit_counter().pending(article.id)
+
     def get_review_exists(self, article):
         user = self.context["user"]
         seller_review_exists = Review.objects.filter(review_type="seller", article=article, reviewer=user).exists()
@@ -148,8 +164,46 @@ class ArticleSerializer(serializers.ModelSerializer):
             "seller" : seller_review_exists,
             "buyer" : buyer_review_exists
         }
-        
-        
+
+
+# pending hits of every article of the page with one call to the hit counter
+class ArticleHitListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        articles = list(data.all() if isinstance(data, models.Manager) else data)
+        self.context["pending_hits"] = get_hit_counter().pending_many(
+            [article.id for article in articles]
+        )
+        return super().to_representation(articles)
+
+
+# ArticleSerializer for articles loaded by article.services.prefetch_articles
+class ArticleListSerializer(ArticleSerializer):
+    class Meta(ArticleSerializer.Meta):
+        list_serializer_class = ArticleHitListSerializer
+
+    def get_hit(self, article):
+        pending_hits = self.context.get("pending_hits")
+        if pending_hits is None:
+            return super().get_hit(article)
+        return article.hit + pending_hits.get(article.id, 0)
+
+    def get_delete_enable(self, article):
+        user = self.context["user"]
+        return article.seller_id == user.id
+
+    def get_product_images(self, article):
+        return ProductImageSerializer(
+            article.product_images.all(), many=True, context=self.context
+        ).data
+
+    def get_user_liked(self, article):
+        return article.user_liked
+
+    def get_review_exists(self, article):
+        return {
+            "seller" : article.seller_review_exists,
+            "buyer" : article.buyer_review_exists
+        }
 
 
 class CommentCreateSerializer(serializers.Serializer):
@@ -163,6 +217,7 @@ class CommentCreateSerializer(serializers.Serializer):
             commenter=commenter, article=article, parent=parent, **validated_data
         )
         comment.save()
+        return comment
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -193,6 +248,9 @@ class CommentSerializer(serializers.ModelSerializer):
         return comment.commenter == user
 
     def get_replies(self, comment):
+        # built by article.services.comment_tree
+        if hasattr(comment, "tree_replies"):
+            return CommentSerializer(comment.tree_replies, context=self.context, many=True).data
         replies = Comment.objects.filter(parent=comment).order_by("created_at")
         return CommentSerializer(replies, context=self.context, many=True).data
     
@@ -209,15 +267,33 @@ class CommentSerializer(serializers.ModelSerializer):
             return None
 
 
+# comments of the since mode, replies are sent flat with their parent
+class CommentDeltaSerializer(CommentSerializer):
+    class Meta:
+        model = Comment
+        fields = (
+            "id",
+            "parent",
+            "commenter",
+            "delete_enable",
+            "content",
+            "created_at",
+            "deleted_at",
+        )
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField(read_only=True)
     thumbnail_url = serializers.SerializerMethodField(read_only=True)
+    variants = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = ProductImage
         fields = (
             "image_url",
             "thumbnail_url",
+            "thumbnail_status",
+            "variants",
         )
 
     def get_image_url(self, object):
@@ -227,11 +303,29 @@ class ProductImageSerializer(serializers.ModelSerializer):
         return url[: url.find("?")]
 
     def get_thumbnail_url(self, object):
+        # pending or failed thumbnails have no file yet
+        if not object.product_thumbnail:
+            return None
         url = object.product_thumbnail.url
         if url.find("?") == -1:
             return url
         return url[: url.find("?")]
 
+    # {height: {format: url}}, null until the variants are generated
+    def get_variants(self, object):
+        if object.thumbnail_status != "ready" or not object.content_hash:
+            return None
+        storage = object.product_image.storage
+        variants = {}
+        for size, names in variant_names(object.content_hash).items():
+            variants[str(size)] = {}
+            for ext, name in names.items():
+                url = storage.url(name)
+                if url.find("?") != -1:
+                    url = url[: url.find("?")]
+                variants[str(size)][ext] = url
+        return variants
+
 
 class ArticlePaginationValidator(serializers.Serializer):
     page_id = serializers.IntegerField(required=True)
@@ -249,3 +343,32 @@ class ArticlePaginationValidator(serializers.Serializer):
         if page_id <= 0 or page_id > num_pages:
             raise serializers.ValidationError("페이지 번호가 범위를 벗어났습니다.")
         return data
+
+
+class ArticleCursorValidator(serializers.Serializer):
+    cursor = serializers.CharField(required=True, allow_blank=True)
+    size = serializers.IntegerField(required=False, default=ARTICLE_PAGE_SIZE)
+    max_size = ARTICLE_MAX_PAGE_SIZE
+
+    def validate(self, data):
+        cursor = data.get("cursor")
+        size = data.get("size")
+        if size <= 0:
+            raise serializers.ValidationError("페이지 크기는 자연수여야 해요.")
+        if cursor:
+            try:
+                cursor = decode_cursor(cursor)
+            except (ValueError, TypeError):
+                raise serializers.ValidationError("커서가 올바르지 않습니다.")
+        else:
+            cursor = None
+        return {"cursor": cursor, "size": min(size, self.max_size)}
+
+
+class CommentCursorValidator(ArticleCursorValidator):
+    size = serializers.IntegerField(required=False, default=COMMENT_PAGE_SIZE)
+    max_size = COMMENT_MAX_PAGE_SIZE
+
+
+class CommentSinceValidator(serializers.Serializer):
+    since = serializers.IntegerField(required=True, min_value=0)
@@ -0,0 +1,195 @@
+import json
+import base64
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils.dateparse import parse_datetime
+
+from user.models import User
+from article.models import Article, Comment
+from review.models import Review
+
+
+# users with everything UserSimpleSerializer reads
+def prefetch_users():
+    return User.objects.select_related("location").annotate(
+        article_cnt=Count("articles_sold")
+    )
+
+
+# load everything ArticleListSerializer reads, so a page costs a constant number of queries
+def prefetch_articles(articles, user):
+    liked = Article.liked_users.through.objects.filter(
+        article_id=OuterRef("pk"), user_id=user.id
+    )
+    reviews = Review.objects.filter(article_id=OuterRef("pk"), reviewer_id=user.id)
+    return (
+        articles.select_related("location")
+        .prefetch_related(
+            Prefetch("seller", queryset=prefetch_users()),
+            Prefetch("buyer", queryset=prefetch_users()),
+            "product_images",
+        )
+        .annotate(
+            user_liked=Exists(liked),
+            seller_review_exists=Exists(reviews.filter(review_type="seller")),
+            buyer_review_exists=Exists(reviews.filter(review_type="buyer")),
+        )
+    )
+
+
+ARTICLE_PAGE_SIZE = 15
+ARTICLE_MAX_PAGE_SIZE = 50
+
+
+# opaque cursor pointing at (created_at, id) of the last article of a page
+def encode_cursor(article):
+    value = json.dumps([article.created_at.isoformat(), article.id])
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, article_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    created_at = parse_datetime(created_at)
+    if created_at is None or not isinstance(article_id, int):
+        raise ValueError("invalid cursor")
+    return created_at, article_id
+
+
+# keyset pagination on (created_at, id), never counts or offsets
+def paginate_articles(articles, cursor=None, size=ARTICLE_PAGE_SIZE):
+    articles = articles.order_by("-created_at", "-id")
+    if cursor is not None:
+        created_at, article_id = cursor
+        articles = articles.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=article_id)
+        )
+
+    page = list(articles[: size + 1])
+    next_cursor = None
+    if len(page) > size:
+        page = page[:size]
+        next_cursor = encode_cursor(page[-1])
+    return page, next_cursor
+
+
+# like or unlike with a conditional insert/delete on the through table, returns (liked, like)
+def toggle_like(article, user):
+    liked_users = Article.liked_users.through
+    articles = Article.objects.filter(id=article.id)
+    with transaction.atomic():
+        deleted, _ = liked_users.objects.filter(article_id=article.id, user_id=user.id).delete()
+        if deleted:
+            articles.filter(like__gt=0).update(like=F("like") - 1)
+            liked = False
+        else:
+            try:
+                with transaction.atomic():
+                    liked_users.objects.create(article_id=article.id, user_id=user.id)
+                articles.update(like=F("like") + 1)
+            except IntegrityError:
+                # liked by a concurrent request of the same user
+                pass
+            liked = True
+        like = articles.values_list("like", flat=True).get()
+    return liked, like
+
+
+# recompute like of every article from the through table, returns the number of drifted articles
+def reconcile_likes():
+    liked_cnt = Coalesce(
+        Subquery(
+            Article.liked_users.through.objects.filter(article_id=OuterRef("pk"))
+            .values("article_id")
+            .annotate(cnt=Count("id"))
+            .values("cnt")
+        ),
+        0,
+    )
+    drifted = Article.objects.annotate(liked_cnt=liked_cnt).exclude(like=F("liked_cnt")).count()
+    if drifted:
+        Article.objects.update(like=liked_cnt)
+    return drifted
+
+
+COMMENT_PAGE_SIZE = 20
+COMMENT_MAX_PAGE_SIZE = 100
+
+
+# comments with everything CommentSerializer reads in the same query
+def prefetch_comments(comments):
+    article_cnt = Coalesce(
+        Subquery(
+            Article.objects.filter(seller_id=OuterRef("commenter_id"))
+            .values("seller_id")
+            .annotate(cnt=Count("id"))
+            .values("cnt")
+        ),
+        0,
+    )
+    return (
+        comments.select_related("commenter__location")
+        .annotate(commenter_article_cnt=article_cnt)
+        .order_by("created_at", "id")
+    )
+
+
+def prepare_comment(comment):
+    comment.tree_replies = []
+    if comment.commenter is not None:
+        # read by UserSimpleSerializer.get_article_cnt
+        comment.commenter.article_cnt = comment.commenter_article_cnt
+    return comment
+
+
+# nest replies under their parent in tree_replies in one pass, returns the roots
+def build_comment_tree(comments):
+    by_id = {comment.id: prepare_comment(comment) for comment in comments}
+    roots = []
+    for comment in comments:
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.tree_replies.append(comment)
+    return roots
+
+
+# every comment of the article in one query
+def comment_tree(article):
+    comments = prefetch_comments(Comment.objects.filter(article=article))
+    return build_comment_tree(list(comments))
+
+
+# keyset pagination of top-level comments on (created_at, id), oldest first,
+# replies are loaded one level per query
+def paginate_comments(article, cursor=None, size=COMMENT_PAGE_SIZE):
+    comments = Comment.objects.filter(article=article)
+    roots = comments.filter(parent=None)
+    if cursor is not None:
+        created_at, comment_id = cursor
+        roots = roots.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=comment_id)
+        )
+
+    page = list(prefetch_comments(roots)[: size + 1])
+    next_cursor = None
+    if len(page) > size:
+        page = page[:size]
+        next_cursor = encode_cursor(page[-1])
+
+    loaded = list(page)
+    parents = [comment.id for comment in page]
+    while parents:
+        replies = list(prefetch_comments(comments.filter(parent_id__in=parents)))
+        loaded.extend(replies)
+        parents = [reply.id for reply in replies]
+    build_comment_tree(loaded)
+    return page, next_cursor
+
+
+# comments written after since_id, flat with their parent id
+def comments_since(article, since_id):
+    comments = prefetch_comments(Comment.objects.filter(article=article, id__gt=since_id))
+    return [prepare_comment(comment) for comment in comments]
@@ -0,0 +1,28 @@
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+
+from article.models import Article
+from article.search import get_search_backend
+
+
+SEARCH_FIELDS = {"title", "content"}
+
+
+def search_state(article):
+    if SEARCH_FIELDS & article.get_deferred_fields():
+        return None
+    return (article.title, article.content)
+
+
+@receiver(post_init, sender=Article)
+def remember_search_state(sender, instance, **kwargs):
+    instance._search_state = search_state(instance)
+
+
+# reindex only when title or content changed, tokens are deleted with the article
+@receiver(post_save, sender=Article)
+def update_search_index(sender, instance, created, **kwargs):
+    state = search_state(instance)
+    if created or state is None or state != instance._search_state:
+        get_search_backend().index(instance)
+    instance._search_state = state
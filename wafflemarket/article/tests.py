@@ -1,13 +1,44 @@
+import mimetypes
+import tempfile
+import threading
+from datetime import datetime
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from PIL import Image
+
 from factory.django import DjangoModelFactory
 from rest_framework import status
 
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import (
+    Client,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from user.models import User
 from user.serializers import jwt_token_of
 from user.tests import UserFactory
+from location.models import LocationNeighborhood
+from location.services import get_neighborhood_map
 from location.tests import LocationFactory
-from article.models import Article, Comment
+from article.models import Article, ArticleSearchToken, Comment, ProductImage
+from article.counters import (
+    HourlyViewFilter,
+    LocalHitCounter,
+    get_hit_counter,
+    get_view_filter,
+)
+from article.images import ingest_product_images, save_content
+from article.serializers import ArticleListSerializer, ProductImageSerializer
+from article.services import prefetch_articles
 
 
 class ArticleFactory(DjangoModelFactory):
@@ -492,9 +523,7 @@ class PostCommentTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-        res_data = response.data
-        self.assertEqual(len(res_data), 1)
-        comment = res_data[0]
+        comment = response.data
         self.assertEqual(comment["id"], 1)
         self.assertEqual(comment["commenter"]["id"], self.user2.id)
         self.assertEqual(comment["content"], "맥북 구매 원합니다.")
@@ -829,8 +858,7 @@ class PostReplyTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
 
-        res_data = response.data
-        reply = res_data[0]["replies"][0]
+        reply = response.data
         self.assertEqual(reply["id"], 3)
         self.assertEqual(reply["commenter"]["id"], self.user1.id)
         self.assertEqual(reply["content"], "직거래 가능하신가요?")
@@ -851,6 +879,24 @@ class PostReplyTestCase(TestCase):
 
         self.assertEqual(Comment.objects.count(), 3)
 
+    def test_post_reply_thread(self):
+        a_id = str(self.article1.id)
+        c_id = str(self.comment1.id)
+
+        # legacy shape, the whole thread
+        response = self.client.post(
+            "/api/v1/article/%s/comment/%s/?thread=true" % (a_id, c_id),
+            data=self.post_data.copy(),
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        res_data = response.data
+        self.assertEqual(len(res_data), 1)
+        self.assertEqual(res_data[0]["id"], self.comment1.id)
+        self.assertEqual(len(res_data[0]["replies"]), 1)
+        self.assertEqual(res_data[0]["replies"][0]["content"], "직거래 가능하신가요?")
+
 
 class PutLikeTestCase(TestCase):
     @classmethod
@@ -934,3 +980,764 @@ class PutLikeTestCase(TestCase):
 
         article = Article.objects.get(pk=int(pk))
         self.assertEqual(article.like, 0)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    MEDIA_ROOT=tempfile.mkdtemp(),
+)
+class GetArticleListQueryTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.user1_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01011112222")
+        )
+        cls.user2 = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+        )
+        cls.location1 = LocationFactory(
+            code="1111011700",
+            place_name="서울특별시 종로구 당주동",
+        )
+        cls.location2 = LocationFactory(
+            code="1111011100",
+            place_name="서울특별시 종로구 옥인동",
+        )
+        LocationNeighborhood.objects.create(
+            location=cls.location1, neighborhood=cls.location2
+        )
+        cls.user1.location = cls.location1
+        cls.user1.save()
+        cls.user2.location = cls.location2
+        cls.user2.save()
+        get_neighborhood_map()
+
+    def create_articles(self, article_num):
+        for i in range(article_num):
+            article = ArticleFactory(
+                seller=self.user2 if i % 2 else self.user1,
+                buyer=self.user1 if i % 2 else None,
+                location=self.location2 if i % 3 else self.location1,
+                price=10000,
+                title="식물 판매",
+                content="공기정화식물 판매해요.",
+                category="식물",
+            )
+            ProductImage.objects.create(
+                article=article,
+                product_image="product_image/image_%d" % i,
+                product_thumbnail="product_image/thumbnail_%d" % i,
+            )
+            if i % 4 == 0:
+                article.liked_users.add(self.user1)
+
+    def test_get_article_list_query_count(self):
+        # number of queries should not depend on the number of articles
+        for article_num in (15, 50, 200):
+            Article.objects.all().delete()
+            self.create_articles(article_num)
+
+            with self.assertNumQueries(5):
+                response = self.client.get(
+                    "/api/v1/article/",
+                    data={"category": "식물"},
+                    HTTP_AUTHORIZATION=self.user1_token,
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            res_data = response.json()
+            self.assertEqual(len(res_data), article_num)
+            self.assertEqual(len(res_data[0]["product_images"]), 1)
+            liked = [article["user_liked"] for article in res_data]
+            self.assertEqual(liked.count(True), (article_num + 3) // 4)
+
+        with self.assertNumQueries(8):
+            response = self.client.get(
+                "/api/v1/article/",
+                data={"category": "식물", "page": 2},
+                HTTP_AUTHORIZATION=self.user1_token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 15)
+
+    def test_get_article_list_cursor(self):
+        self.create_articles(60)
+
+        # walk every page with the returned cursor
+        ids = []
+        cursor = ""
+        for expected_num in (15, 15, 15, 15):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    "/api/v1/article/",
+                    data={"category": "식물", "cursor": cursor},
+                    HTTP_AUTHORIZATION=self.user1_token,
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertFalse(
+                any("COUNT(*)" in query["sql"] for query in queries.captured_queries)
+            )
+
+            res_data = response.json()
+            self.assertEqual(len(res_data["articles"]), expected_num)
+            ids += [article["id"] for article in res_data["articles"]]
+            cursor = res_data["next_cursor"]
+        self.assertIsNone(cursor)
+        self.assertEqual(ids, sorted(Article.objects.values_list("id", flat=True), reverse=True))
+
+        # page size is capped
+        response = self.client.get(
+            "/api/v1/article/",
+            data={"category": "식물", "cursor": "", "size": 1000},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["articles"]), 50)
+
+        response = self.client.get(
+            "/api/v1/article/",
+            data={"category": "식물", "cursor": "", "size": 20},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(len(response.json()["articles"]), 20)
+
+        # invalid cursor
+        response = self.client.get(
+            "/api/v1/article/",
+            data={"category": "식물", "cursor": "invalid"},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SearchArticleTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.user1_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01011112222")
+        )
+        cls.user2 = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+            is_active=False,
+        )
+        cls.location1 = LocationFactory(
+            code="1111011700",
+            place_name="서울특별시 종로구 당주동",
+        )
+        cls.location2 = LocationFactory(
+            code="1111011100",
+            place_name="서울특별시 종로구 옥인동",
+        )
+        cls.user1.location = cls.location1
+        cls.user1.save()
+
+        cls.article1 = ArticleFactory(
+            seller=cls.user1,
+            location=cls.location1,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        cls.article2 = ArticleFactory(
+            seller=cls.user1,
+            location=cls.location1,
+            title="노트북 파우치",
+            content="맥북 프로에 맞는 파우치입니다.",
+            category="디지털기기",
+        )
+        # not in neighborhood
+        cls.article3 = ArticleFactory(
+            seller=cls.user1,
+            location=cls.location2,
+            title="맥북 에어",
+            content="맥북 에어 판매합니다.",
+            category="디지털기기",
+        )
+        # seller not active
+        cls.article4 = ArticleFactory(
+            seller=cls.user2,
+            location=cls.location1,
+            title="맥북 충전기",
+            content="맥북 충전기 팝니다.",
+            category="디지털기기",
+        )
+
+    def search(self, keyword):
+        response = self.client.get(
+            "/api/v1/article/",
+            data={"keyword": keyword},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [article["id"] for article in response.json()]
+
+    def test_search_title_and_content(self):
+        # title match is ranked higher than content match
+        self.assertEqual(self.search("맥북"), [self.article1.id, self.article2.id])
+        self.assertEqual(self.search("파우치"), [self.article2.id])
+        self.assertEqual(self.search("맥북 프로"), [self.article2.id])
+        self.assertEqual(self.search("아이폰"), [])
+
+        # keyword shorter than a token
+        self.assertEqual(set(self.search("북")), {self.article1.id, self.article2.id})
+
+    def test_search_index_updated(self):
+        article = Article.objects.get(id=self.article2.id)
+        article.title = "아이폰 케이스"
+        article.content = "아이폰 전용 케이스입니다."
+        article.save()
+        self.assertEqual(self.search("맥북"), [self.article1.id])
+        self.assertEqual(self.search("케이스"), [self.article2.id])
+
+        Article.objects.get(id=self.article1.id).delete()
+        self.assertEqual(self.search("맥북"), [])
+        self.assertFalse(ArticleSearchToken.objects.filter(article_id=self.article1.id).exists())
+
+    def test_rebuild_search_index(self):
+        ArticleSearchToken.objects.all().delete()
+        self.assertEqual(self.search("맥북"), [])
+
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("맥북"), [self.article1.id, self.article2.id])
+
+
+class HitCounterTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.user2 = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+        )
+        cls.user2_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01022223333")
+        )
+        cls.article = ArticleFactory(
+            seller=cls.user1,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        get_hit_counter().drain()
+        get_view_filter().clear()
+
+    def tearDown(self):
+        get_hit_counter().drain()
+
+    def test_retrieve_hit_buffered(self):
+        pk = str(self.article.id)
+
+        response = self.client.get(
+            "/api/v1/article/%s/" % pk, HTTP_AUTHORIZATION=self.user2_token
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["hit"], 1)
+        self.assertEqual(Article.objects.get(id=self.article.id).hit, 0)
+        # the feed counts pending hits too
+        articles = prefetch_articles(Article.objects.filter(id=self.article.id), self.user2)
+        data = ArticleListSerializer(articles, many=True, context={"user": self.user2}).data
+        self.assertEqual(data[0]["hit"], 1)
+
+        # hits of the local counter are flushed by the worker, not by flush_hits
+        with self.assertRaises(CommandError):
+            call_command("flush_hits", stdout=StringIO())
+        get_hit_counter().flush()
+        self.assertEqual(Article.objects.get(id=self.article.id).hit, 1)
+        self.assertEqual(get_hit_counter().pending(self.article.id), 0)
+
+        response = self.client.get(
+            "/api/v1/article/%s/" % pk, HTTP_AUTHORIZATION=self.user2_token
+        )
+        self.assertEqual(response.json()["hit"], 1)
+
+    def test_list_pending_hits(self):
+        other = ArticleFactory(
+            seller=self.user1,
+            price=10000,
+            title="식물 판매",
+            content="공기정화식물 판매해요.",
+            category="식물",
+        )
+        counter = get_hit_counter()
+        counter.incr(self.article.id, 2)
+        counter.incr(other.id)
+
+        # one pending_many call for the page instead of pending per article
+        articles = prefetch_articles(Article.objects.order_by("id"), self.user2)
+        with patch.object(counter, "pending", side_effect=AssertionError):
+            data = ArticleListSerializer(articles, many=True, context={"user": self.user2}).data
+        self.assertEqual([article["hit"] for article in data], [2, 1])
+
+    def test_flush_during_hits(self):
+        counter = LocalHitCounter()
+        thread_cnt, hit_cnt = 8, 500
+
+        def hit():
+            for _ in range(hit_cnt):
+                counter.incr(self.article.id)
+
+        threads = [threading.Thread(target=hit) for _ in range(thread_cnt)]
+        for thread in threads:
+            thread.start()
+        # flush while hits are still coming in
+        while any(thread.is_alive() for thread in threads):
+            counter.flush()
+        for thread in threads:
+            thread.join()
+        counter.flush()
+
+        self.assertEqual(Article.objects.get(id=self.article.id).hit, thread_cnt * hit_cnt)
+        self.assertEqual(counter.pending(self.article.id), 0)
+
+
+
+class ConcurrentHitTestCase(TransactionTestCase):
+    def setUp(self):
+        self.seller = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        self.users = [
+            UserFactory(phone_number="0102222%04d" % i, username="user%d" % i)
+            for i in range(8)
+        ]
+        self.tokens = ["JWT " + jwt_token_of(user) for user in self.users]
+        self.article = ArticleFactory(
+            seller=self.seller,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        get_hit_counter().drain()
+        get_view_filter().clear()
+
+    def tearDown(self):
+        get_hit_counter().drain()
+
+    @skipUnlessDBFeature("test_db_allows_multiple_connections")
+    def test_retrieve_hit_concurrent(self):
+        pk = str(self.article.id)
+        request_cnt = 5
+        errors = []
+
+        def retrieve(token):
+            client = Client()
+            try:
+                for _ in range(request_cnt):
+                    response = client.get(
+                        "/api/v1/article/%s/" % pk, HTTP_AUTHORIZATION=token
+                    )
+                    if response.status_code != status.HTTP_200_OK:
+                        errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        # every user views from two clients at once, while hits are flushed
+        threads = [
+            threading.Thread(target=retrieve, args=(token,)) for token in self.tokens * 2
+        ]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            get_hit_counter().flush()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        get_hit_counter().flush()
+        self.assertEqual(Article.objects.get(id=self.article.id).hit, len(self.users))
+        self.assertEqual(get_hit_counter().pending(self.article.id), 0)
+
+class ViewFilterTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.user2 = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+        )
+        cls.user2_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01022223333")
+        )
+        cls.article = ArticleFactory(
+            seller=cls.user1,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        get_hit_counter().drain()
+        get_view_filter().clear()
+
+    def tearDown(self):
+        get_hit_counter().drain()
+
+    def test_hourly_rollover(self):
+        view_filter = HourlyViewFilter(capacity=1000, error_rate=0.001)
+        at = lambda hour, minute: timezone.make_aware(datetime(2022, 1, 28, hour, minute))
+
+        self.assertFalse(view_filter.seen(1, 1, at(10, 5)))
+        self.assertTrue(view_filter.seen(1, 1, at(10, 5)))
+        self.assertTrue(view_filter.seen(1, 1, at(10, 59)))
+        # other article or user
+        self.assertFalse(view_filter.seen(2, 1, at(10, 30)))
+        self.assertFalse(view_filter.seen(1, 2, at(10, 30)))
+
+        # counted again from the next hour
+        self.assertFalse(view_filter.seen(1, 1, at(11, 0)))
+        self.assertTrue(view_filter.seen(1, 1, at(11, 45)))
+        self.assertFalse(view_filter.seen(1, 1, at(12, 0)))
+
+    def test_false_positive_rate(self):
+        view_filter = HourlyViewFilter(capacity=1000, error_rate=0.01)
+        now = timezone.make_aware(datetime(2022, 1, 28, 10, 0))
+        for article_id in range(1000):
+            view_filter.seen(article_id, 1, now)
+        # every check adds a view, so probe a few only
+        false_positive = sum(view_filter.seen(article_id, 2, now) for article_id in range(100))
+        self.assertLessEqual(false_positive, 5)
+
+    def test_retrieve_hit_once_per_hour(self):
+        pk = str(self.article.id)
+        for _ in range(3):
+            response = self.client.get(
+                "/api/v1/article/%s/" % pk, HTTP_AUTHORIZATION=self.user2_token
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.json()["hit"], 1)
+            self.assertNotIn("hit", response.cookies)
+
+
+class ConcurrentLikeTestCase(TransactionTestCase):
+    def setUp(self):
+        self.seller = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        self.users = [
+            UserFactory(phone_number="0102222%04d" % i, username="user%d" % i)
+            for i in range(4)
+        ]
+        self.tokens = ["JWT " + jwt_token_of(user) for user in self.users]
+        self.article = ArticleFactory(
+            seller=self.seller,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+
+    @skipUnlessDBFeature("test_db_allows_multiple_connections")
+    def test_put_like_concurrent(self):
+        pk = str(self.article.id)
+        toggle_cnt = 5
+        errors = []
+
+        def toggle(token):
+            client = Client()
+            try:
+                for _ in range(toggle_cnt):
+                    response = client.put(
+                        "/api/v1/article/%s/like/?simple=true" % pk,
+                        HTTP_AUTHORIZATION=token,
+                    )
+                    if response.status_code != status.HTTP_200_OK:
+                        errors.append(response.status_code)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        # every user toggles from two clients at once
+        threads = [
+            threading.Thread(target=toggle, args=(token,)) for token in self.tokens * 2
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        article = Article.objects.get(id=self.article.id)
+        self.assertEqual(article.like, article.liked_users.count())
+
+    def test_put_like_simple(self):
+        pk = str(self.article.id)
+        response = self.client.put(
+            "/api/v1/article/%s/like/?simple=true" % pk,
+            HTTP_AUTHORIZATION=self.tokens[0],
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {"liked": True, "like": 1})
+
+        response = self.client.put(
+            "/api/v1/article/%s/like/?simple=true" % pk,
+            HTTP_AUTHORIZATION=self.tokens[0],
+        )
+        self.assertEqual(response.json(), {"liked": False, "like": 0})
+
+    def test_reconcile_likes(self):
+        self.article.liked_users.add(*self.users[:3])
+        Article.objects.filter(id=self.article.id).update(like=10)
+
+        call_command("reconcile_likes", stdout=StringIO())
+        self.assertEqual(Article.objects.get(id=self.article.id).like, 3)
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    PRODUCT_IMAGE_WORKERS=0,
+)
+class ProductImageTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.user1_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01011112222")
+        )
+        cls.article = ArticleFactory(
+            seller=cls.user1,
+            price=10000,
+            title="식물 판매",
+            content="공기정화식물 판매해요.",
+            category="식물",
+        )
+
+    def image_file(self, name, color="green", size=(600, 480)):
+        content = BytesIO()
+        Image.new("RGB", size, color).save(content, format="PNG")
+        return SimpleUploadedFile(name, content.getvalue(), content_type="image/png")
+
+    def test_ingest_product_images(self):
+        images = [
+            self.image_file("plant_%d.png" % i, color)
+            for i, color in enumerate(("red", "green", "blue"))
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(2):
+                ingest_product_images(self.article, images)
+
+        # rows are written before thumbnails exist
+        product_images = ProductImage.objects.filter(article=self.article)
+        self.assertEqual(product_images.count(), 3)
+        self.assertEqual(
+            set(product_images.values_list("thumbnail_status", flat=True)), {"pending"}
+        )
+        data = ProductImageSerializer(product_images, many=True).data
+        self.assertEqual(data[0]["thumbnail_url"], None)
+        self.assertEqual(data[0]["thumbnail_status"], "pending")
+        self.assertEqual(data[0]["variants"], None)
+
+        for callback in callbacks:
+            callback()
+        for product_image in ProductImage.objects.filter(article=self.article):
+            self.assertEqual(product_image.thumbnail_status, "ready")
+            self.assertEqual(product_image.product_thumbnail.height, 120)
+            self.assertEqual(product_image.product_image.width, 600)
+
+        product_image = ProductImage.objects.filter(article=self.article).first()
+        # originals keep their extension so storages serve them as images
+        self.assertEqual(
+            product_image.product_image.name, "product_image/%s.png" % product_image.content_hash
+        )
+        self.assertEqual(mimetypes.guess_type(product_image.product_image.name)[0], "image/png")
+        data = ProductImageSerializer(product_image).data
+        self.assertEqual(set(data["variants"]), {"120", "360", "720"})
+        self.assertTrue(data["variants"]["360"]["webp"].endswith("_360.webp"))
+        name = "product_image/variants/%s_720.jpeg" % product_image.content_hash
+        with product_image.product_image.storage.open(name) as f:
+            # not upscaled beyond the original
+            self.assertEqual(Image.open(f).size, (600, 480))
+
+    def test_ingest_same_content(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_product_images(self.article, [self.image_file("plant.png", "olive")])
+        product_image = ProductImage.objects.get(article=self.article)
+
+        # the edited article uploads the same bytes again
+        with self.captureOnCommitCallbacks() as callbacks:
+            ingest_product_images(
+                self.article, [self.image_file("plant_copy.png", "olive")]
+            )
+        self.assertEqual(callbacks, [])
+
+        copy = ProductImage.objects.exclude(id=product_image.id).get(article=self.article)
+        self.assertEqual(copy.thumbnail_status, "ready")
+        self.assertEqual(copy.product_image.name, product_image.product_image.name)
+        self.assertEqual(copy.product_thumbnail.name, product_image.product_thumbnail.name)
+
+    def test_ingest_small_image(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_product_images(
+                self.article, [self.image_file("plant.png", "teal", size=(100, 80))]
+            )
+        product_image = ProductImage.objects.get(article=self.article)
+
+        # the thumbnail is scaled up to its height as before, other variants are not
+        self.assertEqual(product_image.product_thumbnail.height, 120)
+        self.assertEqual(product_image.product_thumbnail.width, 150)
+        storage = product_image.product_image.storage
+        for size in (360, 720):
+            name = "product_image/variants/%s_%d.webp" % (product_image.content_hash, size)
+            with storage.open(name) as f:
+                self.assertEqual(Image.open(f).size, (100, 80))
+
+    def test_save_content_concurrently(self):
+        storage = ProductImage._meta.get_field("product_image").storage
+        name = "product_image/%s.png" % ("0" * 64)
+        # a concurrent upload stored the same bytes after the exists check
+        storage.save(name, self.image_file("plant.png", "navy"))
+        self.assertEqual(save_content(storage, name, self.image_file("plant_copy.png", "navy")), name)
+
+        directories, files = storage.listdir("product_image")
+        self.assertEqual([f for f in files if f.startswith("0" * 64)], ["%s.png" % ("0" * 64)])
+
+    def test_generate_thumbnails_failed(self):
+        with self.assertLogs("article.images", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                ingest_product_images(
+                    self.article, [SimpleUploadedFile("broken.png", b"not an image")]
+                )
+        product_image = ProductImage.objects.get(article=self.article)
+        self.assertEqual(product_image.thumbnail_status, "failed")
+        # the extension of the upload when the content is not recognized
+        self.assertTrue(product_image.product_image.name.endswith(".png"))
+
+        with self.assertLogs("article.images", "ERROR"):
+            call_command("generate_thumbnails", "--failed", stdout=StringIO())
+        product_image.refresh_from_db()
+        self.assertEqual(product_image.thumbnail_status, "failed")
+
+
+class CommentTreeTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.users = [
+            UserFactory(phone_number="0101111%04d" % i, username="user%d" % i)
+            for i in range(5)
+        ]
+        cls.user1_token = "JWT " + jwt_token_of(cls.users[0])
+        cls.article = ArticleFactory(
+            seller=cls.users[0],
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+
+    def create_comments(self, root_num):
+        # each comment has two replies, each reply one more nested reply
+        for i in range(root_num):
+            comment = CommentFactory(
+                commenter=self.users[i % 5], article=self.article, content="댓글 %d" % i
+            )
+            for j in range(2):
+                reply = CommentFactory(
+                    commenter=self.users[j],
+                    article=self.article,
+                    parent=comment,
+                    content="답글",
+                )
+                CommentFactory(
+                    commenter=self.users[i % 5],
+                    article=self.article,
+                    parent=reply,
+                    content="답글",
+                )
+
+    def test_get_comments_query_count(self):
+        self.create_comments(100)
+        self.assertEqual(Comment.objects.count(), 500)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(
+                "/api/v1/article/%s/comment/" % self.article.id,
+                HTTP_AUTHORIZATION=self.user1_token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        res_data = response.json()
+        # replies are nested only, not repeated at the top level
+        self.assertEqual(len(res_data), 100)
+        self.assertEqual(res_data[0]["content"], "댓글 0")
+        self.assertEqual(len(res_data[0]["replies"]), 2)
+        self.assertEqual(len(res_data[0]["replies"][0]["replies"]), 1)
+        self.assertEqual(res_data[0]["replies"][0]["replies"][0]["replies"], [])
+        self.assertEqual(res_data[0]["commenter"]["article_cnt"], 1)
+        self.assertEqual(res_data[1]["commenter"]["article_cnt"], 0)
+        self.assertTrue(res_data[0]["delete_enable"])
+
+    def test_get_comments_cursor(self):
+        self.create_comments(45)
+
+        comments, cursor = [], ""
+        while cursor is not None:
+            # page of comments, then one query per reply level
+            with self.assertNumQueries(7):
+                response = self.client.get(
+                    "/api/v1/article/%s/comment/" % self.article.id,
+                    data={"cursor": cursor},
+                    HTTP_AUTHORIZATION=self.user1_token,
+                )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            res_data = response.json()
+            self.assertLessEqual(len(res_data["comments"]), 20)
+            comments.extend(res_data["comments"])
+            cursor = res_data["next_cursor"]
+
+        self.assertEqual(
+            [comment["content"] for comment in comments], ["댓글 %d" % i for i in range(45)]
+        )
+        self.assertEqual(len(comments[-1]["replies"]), 2)
+        self.assertEqual(len(comments[-1]["replies"][1]["replies"]), 1)
+
+        response = self.client.get(
+            "/api/v1/article/%s/comment/" % self.article.id,
+            data={"cursor": "invalid"},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_comments_since(self):
+        self.create_comments(2)
+        last_id = Comment.objects.latest("id").id
+        comment = Comment.objects.filter(parent=None).first()
+        CommentFactory(
+            commenter=self.users[1], article=self.article, parent=comment, content="새 답글"
+        )
+        CommentFactory(commenter=self.users[2], article=self.article, content="새 댓글")
+
+        response = self.client.get(
+            "/api/v1/article/%s/comment/" % self.article.id,
+            data={"since": last_id},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        res_data = response.json()
+        self.assertEqual([data["content"] for data in res_data], ["새 답글", "새 댓글"])
+        self.assertEqual(res_data[0]["parent"], comment.id)
+        self.assertIsNone(res_data[1]["parent"])
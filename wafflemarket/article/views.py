@@ -1,25 +1,55 @@
-from datetime import datetime, timedelta
-
 from rest_framework import status, viewsets, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from django.core.files.base import ContentFile
 from django.core.paginator import Paginator
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
 from user.models import User
-from article.models import Article, ProductImage, Comment
+from wafflemarket.fields import codes_of
+from article.models import Article, Comment
+from article.counters import get_hit_counter, get_view_filter
+from article.images import ingest_product_images
+from article.search import get_search_backend
+from article.services import (
+    comment_tree,
+    comments_since,
+    paginate_comments,
+    paginate_articles,
+    prefetch_articles,
+    toggle_like,
+)
+from location.services import get_neighborhood_ids
 from article.serializers import (
     ArticleCreateSerializer,
+    ArticleCursorValidator,
+    ArticleListSerializer,
     ArticlePaginationValidator,
     ArticleSerializer,
     CommentCreateSerializer,
+    CommentCursorValidator,
+    CommentDeltaSerializer,
     CommentSerializer,
+    CommentSinceValidator,
 )
-from review.models import Review
+from review.services import delete_article_reviews
+
+
+# the written comment, or the whole thread with ?thread=true
+def comment_response(request, article, comment, status_code):
+    if request.query_params.get("thread") == "true":
+        comments = comment_tree(article)
+        return Response(
+            CommentSerializer(comments, many=True, context={"user": request.user}).data,
+            status=status_code,
+        )
+    return Response(
+        CommentSerializer(comment, context={"user": request.user}).data,
+        status=status_code,
+    )
 
 
 class ArticleViewSet(viewsets.GenericViewSet):
@@ -39,14 +69,10 @@ class ArticleViewSet(viewsets.GenericViewSet):
                 )
                 
         article = serializer.create_article(serializer.validated_data, request.user)
-        for i in range(1, image_count + 1):
-            field_name = "image_" + str(i)
-            image = request.FILES.get(field_name)
-            thumbnail = ContentFile(image.read())
-            thumbnail.name = image.name
-            ProductImage.objects.create(
-                article=article, product_image=image, product_thumbnail=thumbnail
-            )
+        ingest_product_images(
+            article,
+            [request.FILES.get("image_" + str(i)) for i in range(1, image_count + 1)],
+        )
         return Response(
             ArticleSerializer(
                 article, 
@@ -76,14 +102,10 @@ class ArticleViewSet(viewsets.GenericViewSet):
                 )
                 
         article = serializer.create_article(serializer.validated_data, request.user)
-        for i in range(1, image_count + 1):
-            field_name = "image_" + str(i)
-            image = request.FILES.get(field_name)
-            thumbnail = ContentFile(image.read())
-            thumbnail.name = image.name
-            ProductImage.objects.create(
-                article=article, product_image=image, product_thumbnail=thumbnail
-            )
+        ingest_product_images(
+            article,
+            [request.FILES.get("image_" + str(i)) for i in range(1, image_count + 1)],
+        )
         article = serializer.update_article(serializer.validated_data, article)
         
         return Response(
@@ -95,11 +117,10 @@ class ArticleViewSet(viewsets.GenericViewSet):
 
     @action(detail=True, methods=["PUT", "DELETE"])
     def purchase(self, request, pk):
-        if Article.objects.filter(id=pk).exists():
-            article = Article.objects.get(id=pk)
-        else:
+        article = Article.objects.filter(id=pk).first()
+        if article is None:
             return Response({"해당하는 게시글을 찾을 수 없습니다."}, status=status.HTTP_404_NOT_FOUND)
-        if article.seller != request.user:
+        if article.seller_id != request.user.id:
             return Response(
                 {"작성자 외에는 게시글의 상태를 변경할 수 없습니다."},
                 status=status.HTTP_405_METHOD_NOT_ALLOWED,
@@ -112,16 +133,11 @@ class ArticleViewSet(viewsets.GenericViewSet):
         elif self.request.method == "DELETE":
             
             # delete reviews when canceling purchase
-            if Review.objects.filter(review_type="seller", article=article).exists():
-                seller_review = Review.objects.get(review_type="seller", article=article)
-                seller_review.delete()
-            if Review.objects.filter(review_type="buyer", article=article).exists():
-                buyer_review = Review.objects.get(review_type="buyer", article=article)
-                buyer_review.delete()
-                
-            article.sold_at = None
-            article.buyer = None
-            article.save()
+            with transaction.atomic():
+                delete_article_reviews(article)
+                article.sold_at = None
+                article.buyer = None
+                article.save()
             
         return Response(
             ArticleSerializer(
@@ -132,11 +148,10 @@ class ArticleViewSet(viewsets.GenericViewSet):
 
     @action(detail=True, methods=["PUT", "DELETE"])
     def buyer(self, request, pk=None):
-        if Article.objects.filter(id=pk).exists():
-            article = Article.objects.get(id=pk)
-        else:
+        article = Article.objects.filter(id=pk).first()
+        if article is None:
             return Response({"해당하는 게시글을 찾을 수 없습니다."}, status=status.HTTP_404_NOT_FOUND)
-        if article.seller != request.user:
+        if article.seller_id != request.user.id:
             return Response(
                 {"작성자 외에는 게시글의 상태를 변경할 수 없습니다."}, status=status.HTTP_403_FORBIDDEN
             )
@@ -144,40 +159,30 @@ class ArticleViewSet(viewsets.GenericViewSet):
         if self.request.method == "PUT":
             buyer_id = request.data.get("buyer_id")
             
-            if not User.objects.filter(id=buyer_id).exists():
+            buyer = User.objects.filter(id=buyer_id).first()
+            if buyer is None:
                 return Response(
                     {"해당하는 구매자를 찾을 수 없습니다."}, status=status.HTTP_404_NOT_FOUND
                 )
-                
-            buyer = User.objects.get(id=buyer_id)
-            
-            # delete reviews when changing buyer
-            if article.buyer is not None and article.buyer != buyer:
-                if Review.objects.filter(review_type="seller", article=article).exists():
-                    seller_review = Review.objects.get(review_type="seller", article=article)
-                    seller_review.delete()
-                if Review.objects.filter(review_type="buyer", article=article).exists():
-                    buyer_review = Review.objects.get(review_type="buyer", article=article)
-                    buyer_review.delete()
             
-            article.buyer = buyer
-            article.sold_at = timezone.now()
-            article.save()
+            with transaction.atomic():
+                # delete reviews when changing buyer
+                if article.buyer_id is not None and article.buyer_id != buyer.id:
+                    delete_article_reviews(article)
+                
+                article.buyer = buyer
+                article.sold_at = timezone.now()
+                article.save()
             
             
         elif self.request.method == "DELETE":
             
             # delete reviews when deleting buyer
-            if Review.objects.filter(review_type="seller", article=article).exists():
-                seller_review = Review.objects.get(review_type="seller", article=article)
-                seller_review.delete()
-            if Review.objects.filter(review_type="buyer", article=article).exists():
-                buyer_review = Review.objects.get(review_type="buyer", article=article)
-                buyer_review.delete()
-                
-            article.buyer = None
-            article.sold_at = None
-            article.save()
+            with transaction.atomic():
+                delete_article_reviews(article)
+                article.buyer = None
+                article.sold_at = None
+                article.save()
             
         return Response(
             ArticleSerializer(
@@ -226,17 +231,14 @@ class ArticleViewSet(viewsets.GenericViewSet):
         user_category_list = []
 
         # filter article of neighborhood
-        neighborhood = [user.location.id]
-        for location_neighborhood in user.location.neighborhoods.all():
-            neighborhood.append(location_neighborhood.neighborhood.id)
+        neighborhood = get_neighborhood_ids(user.location_id)
         articles = self.queryset.filter(Q(location__id__in=neighborhood)&Q(seller__is_active=True))
 
         if not keyword:
             # check categories to filter article
             if not category:
-                for i, enable in enumerate(list(user.interest)):
-                    if enable == "1":
-                        user_category_list.append(category_list[i])
+                for i in codes_of(user.interest, len(category_list)):
+                    user_category_list.append(category_list[i])
             else:
                 if category in category_list:
                     user_category_list.append(category)
@@ -247,16 +249,36 @@ class ArticleViewSet(viewsets.GenericViewSet):
             # filter article by category
             articles = articles.filter(category__in=user_category_list)
         else:
-            # filter article by keyword
-            articles = articles.filter(title__contains=keyword)
+            # filter article by keyword in title and content
+            articles = get_search_backend().search(articles, keyword)
 
-        articles = articles.order_by("-created_at")
+        articles = prefetch_articles(articles, user)
+
+        # cursor mode, next page is requested with the returned next_cursor
+        if "cursor" in request.GET:
+            serializer = ArticleCursorValidator(data=request.GET)
+            serializer.is_valid(raise_exception=True)
+            articles, next_cursor = paginate_articles(articles, **serializer.validated_data)
+            return Response(
+                {
+                    "articles": ArticleListSerializer(
+                        articles, many=True, context={"user": request.user},
+                    ).data,
+                    "next_cursor": next_cursor,
+                },
+                status=status.HTTP_200_OK,
+            )
+
+        if keyword:
+            articles = articles.order_by("-search_rank", "-created_at")
+        else:
+            articles = articles.order_by("-created_at")
         pages = Paginator(articles, 15)
 
         # check if page_id is valid
         if not page_id:
             return Response(
-                ArticleSerializer(
+                ArticleListSerializer(
                     articles, many=True, context={"user" : request.user},
                 ).data, 
                 status=status.HTTP_200_OK,
@@ -271,7 +293,7 @@ class ArticleViewSet(viewsets.GenericViewSet):
 
         page_id = serializer.data.get("page_id")
         return Response(
-            ArticleSerializer(
+            ArticleListSerializer(
                 pages.page(page_id), many=True, context={"user": request.user},
             ).data,
             status=status.HTTP_200_OK,
@@ -285,23 +307,10 @@ class ArticleViewSet(viewsets.GenericViewSet):
         if article.seller == request.user:
             return Response(ArticleSerializer(article, context={"user": request.user}).data, status=status.HTTP_200_OK)
         
-        article_id = pk
-        user_id = request.user.id
-        cookie_value = request.COOKIES.get("hit", "_")
-        expire_date, now = datetime.now() + timedelta(hours=1), datetime.now()
-        expire_date = expire_date.replace(minute=0, second=0, microsecond=0)
-        expire_date -= now
-        max_age = expire_date.total_seconds()
-        
-        if "_{%s}&{%s}_"%(article_id, user_id) not in cookie_value :
-            article.hit += 1
-            article.save()
-            cookie_value += "{%s}&{%s}_"%(article_id, user_id)
-            response = Response(ArticleSerializer(article, context={"user": request.user}).data, status=status.HTTP_200_OK)
-            response.set_cookie("hit", value=cookie_value, max_age=max_age, httponly=True)
-            return response
-        else:
-            return Response(ArticleSerializer(article, context={"user": request.user}).data, status=status.HTTP_200_OK)
+        # count a view once per user and article in an hour
+        if not get_view_filter().seen(article.id, request.user.id):
+            get_hit_counter().incr(article.id)
+        return Response(ArticleSerializer(article, context={"user": request.user}).data, status=status.HTTP_200_OK)
     
     @action(detail=True, methods=["PUT"])
     def like(self, request, pk):
@@ -312,14 +321,13 @@ class ArticleViewSet(viewsets.GenericViewSet):
         user = request.user
         
         if self.request.method == "PUT":
-            if article.liked_users.filter(pk=user.id).exists():
-                article.liked_users.remove(user)
-                article.like -= 1
-                article.save()
-            else:
-                article.liked_users.add(user)
-                article.like += 1
-                article.save()
+            liked, like = toggle_like(article, user)
+            
+            # lightweight response with ?simple=true
+            if request.query_params.get("simple") == "true":
+                return Response({"liked": liked, "like": like}, status=status.HTTP_200_OK)
+            
+            article.like = like
             return Response(
                 ArticleSerializer(
                     article, context={"user": request.user}
@@ -337,17 +345,40 @@ class ArticleViewSet(viewsets.GenericViewSet):
         if self.request.method == "POST":
             serializer = CommentCreateSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.create(serializer.validated_data, request.user, article)
-            comments = Comment.objects.filter(article=article)
-            return Response(
-                CommentSerializer(
-                    comments, many=True, context={"user": request.user}
-                ).data,
-                status=status.HTTP_201_CREATED,
-            )
+            comment = serializer.create(serializer.validated_data, request.user, article)
+            return comment_response(request, article, comment, status.HTTP_201_CREATED)
 
         elif self.request.method == "GET":
-            comments = Comment.objects.filter(article=article)
+            # cursor mode, pages of top-level comments with their replies
+            if "cursor" in request.GET:
+                serializer = CommentCursorValidator(data=request.GET)
+                serializer.is_valid(raise_exception=True)
+                comments, next_cursor = paginate_comments(
+                    article, **serializer.validated_data
+                )
+                return Response(
+                    {
+                        "comments": CommentSerializer(
+                            comments, many=True, context={"user": request.user}
+                        ).data,
+                        "next_cursor": next_cursor,
+                    },
+                    status=status.HTTP_200_OK,
+                )
+
+            # delta mode, comments written after the since comment id
+            if "since" in request.GET:
+                serializer = CommentSinceValidator(data=request.GET)
+                serializer.is_valid(raise_exception=True)
+                comments = comments_since(article, serializer.validated_data["since"])
+                return Response(
+                    CommentDeltaSerializer(
+                        comments, many=True, context={"user": request.user}
+                    ).data,
+                    status=status.HTTP_200_OK,
+                )
+
+            comments = comment_tree(article)
             return Response(
                 CommentSerializer(
                     comments, many=True, context={"user": request.user}
@@ -375,11 +406,7 @@ class CommentView(APIView):
 
         comment.deleted_at = timezone.now()
         comment.save()
-        comments = Comment.objects.filter(article=article)
-        return Response(
-            CommentSerializer(comments, many=True, context={"user": request.user}).data,
-            status=status.HTTP_200_OK,
-        )
+        return comment_response(request, article, comment, status.HTTP_200_OK)
 
     def post(self, request, a_id, c_id):
         if Article.objects.filter(id=a_id).exists():
@@ -393,9 +420,5 @@ class CommentView(APIView):
 
         serializer = CommentCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.create(serializer.validated_data, request.user, article, comment)
-        comments = Comment.objects.filter(article=article)
-        return Response(
-            CommentSerializer(comments, many=True, context={"user": request.user}).data,
-            status=status.HTTP_201_CREATED,
-        )
+        reply = serializer.create(serializer.validated_data, request.user, article, comment)
+        return comment_response(request, article, reply, status.HTTP_201_CREATED)
@@ -0,0 +1,136 @@
+import gzip
+import json
+from bisect import bisect_left
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+from chat.models import Chat, ChatArchive, ChatRoom
+
+
+ARCHIVE_FIELDS = ("id", "sender_id", "content", "created_at")
+
+
+def archive_storage():
+    return ChatArchive._meta.get_field("archive").storage
+
+
+def archive_name(chatroom_id, first_chat_id, last_chat_id):
+    return "chat_archive/%d/%d_%d.json.gz" % (chatroom_id, first_chat_id, last_chat_id)
+
+
+def encode_archive(chats):
+    return gzip.compress(
+        json.dumps(chats, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(",", ":"))
+        .encode()
+    )
+
+
+# (chat ids, chats) of the archive in id order. archives never change,
+# so decoded ones are kept for the next pages
+@lru_cache(maxsize=64)
+def read_archive(name):
+    with archive_storage().open(name, "rb") as archive:
+        chats = json.loads(gzip.decompress(archive.read()))
+    return [chat["id"] for chat in chats], chats
+
+
+# move chats older than age_days, and every chat of rooms whose article was
+# deleted, into archives of at most batch_size chats per room.
+# returns the number of archived chats
+def archive_chats(age_days=None, dead_rooms=True, batch_size=None):
+    options = getattr(settings, "CHAT_ARCHIVE", {})
+    if age_days is None:
+        age_days = options.get("AGE_DAYS", 180)
+    if batch_size is None:
+        batch_size = options.get("BATCH_SIZE", 5000)
+
+    # ids follow the write order, so the newest old chat bounds the old ones and
+    # is found by walking back over the recent chats only
+    cutoff = timezone.now() - timedelta(days=age_days)
+    boundary = (
+        Chat.objects.filter(created_at__lt=cutoff)
+        .order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+    )
+    rooms = {}
+    if boundary is not None:
+        for chatroom_id in (
+            Chat.objects.filter(id__lte=boundary)
+            .values_list("chatroom_id", flat=True)
+            .distinct()
+        ):
+            rooms[chatroom_id] = boundary
+    if dead_rooms:
+        dead = ChatRoom.objects.filter(
+            Exists(Chat.objects.filter(chatroom=OuterRef("pk"))), article__isnull=True
+        ).annotate(last_chat_id=Max("chats__id"))
+        for chatroom_id, last_chat_id in dead.values_list("id", "last_chat_id"):
+            rooms[chatroom_id] = last_chat_id
+
+    archived = 0
+    for chatroom_id in sorted(rooms):
+        archived += archive_room(chatroom_id, rooms[chatroom_id], batch_size)
+    return archived
+
+
+def archive_room(chatroom_id, last_chat_id, batch_size):
+    storage = archive_storage()
+    archived = 0
+    while True:
+        chats = list(
+            Chat.objects.filter(chatroom_id=chatroom_id, id__lte=last_chat_id)
+            .order_by("id")
+            .values(*ARCHIVE_FIELDS)[:batch_size]
+        )
+        if not chats:
+            return archived
+        first_id, last_id = chats[0]["id"], chats[-1]["id"]
+        name = storage.save(
+            archive_name(chatroom_id, first_id, last_id),
+            ContentFile(encode_archive(chats)),
+        )
+        try:
+            with transaction.atomic():
+                ChatArchive.objects.create(
+                    chatroom_id=chatroom_id,
+                    first_chat_id=first_id,
+                    last_chat_id=last_id,
+                    chat_count=len(chats),
+                    archive=name,
+                )
+                Chat.objects.filter(
+                    chatroom_id=chatroom_id, id__gte=first_id, id__lte=last_id
+                ).delete()
+        except Exception:
+            storage.delete(name)
+            raise
+        archived += len(chats)
+
+
+# archived chats of the room before the id, newest first, at most size
+def archived_chats_before(chatroom_id, before, size):
+    chats = []
+    archives = ChatArchive.objects.filter(chatroom_id=chatroom_id)
+    if before is not None:
+        archives = archives.filter(first_chat_id__lt=before)
+    archives = archives.order_by("-last_chat_id").values_list("archive", flat=True)
+    for name in archives.iterator():
+        ids, archived = read_archive(name)
+        end = len(ids) if before is None else bisect_left(ids, before)
+        chats.extend(reversed(archived[max(end - size + len(chats), 0) : end]))
+        if len(chats) == size:
+            return chats
+    return chats
+
+
+def last_archived_chat(chatroom_id):
+    chats = archived_chats_before(chatroom_id, None, 1)
+    return chats[0] if chats else None
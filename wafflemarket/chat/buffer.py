@@ -0,0 +1,335 @@
+import json
+import atexit
+import logging
+import threading
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import BigIntegerField, F, Max, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils.module_loading import import_string
+
+from chat.models import Chat, ChatIdSequence
+from chat.services import update_summaries
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_MAX_LENGTH = Chat._meta.get_field("content").max_length
+
+
+# (messages whose rows are not written yet, messages whose id holds another chat).
+# a row of the same message is a retried batch, a row of another message means
+# two messages got one id
+def unwritten(messages):
+    rows = {
+        chat["id"]: chat
+        for chat in Chat.objects.filter(id__in=[message["id"] for message in messages]).values(
+            "id", "chatroom_id", "sender_id", "content"
+        )
+    }
+    new_messages, colliding = [], []
+    for message in messages:
+        row = rows.get(message["id"])
+        if row is None:
+            new_messages.append(message)
+        elif (
+            row["chatroom_id"] != message["chatroom_id"]
+            or row["content"] != message["content"]
+            # the sender may have left since
+            or row["sender_id"] not in (message["sender_id"], None)
+        ):
+            colliding.append(message)
+    return new_messages, colliding
+
+
+def chat_of(message):
+    return Chat(
+        id=message["id"],
+        chatroom_id=message["chatroom_id"],
+        sender_id=message["sender_id"],
+        content=message["content"],
+    )
+
+
+# write the messages, row by row if a concurrent write took one of the ids.
+# returns the written messages
+def write_chats(messages):
+    try:
+        with transaction.atomic():
+            Chat.objects.bulk_create([chat_of(message) for message in messages])
+        return messages
+    except IntegrityError:
+        written = []
+        for message in messages:
+            try:
+                with transaction.atomic():
+                    chat_of(message).save(force_insert=True)
+            except IntegrityError:
+                continue
+            written.append(message)
+        return written
+
+
+# messages that can not be written under their id are dropped from the buffer,
+# so they do not block every later batch, and logged to be recovered by hand
+def dead_letter(messages):
+    for message in messages:
+        logger.error(
+            "chat %d collides with a written chat, dropped: %s",
+            message["id"],
+            json.dumps(message, ensure_ascii=False),
+        )
+
+
+# reserve size ids of ChatIdSequence, shared by every worker, and return the
+# last of them. it never falls behind the largest chat id, so rows written
+# outside of a buffer are not reused
+def reserve_chat_ids(size):
+    last_chat_id = Coalesce(Subquery(Chat.objects.order_by("-id").values("id")[:1]), 0)
+    last_id = Greatest(F("last_id"), last_chat_id, output_field=BigIntegerField()) + size
+    sequence = ChatIdSequence.objects.filter(id=1)
+    with transaction.atomic():
+        if not sequence.update(last_id=last_id):
+            ChatIdSequence.objects.get_or_create(id=1)
+            sequence.update(last_id=last_id)
+        return sequence.values_list("last_id", flat=True).get()
+
+
+# write-behind buffer of chat messages. ids are assigned when a message is added so
+# it can be broadcast at once, rows are written with bulk_create every flush_size
+# messages or flush_interval seconds by a background thread.
+# messages stay in the buffer until their rows are committed
+class ChatBuffer(ABC):
+    def __init__(self, flush_size=100, flush_interval=0.05, **kwargs):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.condition = threading.Condition()
+        self.flusher = None
+
+    @abstractmethod
+    def next_id(self):
+        pass
+
+    @abstractmethod
+    def push(self, message):
+        pass
+
+    # every buffered message, in no particular order
+    @abstractmethod
+    def messages(self):
+        pass
+
+    # first n buffered messages and the removal of them once they are written
+    @abstractmethod
+    def peek(self, n):
+        pass
+
+    @abstractmethod
+    def trim(self, n):
+        pass
+
+    # only one flush at a time may peek and trim
+    @abstractmethod
+    def flush_lock(self):
+        pass
+
+    def add(self, chatroom_id, sender_id, content):
+        message = {
+            "id": self.next_id(),
+            "chatroom_id": chatroom_id,
+            "sender_id": sender_id,
+            # a row that can not be written would block every later batch
+            "content": content[:CONTENT_MAX_LENGTH],
+        }
+        size = self.push(message)
+        if self.flush_interval:
+            self.start_flusher()
+            if size >= self.flush_size:
+                with self.condition:
+                    self.condition.notify()
+        return message
+
+    # messages of the chatroom after after_id not written yet
+    def pending(self, chatroom_id, after_id=0):
+        return sorted(
+            (
+                message
+                for message in self.messages()
+                if message["chatroom_id"] == chatroom_id and message["id"] > after_id
+            ),
+            key=lambda message: message["id"],
+        )
+
+    def flush(self):
+        flushed = 0
+        with self.flush_lock() as locked:
+            if not locked:
+                # another worker is flushing
+                return 0
+            while True:
+                messages = self.peek(self.flush_size)
+                if not messages:
+                    return flushed
+                with transaction.atomic():
+                    # a retried batch may be written already, its rows are not counted again
+                    new_messages, colliding = unwritten(messages)
+                    written = write_chats(new_messages)
+                    update_summaries(written)
+                self.trim(len(messages))
+                written_ids = {message["id"] for message in written}
+                dead_letter(
+                    colliding
+                    + [message for message in new_messages if message["id"] not in written_ids]
+                )
+                flushed += len(written)
+
+    def start_flusher(self):
+        if self.flusher is not None:
+            return
+        with self.condition:
+            if self.flusher is None:
+                self.flusher = threading.Thread(
+                    target=self.run_flusher, name="chat_buffer", daemon=True
+                )
+                self.flusher.start()
+
+    def run_flusher(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # messages stay buffered and are retried
+                logger.exception("flushing chat messages failed")
+                connection.close()
+
+
+class LocalLock:
+    def __init__(self, lock):
+        self.lock = lock
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquired = self.lock.acquire(blocking=False)
+        return self.acquired
+
+    def __exit__(self, *args):
+        if self.acquired:
+            self.lock.release()
+
+
+# in-process buffer, each worker writes its own messages and sees only its own
+# unwritten ones. ids are handed out from blocks of id_block_size ids reserved
+# in ChatIdSequence, so a message waits on the database once per block.
+# unwritten messages are written by the atexit hook on a graceful shutdown only,
+# a killed worker loses them
+class LocalChatBuffer(ChatBuffer):
+    def __init__(self, id_block_size=1000, **kwargs):
+        super().__init__(**kwargs)
+        self.id_block_size = id_block_size
+        self.lock = threading.Lock()
+        self.id_lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.buffer = []
+        self.ids = iter(())
+
+    def next_id(self):
+        with self.id_lock:
+            next_id = next(self.ids, None)
+            if next_id is None:
+                last_id = reserve_chat_ids(self.id_block_size)
+                self.ids = iter(range(last_id - self.id_block_size + 1, last_id + 1))
+                next_id = next(self.ids)
+            return next_id
+
+    def push(self, message):
+        with self.lock:
+            self.buffer.append(message)
+            return len(self.buffer)
+
+    def messages(self):
+        with self.lock:
+            return list(self.buffer)
+
+    def peek(self, n):
+        with self.lock:
+            return self.buffer[:n]
+
+    def trim(self, n):
+        with self.lock:
+            del self.buffer[:n]
+
+    def flush_lock(self):
+        return LocalLock(self.flushing)
+
+
+class RedisLock:
+    def __init__(self, lock):
+        self.lock = lock
+
+    def __enter__(self):
+        return self.lock.acquire(blocking=False)
+
+    def __exit__(self, *args):
+        if self.lock.owned():
+            self.lock.release()
+
+
+# buffer shared by workers in a redis list, ids from INCR.
+# buffered messages survive a worker crash and are written by any worker
+# or the flush_chats command
+class RedisChatBuffer(ChatBuffer):
+    KEY = "chat:buffer"
+    ID_KEY = "chat:id"
+    LOCK_KEY = "chat:buffer:lock"
+
+    def __init__(self, location="redis://127.0.0.1:6379/0", **kwargs):
+        import redis
+
+        super().__init__(**kwargs)
+        self.client = redis.Redis.from_url(location)
+        last_id = Chat.objects.aggregate(last_id=Max("id"))["last_id"] or 0
+        self.client.set(self.ID_KEY, last_id, nx=True)
+
+    def next_id(self):
+        return self.client.incr(self.ID_KEY)
+
+    def push(self, message):
+        return self.client.rpush(self.KEY, json.dumps(message))
+
+    def messages(self):
+        return [json.loads(message) for message in self.client.lrange(self.KEY, 0, -1)]
+
+    def peek(self, n):
+        return [json.loads(message) for message in self.client.lrange(self.KEY, 0, n - 1)]
+
+    def trim(self, n):
+        self.client.ltrim(self.KEY, n, -1)
+
+    def flush_lock(self):
+        return RedisLock(self.client.lock(self.LOCK_KEY, timeout=60))
+
+
+_buffer = {}
+
+
+# builds the buffer on first use, call it outside of the event loop
+def get_chat_buffer():
+    if "buffer" not in _buffer:
+        options = {
+            key.lower(): value for key, value in getattr(settings, "CHAT_BUFFER", {}).items()
+        }
+        backend = options.pop("backend", "chat.buffer.LocalChatBuffer")
+        _buffer["buffer"] = import_string(backend)(**options)
+    return _buffer["buffer"]
+
+
+# write the messages of this worker on shutdown
+@atexit.register
+def flush_chat_buffer():
+    buffer = _buffer.get("buffer")
+    if buffer is not None:
+        buffer.flush()
@@ -0,0 +1,81 @@
+import json
+from abc import ABC, abstractmethod
+from urllib.parse import parse_qs
+
+
+# frame encodings of the chat websockets, negotiated on connect by the
+# Sec-WebSocket-Protocol header or the encoding query parameter
+class JSONCodec:
+    name = "json"
+
+    def encode(self, data):
+        return {
+            "text_data": json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+        }
+
+    def decode(self, text_data=None, bytes_data=None):
+        return json.loads(text_data if text_data is not None else bytes_data)
+
+
+# binary frames for clients on slow links, needs the msgpack package
+class MessagePackCodec:
+    name = "msgpack"
+
+    def __init__(self):
+        import msgpack
+
+        self.packer = msgpack.Packer(use_bin_type=True)
+        self.unpackb = msgpack.unpackb
+
+    def encode(self, data):
+        return {"bytes_data": self.packer.pack(data)}
+
+    def decode(self, text_data=None, bytes_data=None):
+        if bytes_data is None:
+            # control messages may still be sent as json text
+            return json.loads(text_data)
+        return self.unpackb(bytes_data, raw=False)
+
+
+CODECS = {
+    "json": JSONCodec,
+    "msgpack": MessagePackCodec,
+}
+
+
+def available_codecs():
+    codecs = {}
+    for name, codec in CODECS.items():
+        try:
+            codecs[name] = codec()
+        except ImportError:
+            continue
+    return codecs
+
+
+# (codec, subprotocol to accept) for the connection, json by default
+def select_codec(scope):
+    codecs = available_codecs()
+    for subprotocol in scope.get("subprotocols", []):
+        if subprotocol in codecs:
+            return codecs[subprotocol], subprotocol
+    encoding = parse_qs(scope["query_string"].decode()).get("encoding", ["json"])[0]
+    return codecs.get(encoding, codecs["json"]), None
+
+
+# consumers send and receive plain dicts and lists, encoded by the codec of the connection
+class CodecConsumerMixin(ABC):
+    async def accept_with_codec(self):
+        self.codec, subprotocol = select_codec(self.scope)
+        await self.accept(subprotocol)
+
+    async def send_data(self, data):
+        await self.send(**self.codec.encode(data))
+
+    async def receive(self, text_data=None, bytes_data=None):
+        await self.receive_data(self.codec.decode(text_data, bytes_data))
+
+    # decoded frame of the client
+    @abstractmethod
+    async def receive_data(self, data):
+        pass
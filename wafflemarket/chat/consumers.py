@@ -1,22 +1,54 @@
-import json
+from collections import defaultdict
 from urllib.parse import parse_qs
 
 from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 
-from chat.models import Chat, ChatRoom
-from chat.serializers import ChatSerializer
+from django.conf import settings
+from django.db.models import Q
 
+from chat.buffer import get_chat_buffer
+from chat.codecs import CodecConsumerMixin
+from chat.models import ChatRoom, ChatRoomSummary
+from chat.serializers import chat_data
+from chat.services import (
+    chats_before,
+    participant_side,
+    read_chats,
+    room_group_name,
+    send_chat,
+    send_read,
+    user_chatrooms,
+    user_group_name,
+)
 
-class ChatConsumer(AsyncWebsocketConsumer):
+
+class ChatConsumer(CodecConsumerMixin, AsyncWebsocketConsumer):
     async def connect(self):
         self.roomname = self.scope["url_route"]["kwargs"]["roomname"]
-        self.room_group_name = "chat_%s" % self.roomname
-        self.chatroom = await self.get_chatroom(self.roomname)
+        self.room_group_name = room_group_name(self.roomname)
         self.user = self.scope["user"]
+        # room and participants are kept for the connection,
+        # refreshed by chatroom_changed
+        self.chatroom = await self.get_chatroom(self.roomname)
+        if self.chatroom is None or self.user.id not in (
+            self.chatroom.seller_id,
+            self.chatroom.buyer_id,
+        ):
+            await self.close()
+            return
+        self.buffer = await database_sync_to_async(get_chat_buffer)()
+        # frames of at most batch_size messages, only the newest replay_limit unread
+        # messages are replayed, older ones are paged with history requests
+        self.batch_size = settings.CHAT_HISTORY["BATCH_SIZE"]
+        self.replay_limit = settings.CHAT_HISTORY["REPLAY_LIMIT"]
+        # latest_message the client has seen, the read cursor of the user without it
         latest_message = parse_qs(self.scope["query_string"].decode()).get(
             "latest_message"
-        )[0]
+        )
+        last_read = getattr(
+            self.chatroom, "%s_last_read" % participant_side(self.chatroom, self.user)
+        )
 
         # Join room group
         await self.channel_layer.group_add(
@@ -24,15 +56,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name,
         )
 
-        await self.accept()
+        await self.accept_with_codec()
 
         # send unread messages
-        unread_messages = await self.get_unread_messages(latest_message)
-        await self.send(
-            text_data=json.dumps(
-                await self.get_json_messages(unread_messages, many=True)
-            )
-        )
+        if latest_message is None:
+            await self.replay(last_read)
+        else:
+            await self.replay(int(latest_message[0]))
+            if int(latest_message[0]) > last_read:
+                await self.read(int(latest_message[0]))
 
     async def disconnect(self, close_code):
         # Leave room group
@@ -41,63 +73,260 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name,
         )
 
+    # unread messages in frames of batch_size, an empty frame if there are none
+    async def replay(self, latest_message):
+        after = await self.get_replay_start(latest_message)
+        sent = False
+        while True:
+            chats = await self.get_chats_after(after)
+            if chats:
+                after = chats[-1]["id"]
+            if len(chats) < self.batch_size:
+                break
+            await self.send_data(chats)
+            sent = True
+
+        # the last frames carry messages not written yet,
+        # later ones are broadcast to the group
+        chats += [
+            chat_data(message, self.user)
+            for message in self.buffer.pending(self.chatroom.id, after)
+        ]
+        if not chats and not sent:
+            await self.send_data([])
+        for i in range(0, len(chats), self.batch_size):
+            await self.send_data(chats[i : i + self.batch_size])
+
+    # older messages on demand, {"type": "history", "before": <chat id>, "size": n}
+    async def history(self, data):
+        size = min(int(data.get("size", self.batch_size)), self.batch_size)
+        chats, has_more = await self.get_chats_before(int(data["before"]), size)
+        await self.send_data({"type": "history", "chats": chats, "has_more": has_more})
+
+    # move the read cursor, {"type": "read", "chat_id": <chat id>}, every message
+    # without chat_id. the user channels of the user get the new unread count
+    async def read(self, chat_id=None):
+        cursor, unread = await database_sync_to_async(read_chats)(
+            self.chatroom, self.user, self.buffer, chat_id
+        )
+        await send_read(self.channel_layer, self.chatroom, self.user, cursor, unread)
+        return cursor, unread
+
     # Receive message from client WebSocket
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        content = text_data_json["chat"]
-        chat = await self.create_chat(content)
-        sender_id = await self.get_sender_id(chat)
-
-        # Send message to room group
-        if await self.is_users_active():
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "chat": await self.get_json_messages(chat),
-                    "sender_id": sender_id,
-                },
-            )
+    async def receive_data(self, data):
+        if data.get("type") == "history":
+            await self.history(data)
+            return
+        if data.get("type") == "read":
+            chat_id = data.get("chat_id")
+            cursor, unread = await self.read(None if chat_id is None else int(chat_id))
+            await self.send_data({"type": "read", "last_read": cursor, "unread": unread})
+            return
+
+        # Send message to room group and participants
+        await send_chat(
+            self.channel_layer,
+            self.chatroom,
+            self.user,
+            self.buffer,
+            data["chat"],
+        )
 
     # Receive message from room group
     async def chat_message(self, event):
         chat = event["chat"]
-        chat["is_sender"] = await self.get_is_sender(event["sender_id"])
+        chat["is_sender"] = event["sender_id"] == self.user.id
 
         # Send message to client WebSocket
-        await self.send(text_data=json.dumps([chat]))
+        await self.send_data([chat])
+
+    # a participant left or the room changed, sent by chat.signals
+    async def chatroom_changed(self, event):
+        self.chatroom = await self.get_chatroom(self.roomname)
+        if self.chatroom is None:
+            await self.close()
 
     @database_sync_to_async
     def get_chatroom(self, roomname):
-        if ChatRoom.objects.filter(name=self.roomname).exists():
-            return ChatRoom.objects.get(name=self.roomname)
-        else:
-            return None
+        return (
+            ChatRoom.objects.select_related("seller", "buyer")
+            .filter(name=roomname)
+            .first()
+        )
 
+    # replay starts after the newest replay_limit messages following latest_message
     @database_sync_to_async
-    def get_unread_messages(self, latest_message=0):
-        return self.chatroom.chats.filter(id__gt=latest_message).order_by("id")
+    def get_replay_start(self, latest_message):
+        boundary = (
+            self.chatroom.chats.filter(id__gt=latest_message)
+            .order_by("-id")
+            .values_list("id", flat=True)[self.replay_limit - 1 : self.replay_limit]
+        )
+        if boundary:
+            return max(latest_message, boundary[0] - 1)
+        return latest_message
 
     @database_sync_to_async
-    def get_json_messages(self, messages, many=False):
-        return ChatSerializer(messages, many=many, context={"user": self.user}).data
+    def get_chats_after(self, after):
+        chats = (
+            self.chatroom.chats.filter(id__gt=after)
+            .order_by("id")
+            .values("id", "sender_id", "content")[: self.batch_size]
+        )
+        return [chat_data(chat, self.user) for chat in chats]
 
     @database_sync_to_async
-    def create_chat(self, content):
-        return Chat.objects.create(
-            chatroom=self.chatroom, sender=self.user, content=content
+    def get_chats_before(self, before, size):
+        return chats_before(self.chatroom, self.user, self.buffer, before, size)
+
+
+# one connection per client for every room of the user. pushes new messages of all
+# rooms with unread counts, and takes {"type": "chat" | "history" | "read", "room": ...}.
+# unread counts start from the room summaries and follow the read cursors
+class UserChatConsumer(CodecConsumerMixin, AsyncWebsocketConsumer):
+    async def connect(self):
+        self.user = self.scope["user"]
+        self.group_name = user_group_name(self.user.id)
+        self.buffer = await database_sync_to_async(get_chat_buffer)()
+        self.batch_size = settings.CHAT_HISTORY["BATCH_SIZE"]
+        # unread messages per room
+        self.unread = defaultdict(int)
+        await self.load_chatrooms()
+
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept_with_codec()
+        await self.send_data({"type": "rooms", "rooms": await self.get_room_list()})
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_data(self, data):
+        chatroom = await self.find_chatroom(data.get("room"))
+        if chatroom is None:
+            await self.send_data(
+                {"type": "error", "message": "해당하는 채팅방이 존재하지 않습니다."}
+            )
+            return
+
+        if data.get("type") == "history":
+            size = min(int(data.get("size", self.batch_size)), self.batch_size)
+            chats, has_more = await database_sync_to_async(chats_before)(
+                chatroom, self.user, self.buffer, int(data["before"]), size
+            )
+            await self.send_data(
+                {
+                    "type": "history",
+                    "room": chatroom.name,
+                    "chats": chats,
+                    "has_more": has_more,
+                }
+            )
+        elif data.get("type") == "read":
+            chat_id = data.get("chat_id")
+            cursor, unread = await database_sync_to_async(read_chats)(
+                chatroom, self.user, self.buffer, None if chat_id is None else int(chat_id)
+            )
+            await send_read(self.channel_layer, chatroom, self.user, cursor, unread)
+        else:
+            await send_chat(
+                self.channel_layer, chatroom, self.user, self.buffer, data["chat"]
+            )
+
+    # new message of one of the rooms, sent by chat.services.send_chat
+    async def chat_notification(self, event):
+        chat = event["chat"]
+        chat["is_sender"] = event["sender_id"] == self.user.id
+        if not chat["is_sender"]:
+            self.unread[event["room"]] += 1
+        await self.send_data(
+            {
+                "type": "chat",
+                "room": event["room"],
+                "chat": chat,
+                "unread": self.unread[event["room"]],
+            }
         )
 
-    @database_sync_to_async
-    def get_sender_id(self, chat):
-        return chat.sender.id
+    # the read cursor of a room moved on some connection of the user
+    async def chat_read(self, event):
+        self.unread[event["room"]] = event["unread"]
+        await self.send_data(
+            {
+                "type": "read",
+                "room": event["room"],
+                "last_read": event["last_read"],
+                "unread": event["unread"],
+            }
+        )
+
+    # a room of the user was created or changed, sent by chat.signals
+    async def chatroom_changed(self, event):
+        await self.load_chatrooms()
 
+    async def find_chatroom(self, roomname):
+        if roomname not in self.chatrooms:
+            # created after the rooms were loaded
+            await self.load_chatrooms()
+        return self.chatrooms.get(roomname)
+
+    async def load_chatrooms(self):
+        self.chatrooms = await self.get_chatrooms()
+
+    # every room the user takes part in, with participants
     @database_sync_to_async
-    def is_users_active(self):
-        seller = self.chatroom.seller
-        buyer = self.chatroom.buyer
-        return seller.is_active or buyer.is_active
+    def get_chatrooms(self):
+        chatrooms = ChatRoom.objects.select_related("seller", "buyer").filter(
+            Q(seller=self.user) | Q(buyer=self.user)
+        )
+        return {chatroom.name: chatroom for chatroom in chatrooms}
 
+    # listed rooms with their last message and unread count in one query
     @database_sync_to_async
-    def get_is_sender(self, sender_id):
-        return sender_id == self.user.id
+    def get_room_list(self):
+        chatrooms = user_chatrooms(self.user).select_related("summary")
+        pending = defaultdict(list)
+        for message in self.buffer.messages():
+            pending[message["chatroom_id"]].append(message)
+
+        rooms = []
+        for chatroom in chatrooms:
+            try:
+                summary = chatroom.summary
+            except ChatRoomSummary.DoesNotExist:
+                summary = ChatRoomSummary(chatroom=chatroom)
+            last_message = None
+            if summary.last_chat_id is not None:
+                last_message = {
+                    "id": summary.last_chat_id,
+                    "sender_id": summary.last_chat_sender_id,
+                    "content": summary.last_chat_content,
+                }
+            side = participant_side(chatroom, self.user)
+            last_read = getattr(chatroom, "%s_last_read" % side)
+            unread = getattr(summary, "%s_unread" % side)
+            # messages not written yet are newer and not counted by the summary
+            messages = [
+                message
+                for message in pending[chatroom.id]
+                if summary.last_chat_id is None or message["id"] > summary.last_chat_id
+            ]
+            if messages:
+                last_message = max(messages, key=lambda message: message["id"])
+                unread += sum(
+                    1
+                    for message in messages
+                    if message["sender_id"] != self.user.id and message["id"] > last_read
+                )
+            if unread:
+                self.unread[chatroom.name] = unread
+            rooms.append(
+                {
+                    "room": chatroom.name,
+                    "last_message": (
+                        chat_data(last_message, self.user) if last_message else None
+                    ),
+                    "last_read": last_read,
+                    "unread": unread,
+                }
+            )
+        return rooms
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from chat.archive import archive_chats
+
+
+class Command(BaseCommand):
+    help = "Move old chats and chats of rooms without an article to archives in file storage"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=None)
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--keep-dead-rooms", action="store_true")
+
+    def handle(self, *args, **options):
+        chat_cnt = archive_chats(
+            age_days=options["days"],
+            dead_rooms=not options["keep_dead_rooms"],
+            batch_size=options["batch_size"],
+        )
+        self.stdout.write("archived %d chats" % chat_cnt)
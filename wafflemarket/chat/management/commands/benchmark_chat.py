@@ -0,0 +1,107 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from user.models import User
+from article.models import Article
+from chat.buffer import get_chat_buffer
+from chat.codecs import CODECS
+from chat.models import ChatRoom
+from chat.routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure chat messages per second and bytes per frame of one worker "
+        "with an in-memory channel layer"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=5000)
+        parser.add_argument("--encoding", choices=sorted(CODECS), default="json")
+
+    def handle(self, *args, **options):
+        seller = User.objects.create(phone_number="benchmark_s", username="benchmark_s")
+        buyer = User.objects.create(phone_number="benchmark_b", username="benchmark_b")
+        article = Article.objects.create(seller=seller, title="benchmark", content="", category="")
+        chatroom = ChatRoom.objects.create(
+            name="benchmark_%d" % article.id, article=article, seller=seller, buyer=buyer
+        )
+        layers = {
+            "default": {
+                "BACKEND": "channels.layers.InMemoryChannelLayer",
+                "CONFIG": {"capacity": options["messages"] + 1},
+            }
+        }
+        self.codec = CODECS[options["encoding"]]()
+        try:
+            with override_settings(CHANNEL_LAYERS=layers):
+                elapsed, received = async_to_sync(self.run)(
+                    chatroom, seller, buyer, options["messages"]
+                )
+                channel_layers.backends.clear()
+            self.stdout.write(
+                "%s: %d messages in %.2fs, %.0f messages/sec, %.1f bytes/frame"
+                % (
+                    self.codec.name,
+                    options["messages"],
+                    elapsed,
+                    options["messages"] / elapsed,
+                    received / options["messages"],
+                )
+            )
+            self.stdout.write(
+                "%s: %.2f us/message to encode and decode a frame"
+                % (self.codec.name, self.measure_codec(options["messages"]))
+            )
+        finally:
+            get_chat_buffer().flush()
+            chatroom.delete()
+            article.delete()
+            seller.delete()
+            buyer.delete()
+
+    async def connect(self, chatroom, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            "/ws/chat/%s/?latest_message=0" % chatroom.name,
+            subprotocols=[self.codec.name],
+        )
+        communicator.scope["user"] = user
+        await communicator.connect()
+        await communicator.receive_from()
+        return communicator
+
+    # sender and receiver both get every message, (seconds, bytes received)
+    async def run(self, chatroom, seller, buyer, message_cnt):
+        sender = await self.connect(chatroom, seller)
+        receiver = await self.connect(chatroom, buyer)
+        received = 0
+        start = time.perf_counter()
+        for i in range(message_cnt):
+            await sender.send_to(
+                **self.codec.encode({"chat": "안녕하세요, 아직 판매 중인가요? %d" % i})
+            )
+        for _ in range(message_cnt):
+            frame = await receiver.receive_from(timeout=10)
+            # utf-8 on the wire
+            received += len(frame.encode() if isinstance(frame, str) else frame)
+            await sender.receive_from(timeout=10)
+        elapsed = time.perf_counter() - start
+        await sender.disconnect()
+        await receiver.disconnect()
+        return elapsed, received
+
+    # cpu of the encoding alone, a received frame of one chat
+    def measure_codec(self, message_cnt):
+        frame = [{"id": 123456, "content": "안녕하세요, 아직 판매 중인가요?", "is_sender": False}]
+        start = time.perf_counter()
+        for _ in range(message_cnt):
+            self.codec.decode(**self.codec.encode(frame))
+        return (time.perf_counter() - start) / message_cnt * 1000000
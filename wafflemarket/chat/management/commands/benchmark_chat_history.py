@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.models import User
+from article.models import Article
+from chat.archive import archive_chats, read_archive
+from chat.buffer import get_chat_buffer
+from chat.models import Chat, ChatRoom
+from chat.services import chats_before
+
+
+class Command(BaseCommand):
+    help = "Measure history pages per second from the chat table and from archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chats", type=int, default=20000)
+        parser.add_argument("--size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        seller = User.objects.create(phone_number="benchmark_s", username="benchmark_s")
+        buyer = User.objects.create(phone_number="benchmark_b", username="benchmark_b")
+        article = Article.objects.create(seller=seller, title="benchmark", content="", category="")
+        chatroom = ChatRoom.objects.create(
+            name="benchmark_%d" % article.id, article=article, seller=seller, buyer=buyer
+        )
+        try:
+            Chat.objects.bulk_create(
+                [
+                    Chat(
+                        chatroom=chatroom,
+                        sender=seller if i % 2 else buyer,
+                        content="benchmark %d" % i,
+                    )
+                    for i in range(options["chats"])
+                ],
+                batch_size=5000,
+            )
+            self.report("table", self.run(chatroom, buyer, options["size"]))
+
+            Chat.objects.filter(chatroom=chatroom).update(
+                created_at=timezone.now() - timedelta(days=365)
+            )
+            archive_chats(age_days=180, dead_rooms=False)
+            read_archive.cache_clear()
+            self.report("archive, cold", self.run(chatroom, buyer, options["size"]))
+            self.report("archive, warm", self.run(chatroom, buyer, options["size"]))
+        finally:
+            chatroom.delete()
+            article.delete()
+            seller.delete()
+            buyer.delete()
+
+    def report(self, name, result):
+        pages, elapsed = result
+        self.stdout.write(
+            "%s: %d pages in %.2fs, %.0f pages/sec" % (name, pages, elapsed, pages / elapsed)
+        )
+
+    # page from the newest chat back to the first
+    def run(self, chatroom, user, size):
+        buffer = get_chat_buffer()
+        before = 2 ** 62
+        pages = 0
+        start = time.perf_counter()
+        while True:
+            chats, has_more = chats_before(chatroom, user, buffer, before, size)
+            pages += 1
+            if not has_more:
+                break
+            before = chats[0]["id"]
+        return pages, time.perf_counter() - start
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from chat.buffer import get_chat_buffer
+
+
+class Command(BaseCommand):
+    help = "Write buffered chat messages left behind by stopped workers"
+
+    def handle(self, *args, **options):
+        chat_cnt = get_chat_buffer().flush()
+        self.stdout.write("flushed %d chats" % chat_cnt)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from chat.services import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the chat list summaries of every chat room, unread counts are kept"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chatroom_cnt = rebuild_summaries(options["batch_size"])
+        self.stdout.write("rebuilt %d chat room summaries" % chatroom_cnt)
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_chatroom_valid_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['chatroom', 'id'], name='chat_room_id_idx'),
+        ),
+    ]
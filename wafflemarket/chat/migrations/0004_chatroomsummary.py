@@ -0,0 +1,28 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('article', '0012_comment_thread_idx'),
+        ('chat', '0003_chat_room_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatRoomSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_chat_id', models.BigIntegerField(default=None, null=True)),
+                ('last_chat_sender_id', models.BigIntegerField(default=None, null=True)),
+                ('last_chat_content', models.CharField(default='', max_length=255)),
+                ('seller_unread', models.PositiveIntegerField(default=0)),
+                ('buyer_unread', models.PositiveIntegerField(default=0)),
+                ('chatroom', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='chat.chatroom')),
+                ('product_image', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='article.productimage')),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:07
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+# history before the cursors counts as read
+def read_existing_chats(apps, schema_editor):
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    Chat = apps.get_model("chat", "Chat")
+    last_chat = Coalesce(
+        Subquery(
+            Chat.objects.filter(chatroom=OuterRef("pk")).order_by("-id").values("id")[:1]
+        ),
+        0,
+    )
+    ChatRoom.objects.update(
+        seller_last_read=last_chat, buyer_last_read=last_chat
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_chatroomsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='buyer_last_read',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='seller_last_read',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(read_existing_chats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_chatroom_read_cursors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_chat_id', models.BigIntegerField()),
+                ('last_chat_id', models.BigIntegerField()),
+                ('chat_count', models.PositiveIntegerField()),
+                ('archive', models.FileField(upload_to='chat_archive')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('chatroom', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chat.chatroom')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chatarchive',
+            index=models.Index(fields=['chatroom', 'last_chat_id'], name='chat_archive_idx'),
+        ),
+    ]
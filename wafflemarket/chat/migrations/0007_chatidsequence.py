@@ -0,0 +1,20 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0006_chatarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+
+# summaries of rooms created before them, so listing never writes. a room whose
+# chats are all archived gets its last chat from rebuild_chat_summaries
+def create_missing_summaries(apps, schema_editor):
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    ChatRoomSummary = apps.get_model("chat", "ChatRoomSummary")
+    Chat = apps.get_model("chat", "Chat")
+    ProductImage = apps.get_model("article", "ProductImage")
+
+    chatrooms = ChatRoom.objects.filter(summary__isnull=True).order_by("id")
+    last_id = 0
+    while True:
+        batch = list(chatrooms.filter(id__gt=last_id)[:1000])
+        if not batch:
+            return
+        summaries = []
+        for chatroom in batch:
+            last_chat = Chat.objects.filter(chatroom=chatroom).order_by("-id").first()
+            summaries.append(
+                ChatRoomSummary(
+                    chatroom=chatroom,
+                    product_image=ProductImage.objects.filter(article_id=chatroom.article_id)
+                    .order_by("id")
+                    .first(),
+                    last_chat_id=last_chat.id if last_chat else None,
+                    last_chat_sender_id=last_chat.sender_id if last_chat else None,
+                    last_chat_content=last_chat.content if last_chat else "",
+                )
+            )
+        ChatRoomSummary.objects.bulk_create(summaries)
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0007_chatidsequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_summaries, migrations.RunPython.noop),
+    ]
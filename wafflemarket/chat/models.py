@@ -2,7 +2,7 @@ from django.db import models
 from django.dispatch import receiver
 
 from user.models import User
-from article.models import Article
+from article.models import Article, ProductImage
 
 
 class ChatRoom(models.Model):
@@ -18,6 +18,9 @@ class ChatRoom(models.Model):
     )
     # first word for seller, second word for buyer
     valid_user = models.CharField(max_length=2, null=True, default="sb")
+    # id of the last chat each participant has read, only moves forward
+    seller_last_read = models.BigIntegerField(default=0)
+    buyer_last_read = models.BigIntegerField(default=0)
 
 
 class Chat(models.Model):
@@ -29,3 +32,48 @@ class Chat(models.Model):
     )
     content = models.CharField(max_length=255, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # replay and history of a room, paged by id
+            models.Index(fields=["chatroom", "id"], name="chat_room_id_idx"),
+        ]
+
+
+# last chat id handed out by LocalChatBuffer, one row shared by every worker
+class ChatIdSequence(models.Model):
+    last_id = models.BigIntegerField(default=0)
+
+# chat list entry of a room maintained on write by chat.services,
+# counterpart and location are joined when listing
+class ChatRoomSummary(models.Model):
+    chatroom = models.OneToOneField(
+        ChatRoom, related_name="summary", on_delete=models.CASCADE
+    )
+    product_image = models.ForeignKey(
+        ProductImage, related_name="+", null=True, on_delete=models.SET_NULL
+    )
+    last_chat_id = models.BigIntegerField(null=True, default=None)
+    last_chat_sender_id = models.BigIntegerField(null=True, default=None)
+    last_chat_content = models.CharField(max_length=255, default="")
+    # messages of the other participant after the read cursor of the room
+    seller_unread = models.PositiveIntegerField(default=0)
+    buyer_unread = models.PositiveIntegerField(default=0)
+
+
+# gzipped json of consecutive chats of a room moved out of Chat by chat.archive,
+# read by history paging when the table runs out
+class ChatArchive(models.Model):
+    chatroom = models.ForeignKey(
+        ChatRoom, related_name="archives", null=False, on_delete=models.CASCADE
+    )
+    first_chat_id = models.BigIntegerField()
+    last_chat_id = models.BigIntegerField()
+    chat_count = models.PositiveIntegerField()
+    archive = models.FileField(upload_to="chat_archive")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["chatroom", "last_chat_id"], name="chat_archive_idx"),
+        ]
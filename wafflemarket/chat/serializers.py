@@ -2,8 +2,8 @@ from rest_framework import serializers
 
 from user.serializers import UserSerializer
 from location.serializers import LocationSerializer
-from article.serializers import ArticleSerializer
-from chat.models import Chat, ChatRoom
+from article.serializers import ProductImageSerializer
+from chat.models import Chat, ChatRoom, ChatRoomSummary
 
 
 class ChatSerializer(serializers.ModelSerializer):
@@ -22,7 +22,17 @@ class ChatSerializer(serializers.ModelSerializer):
         return chat.sender == user
 
 
-# give info to list chatrooms
+# ChatSerializer output of a message buffered by chat.buffer
+def chat_data(message, user):
+    return {
+        "id": message["id"],
+        "content": message["content"],
+        "is_sender": message["sender_id"] == user.id,
+    }
+
+
+# give info to list chatrooms, read from the room summary and the joined
+# participants and article, see chat.services.prefetch_chatrooms
 class ChatRoomSerializer(serializers.ModelSerializer):
 
     roomname = serializers.SerializerMethodField(read_only=True)
@@ -31,6 +41,8 @@ class ChatRoomSerializer(serializers.ModelSerializer):
     profile_image = serializers.SerializerMethodField(read_only=True)
     article_id = serializers.SerializerMethodField(read_only=True)
     product_image = serializers.SerializerMethodField(read_only=True)
+    last_message = serializers.SerializerMethodField(read_only=True)
+    unread = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = ChatRoom
@@ -41,33 +53,67 @@ class ChatRoomSerializer(serializers.ModelSerializer):
             "profile_image",
             "article_id",
             "product_image",
+            "last_message",
+            "unread",
         )
 
+    def get_counterpart(self, chatroom):
+        user = self.context["user"]
+        if chatroom.seller_id == user.id:
+            return chatroom.buyer
+        else:
+            return chatroom.seller
+
+    def get_summary(self, chatroom):
+        try:
+            return chatroom.summary
+        except ChatRoomSummary.DoesNotExist:
+            # every room gets one on create and by migration, listed empty
+            # until rebuild_chat_summaries if it is missing anyway
+            return ChatRoomSummary(chatroom=chatroom)
+
     def get_roomname(self, chatroom):
         return chatroom.name
 
     def get_username(self, chatroom):
-        user = self.context["user"]
-        if chatroom.seller == user:
-            return chatroom.buyer.username
-        else:
-            return chatroom.seller.username
+        counterpart = self.get_counterpart(chatroom)
+        return counterpart.username if counterpart else None
 
     def get_location(self, chatroom):
+        if chatroom.article is None or chatroom.article.location is None:
+            return None
         return LocationSerializer(chatroom.article.location).data
 
     def get_profile_image(self, chatroom):
-        user = self.context["user"]
-        if chatroom.seller == user:
-            user = chatroom.buyer
-        else:
-            user = chatroom.seller
-        return UserSerializer(user).data.get("profile_image")
+        counterpart = self.get_counterpart(chatroom)
+        if counterpart is None:
+            return None
+        return UserSerializer().get_profile_image(counterpart)
 
     def get_article_id(self, chatroom):
-        return chatroom.article.id
+        return chatroom.article_id
 
     def get_product_image(self, chatroom):
-        return ArticleSerializer(chatroom.article, context=self.context).data.get(
-            "product_images"
-        )[0]
+        product_image = self.get_summary(chatroom).product_image
+        if product_image is None:
+            return None
+        return ProductImageSerializer(product_image, context=self.context).data
+
+    def get_last_message(self, chatroom):
+        summary = self.get_summary(chatroom)
+        if summary.last_chat_id is None:
+            return None
+        return chat_data(
+            {
+                "id": summary.last_chat_id,
+                "sender_id": summary.last_chat_sender_id,
+                "content": summary.last_chat_content,
+            },
+            self.context["user"],
+        )
+
+    def get_unread(self, chatroom):
+        summary = self.get_summary(chatroom)
+        if chatroom.seller_id == self.context["user"].id:
+            return summary.seller_unread
+        return summary.buyer_unread
@@ -0,0 +1,251 @@
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Subquery, Value, When
+
+from article.models import ProductImage
+from chat.archive import archived_chats_before, last_archived_chat
+from chat.models import Chat, ChatRoom, ChatRoomSummary
+from chat.serializers import chat_data
+
+
+def room_group_name(roomname):
+    return "chat_%s" % roomname
+
+
+def user_group_name(user_id):
+    return "user_%s" % user_id
+
+
+# rooms the user has not left, as listed by ChatRoomViewSet.list
+def user_chatrooms(user):
+    return ChatRoom.objects.filter(
+        (Q(seller=user) & Q(valid_user__contains="s"))
+        | (Q(buyer=user) & Q(valid_user__contains="b"))
+    ).exclude(article__isnull=True)
+
+
+def is_users_active(chatroom):
+    seller = chatroom.seller
+    buyer = chatroom.buyer
+    return (seller is not None and seller.is_active) or (
+        buyer is not None and buyer.is_active
+    )
+
+
+# (chats of the room before the id, oldest first, whether there are more),
+# messages still in the buffer included and archived ones once the table runs out
+def chats_before(chatroom, user, buffer, before, size):
+    chats = {
+        chat["id"]: chat
+        for chat in chatroom.chats.filter(id__lt=before)
+        .order_by("-id")
+        .values("id", "sender_id", "content")[: size + 1]
+    }
+    if len(chats) <= size:
+        for chat in archived_chats_before(
+            chatroom.id, min(chats, default=before), size + 1 - len(chats)
+        ):
+            chats[chat["id"]] = chat
+    for message in buffer.pending(chatroom.id):
+        if message["id"] < before:
+            chats.setdefault(message["id"], message)
+    chat_ids = sorted(chats, reverse=True)
+    return (
+        [chat_data(chats[chat_id], user) for chat_id in reversed(chat_ids[:size])],
+        len(chat_ids) > size,
+    )
+
+
+# buffer the message and send it to the room and to both participants
+async def send_chat(channel_layer, chatroom, user, buffer, content):
+    # the id is assigned at once, the row is written later by the buffer
+    message = await database_sync_to_async(buffer.add)(chatroom.id, user.id, content)
+    if not is_users_active(chatroom):
+        return message
+
+    chat = chat_data(message, user)
+    await channel_layer.group_send(
+        room_group_name(chatroom.name),
+        {"type": "chat_message", "chat": chat, "sender_id": user.id},
+    )
+    for user_id in {chatroom.seller_id, chatroom.buyer_id} - {None}:
+        await channel_layer.group_send(
+            user_group_name(user_id),
+            {
+                "type": "chat_notification",
+                "room": chatroom.name,
+                "chat": chat,
+                "sender_id": user.id,
+            },
+        )
+    return message
+
+
+# everything ChatRoomSerializer reads, in one query
+def prefetch_chatrooms(chatrooms):
+    return chatrooms.select_related(
+        "seller", "buyer", "article__location", "summary__product_image"
+    )
+
+
+def first_product_images(article_id):
+    return ProductImage.objects.filter(article_id=article_id).order_by("id")
+
+
+# subquery for updates
+def first_product_image_id(article_id):
+    return Subquery(first_product_images(article_id).values("id")[:1])
+
+
+# summary of the room from its chats, unread counts are kept
+def build_summary(chatroom):
+    last_chat = (
+        Chat.objects.filter(chatroom=chatroom)
+        .order_by("-id")
+        .values("id", "sender_id", "content")
+        .first()
+    ) or last_archived_chat(chatroom.id)
+    summary, _ = ChatRoomSummary.objects.update_or_create(
+        chatroom=chatroom,
+        defaults={
+            "product_image": first_product_images(chatroom.article_id).first(),
+            "last_chat_id": last_chat["id"] if last_chat else None,
+            "last_chat_sender_id": last_chat["sender_id"] if last_chat else None,
+            "last_chat_content": last_chat["content"] if last_chat else "",
+        },
+    )
+    return summary
+
+
+def rebuild_summaries(batch_size=1000):
+    chatrooms = ChatRoom.objects.order_by("id")
+    last_id = 0
+    rebuilt = 0
+    while True:
+        batch = list(chatrooms.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return rebuilt
+        for chatroom in batch:
+            build_summary(chatroom)
+        rebuilt += len(batch)
+        last_id = batch[-1].id
+
+
+# last message and unread counts of the rooms of written messages,
+# one update per room, called by chat.buffer in the transaction of the insert
+def update_summaries(messages):
+    room_messages = defaultdict(list)
+    for message in messages:
+        room_messages[message["chatroom_id"]].append(message)
+    participants = {
+        chatroom["id"]: chatroom
+        for chatroom in ChatRoom.objects.filter(id__in=room_messages).values(
+            "id", "seller_id", "buyer_id", "seller_last_read", "buyer_last_read"
+        )
+    }
+
+    for chatroom_id, messages in room_messages.items():
+        chatroom = participants.get(chatroom_id, {})
+
+        # messages of the other participant past the read cursor
+        def unread(side):
+            user_id = chatroom.get("%s_id" % side)
+            last_read = chatroom.get("%s_last_read" % side, 0)
+            return sum(
+                1
+                for message in messages
+                if message["sender_id"] != user_id and message["id"] > last_read
+            )
+
+        last = max(messages, key=lambda message: message["id"])
+        newer = Q(last_chat_id__isnull=True) | Q(last_chat_id__lt=last["id"])
+
+        def latest(field, value):
+            return Case(
+                When(newer, then=Value(value)),
+                default=F(field),
+                output_field=ChatRoomSummary._meta.get_field(field),
+            )
+
+        ChatRoomSummary.objects.filter(chatroom_id=chatroom_id).update(
+            last_chat_id=latest("last_chat_id", last["id"]),
+            last_chat_sender_id=latest("last_chat_sender_id", last["sender_id"]),
+            last_chat_content=latest("last_chat_content", last["content"]),
+            seller_unread=F("seller_unread") + unread("seller"),
+            buyer_unread=F("buyer_unread") + unread("buyer"),
+        )
+
+
+def participant_side(chatroom, user):
+    if user.id == chatroom.seller_id:
+        return "seller"
+    if user.id == chatroom.buyer_id:
+        return "buyer"
+    return None
+
+
+# move the read cursor of the user forward to chat_id and count the written
+# messages of the other participant after it with a range scan of chat_room_id_idx.
+# returns (read cursor, unread count), messages still buffered are not counted
+def mark_read(chatroom, user, chat_id):
+    side = participant_side(chatroom, user)
+    if side is None:
+        return 0, 0
+    last_read = "%s_last_read" % side
+    with transaction.atomic():
+        # flushes update the summary after their insert, so holding it keeps
+        # the count and the counter in step
+        summary = (
+            ChatRoomSummary.objects.select_for_update()
+            .filter(chatroom_id=chatroom.id)
+            .first()
+        )
+        ChatRoom.objects.filter(
+            id=chatroom.id, **{"%s__lt" % last_read: chat_id}
+        ).update(**{last_read: chat_id})
+        cursor = ChatRoom.objects.values_list(last_read, flat=True).get(id=chatroom.id)
+        unread = (
+            Chat.objects.filter(chatroom_id=chatroom.id, id__gt=cursor)
+            .exclude(sender_id=user.id)
+            .count()
+        )
+        if summary is not None:
+            ChatRoomSummary.objects.filter(id=summary.id).update(
+                **{"%s_unread" % side: unread}
+            )
+    setattr(chatroom, last_read, cursor)
+    return cursor, unread
+
+
+# newest message of the room, buffered ones included
+def latest_chat_id(chatroom, buffer):
+    pending = buffer.pending(chatroom.id)
+    if pending:
+        return pending[-1]["id"]
+    return (
+        chatroom.chats.order_by("-id").values_list("id", flat=True).first() or 0
+    )
+
+
+# mark_read for the user and ChatConsumer/UserChatConsumer, chat_id None reads
+# everything. returns (read cursor, unread count) with buffered messages counted
+def read_chats(chatroom, user, buffer, chat_id=None):
+    if chat_id is None:
+        chat_id = latest_chat_id(chatroom, buffer)
+    cursor, unread = mark_read(chatroom, user, chat_id)
+    unread += sum(
+        1
+        for message in buffer.pending(chatroom.id, cursor)
+        if message["sender_id"] != user.id
+    )
+    return cursor, unread
+
+
+async def send_read(channel_layer, chatroom, user, cursor, unread):
+    await channel_layer.group_send(
+        user_group_name(user.id),
+        {"type": "chat_read", "room": chatroom.name, "last_read": cursor, "unread": unread},
+    )
@@ -0,0 +1,112 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from user.models import User
+from article.models import Article, ProductImage
+from chat.models import ChatArchive, ChatRoom, ChatRoomSummary
+from chat.services import (
+    build_summary,
+    first_product_image_id,
+    room_group_name,
+    user_group_name,
+)
+
+
+# connected ChatConsumers and UserChatConsumers of the participants
+# reload the rooms, chatrooms are (name, seller_id, buyer_id)
+def notify_chatrooms_changed(chatrooms):
+    def notify():
+        channel_layer = get_channel_layer()
+        groups = set()
+        for name, seller_id, buyer_id in chatrooms:
+            groups.add(room_group_name(name))
+            groups.update(
+                user_group_name(user_id) for user_id in (seller_id, buyer_id) if user_id
+            )
+        for group in groups:
+            async_to_sync(channel_layer.group_send)(group, {"type": "chatroom_changed"})
+
+    transaction.on_commit(notify)
+
+
+def chatroom_key(chatroom):
+    return (chatroom.name, chatroom.seller_id, chatroom.buyer_id)
+
+
+@receiver(post_init, sender=User)
+def remember_user_state(sender, instance, **kwargs):
+    if "is_active" in instance.get_deferred_fields():
+        instance._chat_state = None
+    else:
+        instance._chat_state = instance.is_active
+
+
+@receiver(post_save, sender=User)
+def update_user_chatrooms(sender, instance, created, **kwargs):
+    # a user left (UserLeaveView) or came back
+    if not created and instance.is_active != instance._chat_state:
+        chatrooms = ChatRoom.objects.filter(
+            Q(seller=instance) | Q(buyer=instance)
+        ).values_list("name", "seller_id", "buyer_id")
+        notify_chatrooms_changed(list(chatrooms))
+    instance._chat_state = instance.is_active
+
+
+@receiver(post_init, sender=ChatRoom)
+def remember_chatroom_state(sender, instance, **kwargs):
+    if {"valid_user", "seller_id", "buyer_id"} & instance.get_deferred_fields():
+        instance._chat_state = None
+    else:
+        instance._chat_state = (instance.valid_user, instance.seller_id, instance.buyer_id)
+
+
+@receiver(post_save, sender=ChatRoom)
+def update_chatroom(sender, instance, created, **kwargs):
+    state = (instance.valid_user, instance.seller_id, instance.buyer_id)
+    if created:
+        build_summary(instance)
+    if created or state != instance._chat_state:
+        notify_chatrooms_changed([chatroom_key(instance)])
+    instance._chat_state = state
+
+
+@receiver(post_delete, sender=ChatRoom)
+def delete_chatroom(sender, instance, **kwargs):
+    notify_chatrooms_changed([chatroom_key(instance)])
+
+
+@receiver(post_init, sender=Article)
+def remember_article_images(sender, instance, **kwargs):
+    instance._product_images_added = False
+
+
+# product images are added with bulk_create by article.images, which marks the
+# article. rooms without an image take the first image of the article when it
+# is saved after them, other saves of the article leave the summaries alone
+@receiver(post_save, sender=Article)
+def update_article_chatrooms(sender, instance, created, **kwargs):
+    if not created and instance._product_images_added:
+        ChatRoomSummary.objects.filter(
+            chatroom__article_id=instance.id, product_image__isnull=True
+        ).update(product_image=first_product_image_id(instance.id))
+    instance._product_images_added = False
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_product_image(sender, instance, **kwargs):
+    if instance.article_id is not None:
+        ChatRoomSummary.objects.filter(chatroom__article_id=instance.article_id).update(
+            product_image=first_product_image_id(instance.article_id)
+        )
+
+
+@receiver(post_delete, sender=ChatArchive)
+def delete_chat_archive(sender, instance, **kwargs):
+    name = instance.archive.name
+    storage = instance.archive.storage
+    transaction.on_commit(lambda: storage.delete(name))
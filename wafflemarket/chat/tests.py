@@ -1,3 +1,746 @@
-from django.test import TestCase
+import json
+import msgpack
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from PIL import Image
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from user.serializers import jwt_token_of
+from user.tests import UserFactory
+from article.images import ingest_product_images
+from article.models import ProductImage
+from article.tests import ArticleFactory
+from location.tests import LocationFactory
+from chat.archive import archive_chats, archive_storage, read_archive
+from chat.buffer import LocalChatBuffer, _buffer, get_chat_buffer
+from chat.models import Chat, ChatArchive, ChatRoom, ChatRoomSummary
+from chat.services import build_summary
+from chat.routing import websocket_urlpatterns
+
+
+@override_settings(
+    CHAT_BUFFER={"FLUSH_SIZE": 100, "FLUSH_INTERVAL": None},
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    CHANNEL_LAYERS={
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": 1000},
+        }
+    },
+)
+class ChatConsumerTestCase(TransactionTestCase):
+    @classmethod
+    def setUp(cls):
+        _buffer.clear()
+        cls.seller = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+        )
+        cls.buyer = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+        )
+        cls.article = ArticleFactory(
+            seller=cls.seller,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        cls.chatroom = ChatRoom.objects.create(
+            name="%d_%d" % (cls.buyer.id, cls.article.id),
+            article=cls.article,
+            seller=cls.seller,
+            buyer=cls.buyer,
+        )
+
+    def tearDown(self):
+        _buffer.clear()
+
+    async def connect(self, user, latest_message=0, roomname=None):
+        path = "/ws/chat/%s/" % (roomname or self.chatroom.name)
+        if latest_message is not None:
+            path += "?latest_message=%d" % latest_message
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_connect_not_participant(self):
+        stranger = await database_sync_to_async(UserFactory)(
+            phone_number="01033334444", username="tim"
+        )
+        for user, roomname in ((stranger, self.chatroom.name), (self.seller, "no_room")):
+            communicator = WebsocketCommunicator(
+                URLRouter(websocket_urlpatterns),
+                "/ws/chat/%s/?latest_message=0" % roomname,
+            )
+            communicator.scope["user"] = user
+            connected, _ = await communicator.connect()
+            self.assertFalse(connected)
+
+    async def test_users_leave(self):
+        seller = await self.connect(self.seller)
+        await seller.receive_json_from()
+
+        def leave(user):
+            user.is_active = False
+            user.save()
+
+        # participants are cached, the consumer is told to reload them
+        await seller.send_to(text_data=json.dumps({"chat": "안녕하세요"}))
+        self.assertEqual(len(await seller.receive_json_from()), 1)
+        await database_sync_to_async(leave)(self.seller)
+        await database_sync_to_async(leave)(self.buyer)
+        await seller.receive_nothing()
+
+        await seller.send_to(text_data=json.dumps({"chat": "안녕하세요"}))
+        self.assertTrue(await seller.receive_nothing())
+        await seller.disconnect()
+
+    async def test_chat_load(self):
+        seller = await self.connect(self.seller)
+        buyer = await self.connect(self.buyer)
+        self.assertEqual(await seller.receive_json_from(), [])
+        self.assertEqual(await buyer.receive_json_from(), [])
+
+        message_num = 250
+        for i in range(message_num):
+            await seller.send_to(text_data=json.dumps({"chat": "seller %d" % i}))
+            await buyer.send_to(text_data=json.dumps({"chat": "buyer %d" % i}))
+
+        received = {seller: [], buyer: []}
+        for communicator in (seller, buyer):
+            for _ in range(2 * message_num):
+                chats = await communicator.receive_json_from(timeout=5)
+                received[communicator].extend(chats)
+
+        # both sides get every message in id order, before anything is written
+        self.assertEqual(await database_sync_to_async(Chat.objects.count)(), 0)
+        ids = [chat["id"] for chat in received[seller]]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), 2 * message_num)
+        self.assertEqual(ids, [chat["id"] for chat in received[buyer]])
+        self.assertEqual(
+            [chat["is_sender"] for chat in received[seller]],
+            [not chat["is_sender"] for chat in received[buyer]],
+        )
+
+        def flush():
+            with CaptureQueriesContext(connection) as queries:
+                get_chat_buffer().flush()
+            return [query["sql"] for query in queries if query["sql"].startswith("INSERT")]
+
+        # one insert per flush_size messages
+        self.assertEqual(len(await database_sync_to_async(flush)()), 5)
+
+        chats = await database_sync_to_async(
+            lambda: list(
+                Chat.objects.order_by("id").values("id", "content", "sender_id")
+            )
+        )()
+        self.assertEqual([chat["id"] for chat in chats], ids)
+        self.assertEqual(
+            [chat["content"] for chat in chats],
+            [chat["content"] for chat in received[seller]],
+        )
+        senders = {"seller": self.seller.id, "buyer": self.buyer.id}
+        for chat in chats:
+            self.assertEqual(chat["sender_id"], senders[chat["content"].split()[0]])
+
+        await seller.disconnect()
+        await buyer.disconnect()
+
+    async def test_reconnect_replays_buffered(self):
+        seller = await self.connect(self.seller)
+        await seller.receive_json_from()
+        for i in range(3):
+            await seller.send_to(text_data=json.dumps({"chat": "chat %d" % i}))
+            await seller.receive_json_from()
+        await database_sync_to_async(get_chat_buffer().flush)()
+        for i in range(3, 5):
+            await seller.send_to(text_data=json.dumps({"chat": "chat %d" % i}))
+            chats = await seller.receive_json_from()
+        await seller.disconnect()
+
+        # written and buffered messages are replayed together
+        buyer = await self.connect(self.buyer)
+        unread = await buyer.receive_json_from()
+        self.assertEqual(
+            [chat["content"] for chat in unread], ["chat %d" % i for i in range(5)]
+        )
+        self.assertFalse(unread[0]["is_sender"])
+
+        buyer2 = await self.connect(self.buyer, latest_message=chats[0]["id"] - 1)
+        unread = await buyer2.receive_json_from()
+        self.assertEqual([chat["content"] for chat in unread], ["chat 4"])
+
+        await buyer.disconnect()
+        await buyer2.disconnect()
+
+    async def test_replay_bounded(self):
+        def create_chats(chat_num):
+            Chat.objects.bulk_create(
+                [
+                    Chat(
+                        chatroom=self.chatroom,
+                        sender=self.seller if i % 2 else self.buyer,
+                        content="chat %d" % i,
+                    )
+                    for i in range(chat_num)
+                ],
+                batch_size=5000,
+            )
+            return list(self.chatroom.chats.order_by("id").values_list("id", flat=True))
+
+        ids = await database_sync_to_async(create_chats)(50000)
+
+        # only the newest messages, in frames of BATCH_SIZE
+        buyer = await self.connect(self.buyer)
+        frames = [await buyer.receive_json_from() for _ in range(10)]
+        self.assertTrue(await buyer.receive_nothing())
+        self.assertEqual([len(frame) for frame in frames], [100] * 10)
+        replayed = [chat["id"] for frame in frames for chat in frame]
+        self.assertEqual(replayed, ids[-1000:])
+        self.assertEqual(frames[-1][-1]["content"], "chat 49999")
+        self.assertFalse(frames[-1][-1]["is_sender"])
+
+        # page backwards on demand
+        before = replayed[0]
+        for _ in range(3):
+            await buyer.send_json_to({"type": "history", "before": before, "size": 50})
+            history = await buyer.receive_json_from()
+            self.assertEqual(history["type"], "history")
+            self.assertTrue(history["has_more"])
+            self.assertEqual([chat["id"] for chat in history["chats"]], ids[-1050:-1000])
+            before = history["chats"][0]["id"]
+            ids = ids[:-50]
+
+        # size is capped at BATCH_SIZE
+        await buyer.send_json_to({"type": "history", "before": ids[100], "size": 1000})
+        history = await buyer.receive_json_from()
+        self.assertEqual([chat["id"] for chat in history["chats"]], ids[:100])
+        self.assertFalse(history["has_more"])
+        await buyer.disconnect()
+
+        # reconnect with the latest message
+        seller = await self.connect(self.seller, latest_message=replayed[-3])
+        unread = await seller.receive_json_from()
+        self.assertEqual([chat["id"] for chat in unread], replayed[-2:])
+        await seller.disconnect()
+
+    async def test_archived_history(self):
+        def create_chats():
+            Chat.objects.bulk_create(
+                [
+                    Chat(
+                        chatroom=self.chatroom,
+                        sender=self.seller if i % 2 else self.buyer,
+                        content="chat %d" % i,
+                    )
+                    for i in range(300)
+                ]
+            )
+            ids = list(self.chatroom.chats.order_by("id").values_list("id", flat=True))
+            Chat.objects.filter(id__lte=ids[249]).update(
+                created_at=timezone.now() - timedelta(days=365)
+            )
+            return ids
+
+        ids = await database_sync_to_async(create_chats)()
+        out = StringIO()
+        await database_sync_to_async(call_command)(
+            "archive_chats", "--batch-size=100", stdout=out
+        )
+        self.assertEqual(out.getvalue().strip(), "archived 250 chats")
+        self.assertEqual(await database_sync_to_async(Chat.objects.count)(), 50)
+        archives = await database_sync_to_async(
+            lambda: list(
+                ChatArchive.objects.order_by("id").values_list("chat_count", "archive")
+            )
+        )()
+        self.assertEqual([chat_count for chat_count, _ in archives], [100, 100, 50])
+        read_archive.cache_clear()
+
+        # history pages through the table and then the archives
+        buyer = await self.connect(self.buyer, latest_message=ids[-1])
+        self.assertEqual(await buyer.receive_json_from(), [])
+        history = []
+        before = ids[-1] + 1
+        while True:
+            await buyer.send_json_to({"type": "history", "before": before, "size": 70})
+            page = await buyer.receive_json_from()
+            history = page["chats"] + history
+            if not page["has_more"]:
+                break
+            before = page["chats"][0]["id"]
+        self.assertEqual([chat["id"] for chat in history], ids)
+        self.assertEqual(
+            [chat["content"] for chat in history], ["chat %d" % i for i in range(300)]
+        )
+        self.assertEqual(
+            [chat["is_sender"] for chat in history], [i % 2 == 0 for i in range(300)]
+        )
+        await buyer.disconnect()
+
+        # rooms of deleted articles are archived whole, the summary still has the
+        # last message and archives go with the room
+        def delete_article():
+            self.article.delete()
+            archive_chats(batch_size=100)
+            self.chatroom.refresh_from_db()
+            return build_summary(self.chatroom).last_chat_content
+
+        self.assertEqual(await database_sync_to_async(delete_article)(), "chat 299")
+        self.assertEqual(await database_sync_to_async(Chat.objects.count)(), 0)
+        names = await database_sync_to_async(
+            lambda: list(ChatArchive.objects.values_list("archive", flat=True))
+        )()
+        self.assertEqual(len(names), 4)
+        await database_sync_to_async(self.chatroom.delete)()
+        for name in names:
+            self.assertFalse(archive_storage().exists(name))
+
+    async def test_msgpack_encoding(self):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns),
+            "/ws/chat/%s/?latest_message=0" % self.chatroom.name,
+            subprotocols=["msgpack"],
+        )
+        communicator.scope["user"] = self.seller
+        connected, subprotocol = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(subprotocol, "msgpack")
+        self.assertEqual(msgpack.unpackb(await communicator.receive_from()), [])
+
+        # json clients in the same room are unaffected
+        buyer = await self.connect(self.buyer)
+        await buyer.receive_json_from()
+        await communicator.send_to(bytes_data=msgpack.packb({"chat": "안녕하세요"}))
+        chats = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(chats[0]["content"], "안녕하세요")
+        self.assertTrue(chats[0]["is_sender"])
+        self.assertFalse((await buyer.receive_json_from())[0]["is_sender"])
+
+        await communicator.send_to(
+            bytes_data=msgpack.packb({"type": "history", "before": chats[0]["id"] + 1})
+        )
+        history = msgpack.unpackb(await communicator.receive_from())
+        self.assertEqual(history["chats"], chats)
+        await communicator.disconnect()
+        await buyer.disconnect()
+
+        # or chosen by the query parameter
+        user = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), "/ws/chat/?encoding=msgpack"
+        )
+        user.scope["user"] = self.buyer
+        connected, subprotocol = await user.connect()
+        self.assertIsNone(subprotocol)
+        rooms = msgpack.unpackb(await user.receive_from())
+        self.assertEqual(rooms["rooms"][0]["last_message"]["content"], "안녕하세요")
+        await user.disconnect()
+
+    def test_flush_idempotent(self):
+        buffer = get_chat_buffer()
+        message = buffer.add(self.chatroom.id, self.seller.id, "안녕하세요")
+        buffer.flush()
+
+        # a batch retried after a failure is written once and not counted again
+        buffer.push(message)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(Chat.objects.count(), 1)
+        self.assertEqual(buffer.pending(self.chatroom.id), [])
+
+    async def connect_user(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/chat/")
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_user_channel(self):
+        seller = await self.connect(self.seller)
+        await seller.receive_json_from()
+        buyer = await self.connect_user(self.buyer)
+        rooms = await buyer.receive_json_from()
+        self.assertEqual(
+            rooms,
+            {
+                "type": "rooms",
+                "rooms": [
+                    {
+                        "room": self.chatroom.name,
+                        "last_message": None,
+                        "last_read": 0,
+                        "unread": 0,
+                    }
+                ],
+            },
+        )
+
+        # messages of every room with unread counts
+        for i in range(2):
+            await seller.send_to(text_data=json.dumps({"chat": "chat %d" % i}))
+            await seller.receive_json_from()
+            notification = await buyer.receive_json_from()
+            self.assertEqual(notification["type"], "chat")
+            self.assertEqual(notification["room"], self.chatroom.name)
+            self.assertEqual(notification["chat"]["content"], "chat %d" % i)
+            self.assertFalse(notification["chat"]["is_sender"])
+            self.assertEqual(notification["unread"], i + 1)
+
+        await buyer.send_json_to({"type": "read", "room": self.chatroom.name})
+        read = await buyer.receive_json_from()
+        self.assertEqual(read["last_read"], notification["chat"]["id"])
+        self.assertEqual(read["unread"], 0)
+        await seller.send_to(text_data=json.dumps({"chat": "chat 2"}))
+        await seller.receive_json_from()
+        self.assertEqual((await buyer.receive_json_from())["unread"], 1)
+
+        # send through the user channel
+        await buyer.send_json_to({"type": "chat", "room": self.chatroom.name, "chat": "네"})
+        self.assertEqual((await seller.receive_json_from())[0]["content"], "네")
+        notification = await buyer.receive_json_from()
+        self.assertTrue(notification["chat"]["is_sender"])
+
+        await buyer.send_json_to(
+            {
+                "type": "history",
+                "room": self.chatroom.name,
+                "before": notification["chat"]["id"],
+            }
+        )
+        history = await buyer.receive_json_from()
+        self.assertEqual(
+            [chat["content"] for chat in history["chats"]], ["chat 0", "chat 1", "chat 2"]
+        )
+        await buyer.disconnect()
+
+        # last message preview on connect
+        buyer = await self.connect_user(self.buyer)
+        rooms = (await buyer.receive_json_from())["rooms"]
+        self.assertEqual(rooms[0]["last_message"]["content"], "네")
+        self.assertTrue(rooms[0]["last_message"]["is_sender"])
+        await buyer.disconnect()
+        await seller.disconnect()
+
+    async def test_read_cursor(self):
+        seller = await self.connect(self.seller)
+        await seller.receive_json_from()
+        chats = []
+        for i in range(5):
+            await seller.send_to(text_data=json.dumps({"chat": "chat %d" % i}))
+            chats += await seller.receive_json_from()
+        await database_sync_to_async(get_chat_buffer().flush)()
+        await seller.send_to(text_data=json.dumps({"chat": "chat 5"}))
+        chats += await seller.receive_json_from()
+
+        # without latest_message the replay starts at the read cursor
+        buyer = await self.connect(self.buyer, latest_message=None)
+        self.assertEqual(len(await buyer.receive_json_from()), 6)
+        user = await self.connect_user(self.buyer)
+        rooms = (await user.receive_json_from())["rooms"]
+        self.assertEqual(rooms[0]["unread"], 6)
+
+        # written and buffered messages after the cursor are counted
+        await buyer.send_json_to({"type": "read", "chat_id": chats[2]["id"]})
+        self.assertEqual(
+            await buyer.receive_json_from(),
+            {"type": "read", "last_read": chats[2]["id"], "unread": 3},
+        )
+        read = await user.receive_json_from()
+        self.assertEqual((read["type"], read["unread"]), ("read", 3))
+
+        # cursors only move forward
+        await buyer.send_json_to({"type": "read", "chat_id": chats[0]["id"]})
+        self.assertEqual((await buyer.receive_json_from())["last_read"], chats[2]["id"])
+        await user.receive_json_from()
+        await buyer.disconnect()
+
+        buyer = await self.connect(self.buyer, latest_message=None)
+        replayed = await buyer.receive_json_from()
+        self.assertEqual([chat["content"] for chat in replayed], ["chat 3", "chat 4", "chat 5"])
+
+        # the buffered message is counted once it is written
+        await database_sync_to_async(get_chat_buffer().flush)()
+        summary = await database_sync_to_async(ChatRoomSummary.objects.get)(
+            chatroom=self.chatroom
+        )
+        self.assertEqual(summary.buyer_unread, 3)
+        self.assertEqual(summary.seller_unread, 0)
+
+        await buyer.send_json_to({"type": "read"})
+        self.assertEqual(
+            await buyer.receive_json_from(),
+            {"type": "read", "last_read": chats[-1]["id"], "unread": 0},
+        )
+        chatroom = await database_sync_to_async(ChatRoom.objects.get)(id=self.chatroom.id)
+        self.assertEqual(
+            (chatroom.buyer_last_read, chatroom.seller_last_read), (chats[-1]["id"], 0)
+        )
+        await buyer.disconnect()
+        await user.disconnect()
+        await seller.disconnect()
+
+    async def test_user_channel_rooms(self):
+        buyer = await self.connect_user(self.buyer)
+        await buyer.receive_json_from()
+
+        await buyer.send_json_to({"type": "chat", "room": "no_room", "chat": "안녕하세요"})
+        self.assertEqual((await buyer.receive_json_from())["type"], "error")
+
+        # rooms created after connect
+        def create_chatroom():
+            article = ArticleFactory(
+                seller=self.seller, title="의자 판매", content="", category="가구"
+            )
+            return ChatRoom.objects.create(
+                name="%d_%d" % (self.buyer.id, article.id),
+                article=article,
+                seller=self.seller,
+                buyer=self.buyer,
+            )
+
+        chatroom = await database_sync_to_async(create_chatroom)()
+        await buyer.send_json_to({"type": "chat", "room": chatroom.name, "chat": "안녕하세요"})
+        notification = await buyer.receive_json_from()
+        self.assertEqual(notification["room"], chatroom.name)
+        await buyer.disconnect()
+
+
+@override_settings(
+    CHAT_BUFFER={"FLUSH_SIZE": 100, "FLUSH_INTERVAL": None},
+    DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+    MEDIA_ROOT=tempfile.mkdtemp(),
+)
+class ChatRoomListTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        _buffer.clear()
+        cls.location = LocationFactory(
+            code="1111011700",
+            place_name="서울특별시 종로구 당주동",
+        )
+        cls.seller = UserFactory(
+            phone_number="01011112222",
+            username="steve",
+            location=cls.location,
+        )
+        cls.seller_token = "JWT " + jwt_token_of(cls.seller)
+        cls.article = ArticleFactory(
+            seller=cls.seller,
+            location=cls.location,
+            price=3040000,
+            title="맥북 판매",
+            content="성능 좋은 맥북 판매해요.",
+            category="디지털기기",
+        )
+        for i in range(2):
+            ProductImage.objects.create(
+                article=cls.article, product_image="product_image/macbook_%d" % i
+            )
+
+    def tearDown(self):
+        _buffer.clear()
+
+    def create_chatroom(self, i):
+        buyer = UserFactory(phone_number="0102222%04d" % i, username="buyer%d" % i)
+        return ChatRoom.objects.create(
+            name="%d_%d" % (buyer.id, self.article.id),
+            article=self.article,
+            seller=self.seller,
+            buyer=buyer,
+        )
+
+    def get_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/chat/", HTTP_AUTHORIZATION=self.seller_token)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_list_queries(self):
+        chatroom = self.create_chatroom(0)
+        rooms, single_query_cnt = self.get_list()
+        self.assertEqual(len(rooms), 1)
+
+        for i in range(1, 20):
+            self.create_chatroom(i)
+        rooms, query_cnt = self.get_list()
+        self.assertEqual(len(rooms), 20)
+        self.assertEqual(query_cnt, single_query_cnt)
+
+        room = rooms[0]
+        self.assertEqual(room["roomname"], chatroom.name)
+        self.assertEqual(room["username"], "buyer0")
+        self.assertEqual(room["location"]["place_name"], "서울특별시 종로구 당주동")
+        self.assertEqual(room["article_id"], self.article.id)
+        self.assertTrue(room["product_image"]["image_url"].endswith("macbook_0"))
+        self.assertIsNone(room["last_message"])
+        self.assertEqual(room["unread"], 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/v1/chat/%d/" % self.article.id, HTTP_AUTHORIZATION=self.seller_token
+            )
+        self.assertEqual(len(response.json()), 20)
+        # the article and its seller are checked first
+        self.assertEqual(len(queries), single_query_cnt + 3)
+
+    @override_settings(PRODUCT_IMAGE_WORKERS=0)
+    def test_summary_article_saves(self):
+        article = ArticleFactory(
+            seller=self.seller,
+            location=self.location,
+            price=10000,
+            title="의자 판매",
+            content="튼튼한 의자 판매해요.",
+            category="가구/인테리어",
+        )
+        buyer = UserFactory(phone_number="01033334444", username="buyer")
+        chatroom = ChatRoom.objects.create(
+            name="%d_%d" % (buyer.id, article.id), article=article, seller=self.seller, buyer=buyer
+        )
+
+        # saves that add no images leave the summaries alone
+        article.price = 20000
+        with CaptureQueriesContext(connection) as queries:
+            article.save()
+        self.assertFalse(
+            any(ChatRoomSummary._meta.db_table in query["sql"] for query in queries)
+        )
+
+        # images added before the save are given to rooms without one
+        content = BytesIO()
+        Image.new("RGB", (60, 40), "green").save(content, format="PNG")
+        ingest_product_images(
+            article, [SimpleUploadedFile("chair.png", content.getvalue(), content_type="image/png")]
+        )
+        article.save()
+        self.assertIsNotNone(ChatRoomSummary.objects.get(chatroom=chatroom).product_image)
+
+        # listing a room without a summary writes nothing
+        chatroom.summary.delete()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/v1/chat/", HTTP_AUTHORIZATION=self.seller_token)
+        room = [room for room in response.json() if room["roomname"] == chatroom.name][0]
+        self.assertIsNone(room["last_message"])
+        self.assertEqual(room["unread"], 0)
+        self.assertFalse(any(query["sql"].startswith("INSERT") for query in queries))
+
+    def test_buffer_ids(self):
+        chatroom = self.create_chatroom(0)
+        # a chat written outside of the buffers
+        outside = Chat.objects.create(chatroom=chatroom, sender=self.seller, content="outside")
+
+        # buffers of two workers take blocks of ids from the same sequence
+        buffers = [
+            LocalChatBuffer(id_block_size=3, flush_size=100, flush_interval=None)
+            for _ in range(2)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            messages = [
+                buffers[i % 2].add(chatroom.id, chatroom.buyer_id, "chat %d" % i)
+                for i in range(6)
+            ]
+        # one reservation per block
+        self.assertEqual(
+            len([query for query in queries if query["sql"].startswith("UPDATE")]), 3
+        )
+        ids = [message["id"] for message in messages]
+        first_id = outside.id + 1
+        self.assertEqual(
+            ids,
+            [first_id, first_id + 3, first_id + 1, first_id + 4, first_id + 2, first_id + 5],
+        )
+        for buffer in buffers:
+            buffer.flush()
+        self.assertEqual(chatroom.chats.count(), 7)
+        self.assertEqual(ChatRoomSummary.objects.get(chatroom=chatroom).seller_unread, 6)
+
+        # a message whose id holds another chat is logged and dropped, later
+        # messages are still written
+        buffers[0].push(
+            {"id": ids[1], "chatroom_id": chatroom.id, "sender_id": self.seller.id, "content": "x"}
+        )
+        later = buffers[0].add(chatroom.id, chatroom.buyer_id, "later")
+        with self.assertLogs("chat.buffer", "ERROR") as logs:
+            self.assertEqual(buffers[0].flush(), 1)
+        self.assertIn("chat %d collides" % ids[1], logs.output[0])
+        self.assertEqual(buffers[0].messages(), [])
+        self.assertEqual(chatroom.chats.get(id=ids[1]).content, "chat 1")
+        self.assertEqual(chatroom.chats.get(id=later["id"]).content, "later")
+
+        # an id taken by a concurrent write falls back to row by row inserts
+        taken = buffers[1].add(chatroom.id, chatroom.buyer_id, "taken")
+        after = buffers[1].add(chatroom.id, chatroom.buyer_id, "after")
+        with patch("chat.buffer.unwritten", side_effect=lambda messages: (messages, [])):
+            Chat.objects.create(
+                id=taken["id"], chatroom=chatroom, sender=self.seller, content="outside"
+            )
+            with self.assertLogs("chat.buffer", "ERROR") as logs:
+                self.assertEqual(buffers[1].flush(), 1)
+        self.assertIn("chat %d collides" % taken["id"], logs.output[0])
+        self.assertEqual(buffers[1].messages(), [])
+        self.assertEqual(chatroom.chats.get(id=after["id"]).content, "after")
+
+    def test_summary_on_write(self):
+        chatroom = self.create_chatroom(0)
+        buffer = get_chat_buffer()
+        for i in range(3):
+            buffer.add(chatroom.id, chatroom.buyer_id, "chat %d" % i)
+        buffer.add(chatroom.id, self.seller.id, "답장")
+        buffer.add(chatroom.id, chatroom.buyer_id, "chat 3")
+        buffer.flush()
+
+        room = self.get_list()[0][0]
+        self.assertEqual(room["last_message"]["content"], "chat 3")
+        self.assertFalse(room["last_message"]["is_sender"])
+        self.assertEqual(room["unread"], 4)
+        summary = ChatRoomSummary.objects.get(chatroom=chatroom)
+        self.assertEqual(summary.buyer_unread, 1)
+
+        # a retried batch does not move the last message back
+        buffer.push(
+            {
+                "id": summary.last_chat_id - 1,
+                "chatroom_id": chatroom.id,
+                "sender_id": self.seller.id,
+                "content": "답장",
+            }
+        )
+        buffer.flush()
+        self.assertEqual(self.get_list()[0][0]["last_message"]["content"], "chat 3")
+        # nor counts its messages again
+        self.assertEqual(ChatRoomSummary.objects.get(chatroom=chatroom).seller_unread, 4)
+
+        # the first remaining image after a delete
+        ProductImage.objects.filter(article=self.article).order_by("id").first().delete()
+        room = self.get_list()[0][0]
+        self.assertTrue(room["product_image"]["image_url"].endswith("macbook_1"))
+
+        # rebuilt from the chats, unread counts are kept
+        ChatRoomSummary.objects.update(last_chat_id=None, last_chat_content="")
+        self.create_chatroom(1).summary.delete()
+        out = StringIO()
+        call_command("rebuild_chat_summaries", stdout=out)
+        self.assertEqual(out.getvalue().strip(), "rebuilt 2 chat room summaries")
+        summary = ChatRoomSummary.objects.get(chatroom=chatroom)
+        self.assertEqual(summary.last_chat_content, "chat 3")
+        self.assertEqual(summary.seller_unread, 4)
+        self.assertEqual(ChatRoomSummary.objects.count(), 2)
@@ -2,12 +2,12 @@ from email import charset
 from rest_framework import status, viewsets, permissions
 from rest_framework.response import Response
 
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 
 from article.models import Article
 from chat.models import ChatRoom
 from chat.serializers import ChatRoomSerializer
+from chat.services import prefetch_chatrooms, user_chatrooms
 
 
 class ChatRoomViewSet(viewsets.GenericViewSet):
@@ -38,10 +38,7 @@ class ChatRoomViewSet(viewsets.GenericViewSet):
     # show all chatrooms of user
     def list(self, request):
         user = request.user
-        chatrooms = self.queryset.filter(
-            (Q(seller=user) & Q(valid_user__contains="s"))
-            | (Q(buyer=user) & Q(valid_user__contains="b"))
-        ).exclude(article__isnull=True)
+        chatrooms = prefetch_chatrooms(user_chatrooms(user))
         return Response(
             ChatRoomSerializer(chatrooms, many=True, context={"user": user}).data,
             status=status.HTTP_200_OK,
@@ -60,7 +57,7 @@ class ChatRoomViewSet(viewsets.GenericViewSet):
         if article.seller != user:
             return Response("해당 유저의 상품이 아닙니다.", status=status.HTTP_403_FORBIDDEN)
 
-        chatrooms = article.chatrooms.filter(valid_user__contains="s")
+        chatrooms = prefetch_chatrooms(article.chatrooms.filter(valid_user__contains="s"))
         return Response(
             ChatRoomSerializer(chatrooms, many=True, context={"user": user}).data,
             status=status.HTTP_200_OK,
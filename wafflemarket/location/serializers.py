@@ -2,6 +2,7 @@ from rest_framework import serializers
 
 from user.models import User
 from location.models import Location
+from location.services import get_location, get_neighborhoods
 
 # response serializer for [GET]location
 class LocationSerializer(serializers.ModelSerializer):
@@ -62,3 +63,15 @@ class UserLocationValidator(serializers.Serializer):
         user.location = validated_data.get("location", user.location)
         user.save()
         return user
+
+
+# request validator for [GET]location/neighborhood, reads the cached neighborhood map
+class NeighborhoodValidator(serializers.Serializer):
+    location_code = serializers.CharField(required=True)
+
+    def validate(self, data):
+        location = get_location(data.get("location_code"))
+        if location is None:
+            raise serializers.ValidationError("올바른 지역코드가 아닙니다.")
+        data["neighborhoods"] = get_neighborhoods(location.id)
+        return data
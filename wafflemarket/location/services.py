@@ -0,0 +1,105 @@
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from location.models import Location, LocationNeighborhood
+
+
+Neighborhood = namedtuple("Neighborhood", ("id", "code", "place_name"))
+
+NEIGHBORHOOD_VERSION_KEY = "location:neighborhood:version"
+NEIGHBORHOOD_MAP_KEY = "location:neighborhood:%s"
+
+
+# location id -> tuple of its neighborhoods, loaded once per worker
+class NeighborhoodMap:
+    def __init__(self, version, locations, neighborhoods):
+        self.version = version
+        self.locations = locations
+        self.codes = {location.code: location for location in locations.values()}
+        self.neighborhoods = neighborhoods
+
+    @classmethod
+    def load(cls, version):
+        locations = {
+            id: Neighborhood(id, code, place_name)
+            for id, code, place_name in Location.objects.values_list("id", "code", "place_name")
+        }
+        neighborhoods = {}
+        for location_id, neighborhood_id in LocationNeighborhood.objects.order_by("id").values_list(
+            "location_id", "neighborhood_id"
+        ):
+            neighborhoods.setdefault(location_id, []).append(locations[neighborhood_id])
+        neighborhoods = {id: tuple(neighbors) for id, neighbors in neighborhoods.items()}
+        return cls(version, locations, neighborhoods)
+
+
+_lock = threading.Lock()
+_local = {"version": 0, "map": None}
+
+
+# shared cache keeps version (and map) in sync between workers, None for process local
+def get_shared_cache():
+    alias = getattr(settings, "NEIGHBORHOOD_CACHE", None)
+    if alias is None:
+        return None
+    return caches[alias]
+
+
+def get_neighborhood_version():
+    cache = get_shared_cache()
+    if cache is None:
+        return _local["version"]
+    return cache.get_or_set(NEIGHBORHOOD_VERSION_KEY, 0, timeout=None)
+
+
+def get_neighborhood_map():
+    version = get_neighborhood_version()
+    neighborhood_map = _local["map"]
+    if neighborhood_map is not None and neighborhood_map.version == version:
+        return neighborhood_map
+
+    with _lock:
+        neighborhood_map = _local["map"]
+        if neighborhood_map is not None and neighborhood_map.version == version:
+            return neighborhood_map
+
+        cache = get_shared_cache()
+        if cache is not None:
+            neighborhood_map = cache.get(NEIGHBORHOOD_MAP_KEY % version)
+        if neighborhood_map is None:
+            neighborhood_map = NeighborhoodMap.load(version)
+            if cache is not None:
+                cache.set(NEIGHBORHOOD_MAP_KEY % version, neighborhood_map, timeout=None)
+        _local["map"] = neighborhood_map
+        return neighborhood_map
+
+
+# called when Location or LocationNeighborhood rows change
+def invalidate_neighborhoods():
+    with _lock:
+        _local["version"] += 1
+        _local["map"] = None
+    cache = get_shared_cache()
+    if cache is not None:
+        try:
+            cache.incr(NEIGHBORHOOD_VERSION_KEY)
+        except ValueError:
+            cache.set(NEIGHBORHOOD_VERSION_KEY, 1, timeout=None)
+
+
+def get_location(code):
+    return get_neighborhood_map().codes.get(code)
+
+
+def get_neighborhoods(location_id):
+    return get_neighborhood_map().neighborhoods.get(location_id, ())
+
+
+# location itself and its neighborhoods, to filter articles of neighborhood
+def get_neighborhood_ids(location_id):
+    return (location_id,) + tuple(
+        neighborhood.id for neighborhood in get_neighborhoods(location_id)
+    )
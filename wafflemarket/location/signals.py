@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from location.models import Location, LocationNeighborhood
+from location.services import invalidate_neighborhoods
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+@receiver(post_save, sender=LocationNeighborhood)
+@receiver(post_delete, sender=LocationNeighborhood)
+def update_neighborhood_version(sender, **kwargs):
+    # again on commit, so that other workers do not reload uncommitted rows
+    invalidate_neighborhoods()
+    transaction.on_commit(invalidate_neighborhoods)
@@ -7,6 +7,12 @@ from user.models import User
 from user.serializers import jwt_token_of
 from user.tests import UserFactory
 from location.models import Location, LocationNeighborhood
+from location.services import (
+    get_location,
+    get_neighborhood_ids,
+    get_neighborhood_map,
+    get_neighborhoods,
+)
 
 
 class LocationFactory(DjangoModelFactory):
@@ -186,3 +192,72 @@ class GetNeighborhoodTestCase(TestCase):
         self.assertEqual(
             {res_data[0]["code"], res_data[1]["code"]}, {"1111011100", "1111010100"}
         )
+
+
+class NeighborhoodMapTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user = UserFactory(
+            phone_number="01011112222",
+            email="wafflemarket@test.com",
+            username="steve",
+        )
+        cls.user_token = "JWT " + jwt_token_of(
+            User.objects.get(phone_number="01011112222")
+        )
+        cls.location1 = LocationFactory(
+            code="1111011700",
+            place_name="서울특별시 종로구 당주동",
+        )
+        cls.location2 = LocationFactory(
+            code="1111011100",
+            place_name="서울특별시 종로구 옥인동",
+        )
+        LocationNeighborhood.objects.create(
+            location=cls.location1, neighborhood=cls.location2
+        )
+
+    def test_neighborhood_map_cached(self):
+        # loaded once, then read without database
+        self.assertEqual(get_neighborhood_ids(self.location1.id), (self.location1.id, self.location2.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(get_location("1111011700").id, self.location1.id)
+            self.assertEqual(get_neighborhood_ids(self.location2.id), (self.location2.id,))
+
+    def test_neighborhood_map_invalidated(self):
+        get_neighborhood_map()
+        location3 = LocationFactory(
+            code="1111010100",
+            place_name="서울특별시 종로구 청운동",
+        )
+        neighborhood = LocationNeighborhood.objects.create(
+            location=self.location1, neighborhood=location3
+        )
+        self.assertEqual(
+            [location.code for location in get_neighborhoods(self.location1.id)],
+            ["1111011100", "1111010100"],
+        )
+
+        neighborhood.delete()
+        self.assertEqual(
+            [location.code for location in get_neighborhoods(self.location1.id)],
+            ["1111011100"],
+        )
+
+    def test_get_neighborhood_view(self):
+        get_neighborhood_map()
+        with self.assertNumQueries(1):
+            # only the user is loaded for authentication
+            response = self.client.get(
+                "/api/v1/location/1111011700/neighborhood/", HTTP_AUTHORIZATION=self.user_token
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(), [{"place_name": "서울특별시 종로구 옥인동", "code": "1111011100"}]
+        )
+
+        response = self.client.get(
+            "/api/v1/location/1111011701/neighborhood/", HTTP_AUTHORIZATION=self.user_token
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()["non_field_errors"], ["올바른 지역코드가 아닙니다."])
@@ -3,10 +3,10 @@ from rest_framework import status, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from location.models import Location
 from location.serializers import (
     LocationSerializer,
     NeighborhoodSerializer,
+    NeighborhoodValidator,
     UserLocationSerializer,
     UserLocationValidator,
 )
@@ -41,10 +41,9 @@ class NeighborhoodView(APIView):
     @swagger_auto_schema(responses={200: NeighborhoodSerializer(many=True)})
     # returns neighborhood of given location
     def get(self, request, location_code):
-        serializer = UserLocationValidator(data={"location_code": location_code})
+        serializer = NeighborhoodValidator(data={"location_code": location_code})
         serializer.is_valid(raise_exception=True)
-        location = Location.objects.get(code=serializer.data.get("location_code"))
         return Response(
-            NeighborhoodSerializer(location.neighborhoods, many=True).data,
+            LocationSerializer(serializer.validated_data["neighborhoods"], many=True).data,
             status=status.HTTP_200_OK,
         )
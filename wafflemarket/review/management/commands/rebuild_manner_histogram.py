@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from review.services import rebuild_histograms
+
+
+class Command(BaseCommand):
+    help = "Rebuild manner histograms of every user from reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user_cnt = rebuild_histograms(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("rebuilt manner histogram of %d users" % user_cnt))
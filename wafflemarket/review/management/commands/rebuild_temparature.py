@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from review.services import rebuild_temparatures
+
+
+class Command(BaseCommand):
+    help = "Rebuild temparature aggregates of every user from articles and reviews"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(user_cnt):
+            if options["verbosity"] >= 2:
+                elapsed = time.perf_counter() - start
+                self.stdout.write("%d users, %.0f users/s" % (user_cnt, user_cnt / elapsed))
+
+        user_cnt = rebuild_temparatures(batch_size=options["batch_size"], progress=progress)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                "rebuilt temparature of %d users in %.2fs (%.0f users/s)"
+                % (user_cnt, elapsed, user_cnt / elapsed if elapsed else 0)
+            )
+        )
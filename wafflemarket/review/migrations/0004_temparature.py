@@ -0,0 +1,32 @@
+# Generated by Django 3.2.6 on 2026-10-18 12:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('review', '0003_alter_review_article'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Temparature',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('article_cnt', models.PositiveIntegerField(default=0)),
+                ('article_sold_cnt', models.PositiveIntegerField(default=0)),
+                ('article_bought_cnt', models.PositiveIntegerField(default=0)),
+                ('seller_good_manner', models.PositiveIntegerField(default=0)),
+                ('seller_bad_manner', models.PositiveIntegerField(default=0)),
+                ('buyer_good_manner', models.PositiveIntegerField(default=0)),
+                ('buyer_bad_manner', models.PositiveIntegerField(default=0)),
+                ('user_good_manner', models.PositiveIntegerField(default=0)),
+                ('user_bad_manner', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tempfield', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('review', '0004_temparature'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MannerHistogram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('good_manner', models.BinaryField(default=b'', max_length=32)),
+                ('bad_manner', models.BinaryField(default=b'', max_length=60)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='manner_histogram', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
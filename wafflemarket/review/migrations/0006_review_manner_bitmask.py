@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+import wafflemarket.fields
+from wafflemarket.fields import mask_from_string, mask_to_string
+
+
+# rows of queryset in pk order, at most batch_size of them in memory at a time
+def batches(queryset, batch_size=1000):
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+# widths of the flag strings written by review.serializers
+def manner_width(review):
+    if review.review_type == "user":
+        return 3 if review.manner_type == "good" else 2
+    return 8 if review.manner_type == "good" else 15
+
+
+def manner_to_mask(apps, schema_editor):
+    Review = apps.get_model("review", "Review")
+    for reviews in batches(Review.objects.only("id", "manner")):
+        for review in reviews:
+            review.manner_mask = mask_from_string(review.manner)
+        Review.objects.bulk_update(reviews, ["manner_mask"])
+
+
+def mask_to_manner(apps, schema_editor):
+    Review = apps.get_model("review", "Review")
+    for reviews in batches(Review.objects.only("id", "review_type", "manner_type", "manner_mask")):
+        for review in reviews:
+            review.manner = mask_to_string(review.manner_mask, manner_width(review))
+        Review.objects.bulk_update(reviews, ["manner"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0005_mannerhistogram'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='review',
+            name='manner_mask',
+            field=wafflemarket.fields.BitmaskField(default=0),
+        ),
+        migrations.RunPython(manner_to_mask, mask_to_manner),
+        # a default lets the reverse migration add the column back to filled tables
+        migrations.AlterField(
+            model_name='review',
+            name='manner',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RemoveField(
+            model_name='review',
+            name='manner',
+        ),
+        migrations.RenameField(
+            model_name='review',
+            old_name='manner_mask',
+            new_name='manner',
+        ),
+    ]
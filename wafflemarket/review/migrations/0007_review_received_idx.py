@@ -0,0 +1,17 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0006_review_manner_bitmask'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['reviewyee', 'review_type', 'created_at', 'id'], name='review_received_idx'),
+        ),
+    ]
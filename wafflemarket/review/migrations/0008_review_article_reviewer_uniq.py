@@ -0,0 +1,56 @@
+# Generated by Django 3.2.6 on 2026-10-18 13:45
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+from review.services import manner_bits, manner_field, temparature_of
+
+
+# reviews written twice by concurrent requests before the constraint, the
+# earliest one is kept. historical models send no signals, so the aggregates of
+# the reviewyees are corrected here and their histograms rebuilt on next read
+def delete_duplicate_reviews(apps, schema_editor):
+    Review = apps.get_model("review", "Review")
+    Temparature = apps.get_model("review", "Temparature")
+    MannerHistogram = apps.get_model("review", "MannerHistogram")
+    User = apps.get_model("user", "User")
+
+    groups = (
+        Review.objects.filter(article__isnull=False, reviewer__isnull=False)
+        .values("article", "reviewer", "review_type")
+        .annotate(review_cnt=Count("id"), first_id=Min("id"))
+        .filter(review_cnt__gt=1)
+    )
+    for group in groups:
+        duplicates = list(
+            Review.objects.filter(
+                article=group["article"],
+                reviewer=group["reviewer"],
+                review_type=group["review_type"],
+                id__gt=group["first_id"],
+            )
+        )
+        for review in duplicates:
+            field = manner_field(review.review_type, review.manner_type)
+            temp = Temparature.objects.filter(user_id=review.reviewyee_id).first()
+            if temp is not None and field is not None:
+                setattr(temp, field, max(getattr(temp, field) - manner_bits(review.manner), 0))
+                temp.save(update_fields=[field])
+                User.objects.filter(id=review.reviewyee_id).update(temparature=temparature_of(temp))
+            MannerHistogram.objects.filter(user_id=review.reviewyee_id).delete()
+        Review.objects.filter(id__in=[review.id for review in duplicates]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('review', '0007_review_received_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_reviews, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='review',
+            constraint=models.UniqueConstraint(fields=('article', 'reviewer', 'review_type'), name='review_article_reviewer_uniq'),
+        ),
+    ]
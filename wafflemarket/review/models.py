@@ -1,11 +1,12 @@
 import datetime
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from user.models import User
 from location.models import Location
 from article.models import Article
+from wafflemarket.fields import BitmaskField
 
 class Review(models.Model):
     
@@ -31,4 +32,51 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     manner_type = models.CharField(max_length=20, choices = MANNER_TYPE_CHOICES)
-    manner = models.CharField(max_length=100)
+    # bit i for manner code i of review.serializers
+    manner = BitmaskField(default=0)
+
+    class Meta:
+        indexes = [
+            # reviews a user received, paginated by (created_at, id)
+            models.Index(
+                fields=["reviewyee", "review_type", "created_at", "id"],
+                name="review_received_idx",
+            ),
+        ]
+        constraints = [
+            # one review per article and reviewer, checked by review.services.create_article_review
+            models.UniqueConstraint(
+                fields=["article", "reviewer", "review_type"], name="review_article_reviewer_uniq"
+            ),
+        ]
+
+    # temparature and histogram deltas of review.signals commit with the row
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+
+# per-user aggregates used to compute temparature, maintained by review.signals
+class Temparature(models.Model):
+    user = models.OneToOneField(User, related_name="tempfield", on_delete=models.CASCADE)
+
+    article_cnt = models.PositiveIntegerField(default=0)
+    article_sold_cnt = models.PositiveIntegerField(default=0)
+    article_bought_cnt = models.PositiveIntegerField(default=0)
+
+    # sum of manner bits per (review_type, manner_type)
+    seller_good_manner = models.PositiveIntegerField(default=0)
+    seller_bad_manner = models.PositiveIntegerField(default=0)
+    buyer_good_manner = models.PositiveIntegerField(default=0)
+    buyer_bad_manner = models.PositiveIntegerField(default=0)
+    user_good_manner = models.PositiveIntegerField(default=0)
+    user_bad_manner = models.PositiveIntegerField(default=0)
+
+
+# distinct reviewers per manner code of the reviews a user received, packed as
+# little-endian uint32 arrays, maintained by review.signals
+class MannerHistogram(models.Model):
+    user = models.OneToOneField(User, related_name="manner_histogram", on_delete=models.CASCADE)
+
+    good_manner = models.BinaryField(max_length=32, default=b"")
+    bad_manner = models.BinaryField(max_length=60, default=b"")
@@ -1,12 +1,20 @@
 from rest_framework import serializers
 
-from django.db.models import Q
-
 from user.models import User
 from review.models import Review
+from review.services import (
+    REVIEW_PAGE_SIZE,
+    REVIEW_MAX_PAGE_SIZE,
+    manner_histogram,
+    prefetch_reviews,
+    received_reviews,
+    review_summary,
+)
+from wafflemarket.fields import codes_of, mask_of
 from location.models import Location
 from location.serializers import LocationSerializer
 from user.serializers import UserSimpleSerializer
+from article.serializers import ArticleCursorValidator
 
 class ReviewArticleValidator(serializers.Serializer):
     review = serializers.CharField(required=False)
@@ -43,33 +51,23 @@ class ReviewArticleValidator(serializers.Serializer):
             "약속 장소에 나타나지 않았어요." : 14,
         }
     
-    # convert manner list to string
+    # convert manner list to bitmask
     @classmethod
-    def create_manner_string(cls, manner_type, manner_list):
+    def create_manner_mask(cls, manner_type, manner_list):
         if manner_list is None:
             raise serializers.ValidationError("매너평가를 입력해주세요.")
         
         if manner_type=="good":
-            try:
-                manner = ["0"]*8
-                for i in manner_list:
-                    manner[cls.good_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
+            manner_code = cls.good_manner_code
         elif manner_type=="bad":
-            try:
-                manner = ["0"]*15
-                for i in manner_list:
-                    manner[cls.bad_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
+            manner_code = cls.bad_manner_code
         else:
             raise serializers.ValidationError("매너칭찬, 비매너평가 중 하나를 선택해야 합니다.")
         
-        manner = "".join(manner)
-        return manner
+        try:
+            return mask_of(manner_code[i] for i in manner_list)
+        except KeyError:
+            raise serializers.ValidationError("올바른 평가를 입력해주세요.")
     
     def validate(self, data):
         review = data.get("review", None)
@@ -77,7 +75,7 @@ class ReviewArticleValidator(serializers.Serializer):
         manner_list = data.get("manner_list")
         return {"review" : review,
                 "manner_type" : manner_type,
-                "manner" : self.create_manner_string(manner_type, manner_list)}
+                "manner" : self.create_manner_mask(manner_type, manner_list)}
     
 
 class ReviewArticleSerializer(serializers.ModelSerializer):
@@ -127,20 +125,11 @@ class ReviewArticleSerializer(serializers.ModelSerializer):
             14 : "약속 장소에 나타나지 않았어요."
         }
         
-        manner_list = []
-        manner = review.manner
-        
         if review.manner_type=="good":
-            for i, v in enumerate(manner):
-                if v == "1":
-                    manner_list.append(code_good_manner[i])
-                    
+            return [code_good_manner[i] for i in codes_of(review.manner, len(code_good_manner))]
         elif review.manner_type=="bad":
-            for i, v in enumerate(manner):
-                if v == "1":
-                    manner_list.append(code_bad_manner[i])
-                    
-        return manner_list
+            return [code_bad_manner[i] for i in codes_of(review.manner, len(code_bad_manner))]
+        return []
     
     def get_type(self, review):
         return self.context["type"]
@@ -163,76 +152,41 @@ class ReviewUserValidator(serializers.Serializer):
             "불친절해요." : 1,
         }
     
-    # convert manner list to string
+    # convert manner list to bitmask
     @classmethod
-    def create_manner_string(cls, manner_type, manner_list):
-        if manner_list is None:
-            raise serializers.ValidationError("매너평가를 입력해주세요.")
-        
-        if manner_type=="good":
-            try:
-                manner = ["0"]*3
-                for i in manner_list:
-                    manner[cls.good_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
-        elif manner_type=="bad":
-            try:
-                manner = ["0"]*2
-                for i in manner_list:
-                    manner[cls.bad_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
-        else:
-            raise serializers.ValidationError("매너칭찬, 비매너평가 중 하나를 선택해야 합니다.")
-        
-        manner = "".join(manner)
-        return manner
+    def create_manner_mask(cls, manner_type, manner_list):
+        return cls.update_manner_mask(manner_type, 0, manner_list)
     
-    # update manner string
+    # replace the user review codes of manner
     @classmethod
-    def update_manner_string(cls, manner_type, manner, manner_list):
+    def update_manner_mask(cls, manner_type, manner, manner_list):
         if manner_list is None:
             raise serializers.ValidationError("매너평가를 입력해주세요.")
-        manner = list(manner)
         
         if manner_type=="good":
-            for i in range(0, 3):
-                manner[i]="0"
-            try:
-                for i in manner_list:
-                    manner[cls.good_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
+            manner_code = cls.good_manner_code
         elif manner_type=="bad":
-            for i in range(0, 2):
-                manner[i]="0"
-            try:
-                for i in manner_list:
-                    manner[cls.bad_manner_code[i]]="1"
-            except KeyError:
-                raise serializers.ValidationError("올바른 평가를 입력해주세요.")
-            
+            manner_code = cls.bad_manner_code
         else:
             raise serializers.ValidationError("매너칭찬, 비매너평가 중 하나를 선택해야 합니다.")
         
-        manner = "".join(manner)
-        return manner
+        try:
+            codes = mask_of(manner_code[i] for i in manner_list)
+        except KeyError:
+            raise serializers.ValidationError("올바른 평가를 입력해주세요.")
+        return manner & ~mask_of(manner_code.values()) | codes
     
     def validate(self, data):
         manner_type = self.context["manner_type"]
         manner_list = data.get("manner_list")
-        return {"manner" : self.create_manner_string(manner_type, manner_list)}
+        return {"manner" : self.create_manner_mask(manner_type, manner_list)}
     
     # update manner
     def update_manner(self, review, data):
         manner_type = review.manner_type
         manner = review.manner
         manner_list = data.get("manner_list")
-        manner = self.update_manner_string(manner_type, manner, manner_list)
+        manner = self.update_manner_mask(manner_type, manner, manner_list)
         
         review.manner = manner
         review.save()
@@ -260,20 +214,11 @@ class ReviewUserSerializer(serializers.ModelSerializer):
         }
         
         # get manner evaluation as a list
-        manner_list = []
-        manner = review.manner
-        
         if review.manner_type=="good":
-            for i, v in enumerate(manner[0:3]):
-                if v == "1":
-                    manner_list.append(code_good_manner[i])
-                    
+            return [code_good_manner[i] for i in codes_of(review.manner, len(code_good_manner))]
         elif review.manner_type=="bad":
-            for i, v in enumerate(manner[0:2]):
-                if v == "1":
-                    manner_list.append(code_bad_manner[i])
-                    
-        return manner_list
+            return [code_bad_manner[i] for i in codes_of(review.manner, len(code_bad_manner))]
+        return []
     
     
 class ReviewSerializer(serializers.ModelSerializer):
@@ -330,36 +275,10 @@ class UserMannerSerializer(serializers.ModelSerializer):
             "manner",
         )
     
+    # distinct reviewers per good manner code, from the histogram of the user
     def get_manner(self, user):
-        reviewyee = user
-        good_manner_cnt = {
-            "친절하고 매너가 좋아요." : set(),
-            "시간 약속을 잘 지켜요." : set(),
-            "응답이 빨라요." : set(),
-            
-            "상품상태가 설명한 것과 같아요." : set(),
-            "나눔을 해주셨어요." : set(),
-            "상품설명이 자세해요." : set(),
-            "좋은 상품을 저렴하게 판매해요." : set(),
-            
-            "제가 있는 곳까지 와서 거래했어요." : set(),
-        }
-        
-        # get manner evaluation and the number of users who sent it, which specific user received
-        
-        reviews = Review.objects.filter(reviewyee=reviewyee, manner_type="good").all()
-        
-        for review in reviews:
-            manner = review.manner
-            reviewer = review.reviewer
-            for i, v in enumerate(manner):
-                if v=="1":
-                    good_manner_cnt[self.code_good_manner[i]].add(reviewer)
-                    
-        for manner in self.good_manner_list:
-            good_manner_cnt[manner] = len(good_manner_cnt[manner])
-            
-        return good_manner_cnt
+        counts = manner_histogram(user)["good"]
+        return {manner: counts[i] for i, manner in enumerate(self.good_manner_list)}
     
     
 class UserReviewSerializer(serializers.ModelSerializer):
@@ -374,9 +293,21 @@ class UserReviewSerializer(serializers.ModelSerializer):
         )
         
     def get_review(self, user):
-        reviewyee = user
-        reviews = Review.objects.filter(Q(review_type="seller") | Q(review_type="buyer"), reviewyee=reviewyee)
+        reviews = prefetch_reviews(received_reviews(user)).order_by("-created_at", "-id")
         return ReviewSerializer(reviews, many=True).data
     
     def get_manner(self, user):
-        return UserMannerSerializer(user).data
\ No newline at end of file
+        return UserMannerSerializer(user).data
+    
+    
+# profile screen, review counts and the newest reviews only
+class UserReviewSummarySerializer(UserReviewSerializer):
+    def get_review(self, user):
+        summary = review_summary(user)
+        summary["reviews"] = ReviewSerializer(summary["reviews"], many=True).data
+        return summary
+    
+    
+class ReviewCursorValidator(ArticleCursorValidator):
+    size = serializers.IntegerField(required=False, default=REVIEW_PAGE_SIZE)
+    max_size = REVIEW_MAX_PAGE_SIZE
\ No newline at end of file
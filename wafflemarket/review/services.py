@@ -1,16 +1,38 @@
+import struct
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Prefetch, Q, Sum
+
 from user.models import User
 from article.models import Article
-from review.models import Review
+from article.services import encode_cursor, prefetch_users
+from review.models import MannerHistogram, Review, Temparature
+from wafflemarket.fields import BitCount, codes_of, popcount
+
+
+# number of manner codes of article reviews, user reviews use the first ones
+MANNER_CODE_CNT = {"good": 8, "bad": 15}
+MANNER_WIDTH = max(MANNER_CODE_CNT.values())
 
+def manner_bits(manner):
+        return popcount(manner)
+
+# sum of manner bits per (reviewyee, review_type, manner_type), counted by the database
+def manner_sums(reviews):
+        return (
+            reviews.order_by()
+            .values("reviewyee_id", "review_type", "manner_type")
+            .annotate(manner_sum=Sum(BitCount("manner", MANNER_WIDTH)))
+        )
 
 def manner_score(reviews):
         score = 0
         for review in reviews:
-            score += sum([int(i) for i in review.manner])
+            score += manner_bits(review.manner)
         return score
 
 def update_temparature(user):
-        temp = 36.5
         article_cnt = Article.objects.filter(seller=user).count()
         article_sold_cnt = Article.objects.filter(seller=user, sold_at__isnull=False).count()
         article_bought_cnt = Article.objects.filter(buyer=user).count()
@@ -32,7 +54,22 @@ def update_temparature(user):
             
         reviews = Review.objects.filter(review_type="user", manner_type="bad", reviewyee=user)
         user_bad_manner = manner_score(reviews)
-            
+        
+        user.temparature = calculate_temparature(
+            article_cnt, article_sold_cnt, article_bought_cnt,
+            seller_good_manner, seller_bad_manner,
+            buyer_good_manner, buyer_bad_manner,
+            user_good_manner, user_bad_manner,
+        )
+        user.save()
+
+def calculate_temparature(
+    article_cnt, article_sold_cnt, article_bought_cnt,
+    seller_good_manner, seller_bad_manner,
+    buyer_good_manner, buyer_bad_manner,
+    user_good_manner, user_bad_manner,
+):
+        temp = 36.5
         if(article_cnt>=7):
             temp += 30
             temp += user_good_manner * 2.4 * 0.5
@@ -100,5 +137,452 @@ def update_temparature(user):
             temp = 0
         elif temp>99:
             temp = 99
-        user.temparature = temp
-        user.save()
\ No newline at end of file
+        return temp
+
+
+# (bonus, good manner weight, bad manner weight) of the tiers of calculate_temparature
+TEMPARATURE_TIERS = (
+        (0, 0, 0),
+        (2.5, 0.15, 0.3),
+        (5, 0.3, 0.6),
+        (10, 0.6, 1.2),
+        (20, 1.2, 2.4),
+        (30, 2.4, 4.8),
+)
+# tier of a count, counts from 7 on are in the last tier
+TEMPARATURE_TIER_OF_CNT = (0, 1, 2, 3, 3, 4, 4, 5)
+
+def temparature_tiers(cnts):
+        last = len(TEMPARATURE_TIER_OF_CNT) - 1
+        return [TEMPARATURE_TIERS[TEMPARATURE_TIER_OF_CNT[min(cnt, last)]] for cnt in cnts]
+
+def add_temparature_tiers(temps, tiers, goods, bads, good_scale, bad_scale):
+        # same operations in the same order as calculate_temparature, so results are identical
+        return [
+            temp + tier[0] + good * tier[1] * good_scale - bad * tier[2] * bad_scale
+            for temp, tier, good, bad in zip(temps, tiers, goods, bads)
+        ]
+
+# calculate_temparature of many users, the arguments are lists with one entry per user
+def calculate_temparatures(
+    article_cnt, article_sold_cnt, article_bought_cnt,
+    seller_good_manner, seller_bad_manner,
+    buyer_good_manner, buyer_bad_manner,
+    user_good_manner, user_bad_manner,
+):
+        temps = [36.5] * len(article_cnt)
+        temps = add_temparature_tiers(
+            temps, temparature_tiers(article_cnt), user_good_manner, user_bad_manner, 0.5, 1
+        )
+        # sold articles reach the second to last tier, the last one is from 7 articles on
+        seller_tiers = [
+            TEMPARATURE_TIERS[-1] if cnt >= 7 else tier
+            for cnt, tier in zip(
+                article_cnt, temparature_tiers(min(cnt, 6) for cnt in article_sold_cnt)
+            )
+        ]
+        temps = add_temparature_tiers(
+            temps, seller_tiers, seller_good_manner, seller_bad_manner, 1, 2
+        )
+        temps = add_temparature_tiers(
+            temps, temparature_tiers(article_bought_cnt), buyer_good_manner, buyer_bad_manner, 1, 2
+        )
+        return [0 if temp < 0 else 99 if temp > 99 else temp for temp in temps]
+
+# incremental temparature, maintained by review.signals
+
+MANNER_FIELDS = (
+        "seller_good_manner",
+        "seller_bad_manner",
+        "buyer_good_manner",
+        "buyer_bad_manner",
+        "user_good_manner",
+        "user_bad_manner",
+)
+
+def manner_field(review_type, manner_type):
+        field = "%s_%s_manner" % (review_type, manner_type)
+        if field not in MANNER_FIELDS:
+            return None
+        return field
+
+def temparature_of(temp):
+        # update_temparature scores user reviews only by bad evaluations, keep it identical
+        return calculate_temparature(
+            temp.article_cnt, temp.article_sold_cnt, temp.article_bought_cnt,
+            temp.seller_good_manner, temp.seller_bad_manner,
+            temp.buyer_good_manner, temp.buyer_bad_manner,
+            temp.user_bad_manner, temp.user_bad_manner,
+        )
+
+def build_temparature(user_id):
+        counts = Article.objects.aggregate(
+            article_cnt=Count("id", filter=Q(seller_id=user_id)),
+            article_sold_cnt=Count("id", filter=Q(seller_id=user_id, sold_at__isnull=False)),
+            article_bought_cnt=Count("id", filter=Q(buyer_id=user_id)),
+        )
+        manners = dict.fromkeys(MANNER_FIELDS, 0)
+        for row in manner_sums(Review.objects.filter(reviewyee_id=user_id)):
+            field = manner_field(row["review_type"], row["manner_type"])
+            if field is not None:
+                manners[field] = row["manner_sum"]
+        
+        temp, created = Temparature.objects.update_or_create(
+            user_id=user_id, defaults=dict(**counts, **manners)
+        )
+        return temp
+
+def refresh_temparature(user_id):
+        with transaction.atomic(savepoint=False):
+            temp = Temparature.objects.select_for_update().get(user_id=user_id)
+            User.objects.filter(id=user_id).update(temparature=temparature_of(temp))
+
+# add deltas to aggregates of the user, build them from scratch if missing.
+# the row stays locked until the transaction of the saved article or review
+# commits, so concurrent deltas and rebuild_temparature_chunk wait for it
+def apply_temparature_delta(user_id, deltas, create=True):
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        
+        with transaction.atomic(savepoint=False):
+            temp = Temparature.objects.select_for_update().filter(user_id=user_id).first()
+            if temp is None:
+                if not create:
+                    return
+                temp = build_temparature(user_id)
+            else:
+                for field, delta in deltas.items():
+                    setattr(temp, field, getattr(temp, field) + delta)
+                temp.save(update_fields=list(deltas))
+            User.objects.filter(id=user_id).update(temparature=temparature_of(temp))
+
+# aggregates of the users in [first_id, last_id], one list per field aligned with user_ids
+def temparature_columns(user_ids):
+        first_id, last_id = user_ids[0], user_ids[-1]
+        position = {user_id: i for i, user_id in enumerate(user_ids)}
+        columns = {
+            field: [0] * len(user_ids)
+            for field in ("article_cnt", "article_sold_cnt", "article_bought_cnt") + MANNER_FIELDS
+        }
+        
+        sold = (
+            Article.objects.filter(seller_id__gte=first_id, seller_id__lte=last_id)
+            .values("seller")
+            .annotate(
+                article_cnt=Count("id"),
+                article_sold_cnt=Count("id", filter=Q(sold_at__isnull=False)),
+            )
+        )
+        for row in sold:
+            if row["seller"] in position:
+                columns["article_cnt"][position[row["seller"]]] = row["article_cnt"]
+                columns["article_sold_cnt"][position[row["seller"]]] = row["article_sold_cnt"]
+        
+        bought = (
+            Article.objects.filter(buyer_id__gte=first_id, buyer_id__lte=last_id)
+            .values("buyer")
+            .annotate(article_bought_cnt=Count("id"))
+        )
+        for row in bought:
+            if row["buyer"] in position:
+                columns["article_bought_cnt"][position[row["buyer"]]] = row["article_bought_cnt"]
+        
+        reviews = Review.objects.filter(reviewyee_id__gte=first_id, reviewyee_id__lte=last_id)
+        for row in manner_sums(reviews):
+            field = manner_field(row["review_type"], row["manner_type"])
+            if field is not None and row["reviewyee_id"] in position:
+                columns[field][position[row["reviewyee_id"]]] = row["manner_sum"]
+        return columns
+
+# rebuild aggregates and temparature of the users in one transaction. existing
+# aggregates are locked before anything is counted. a save whose delta holds a
+# lock commits first and is counted, a save waiting for one is not visible to
+# the count yet and adds its delta afterwards. aggregates created meanwhile by
+# build_temparature are counted from scratch too and kept as they are
+def rebuild_temparature_chunk(user_ids, batch_size=1000):
+        fields = ("article_cnt", "article_sold_cnt", "article_bought_cnt") + MANNER_FIELDS
+        with transaction.atomic():
+            existing = dict(
+                Temparature.objects.select_for_update()
+                .filter(user_id__gte=user_ids[0], user_id__lte=user_ids[-1])
+                .values_list("user_id", "id")
+            )
+            columns = temparature_columns(user_ids)
+            # like temparature_of, user reviews are scored only by bad evaluations
+            temparatures = calculate_temparatures(
+                columns["article_cnt"], columns["article_sold_cnt"], columns["article_bought_cnt"],
+                columns["seller_good_manner"], columns["seller_bad_manner"],
+                columns["buyer_good_manner"], columns["buyer_bad_manner"],
+                columns["user_bad_manner"], columns["user_bad_manner"],
+            )
+            temps = [
+                Temparature(
+                    id=existing.get(user_id), user_id=user_id,
+                    **{field: columns[field][i] for field in fields}
+                )
+                for i, user_id in enumerate(user_ids)
+            ]
+            missing = [temp for temp in temps if temp.id is None]
+            Temparature.objects.bulk_update(
+                [temp for temp in temps if temp.id is not None], fields, batch_size=batch_size
+            )
+            Temparature.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+            if missing:
+                # score the aggregates kept instead of the ones counted here
+                kept = {
+                    temp.user_id: temparature_of(temp)
+                    for temp in Temparature.objects.select_for_update().filter(
+                        user_id__in=[temp.user_id for temp in missing]
+                    )
+                }
+                temparatures = [
+                    kept.get(user_id, temparature)
+                    for user_id, temparature in zip(user_ids, temparatures)
+                ]
+            users = [
+                User(id=user_id, temparature=temparature)
+                for user_id, temparature in zip(user_ids, temparatures)
+            ]
+            User.objects.bulk_update(users, ["temparature"], batch_size=batch_size)
+
+# rebuild aggregates and temparature of every user, batch_size users at a time
+# so memory does not grow with the number of users. progress is called with
+# the number of users rebuilt after each batch
+def rebuild_temparatures(batch_size=1000, progress=None):
+        user_ids = User.objects.order_by("id").values_list("id", flat=True)
+        last_id = 0
+        rebuilt = 0
+        while True:
+            batch = list(user_ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return rebuilt
+            rebuild_temparature_chunk(batch, batch_size=batch_size)
+            rebuilt += len(batch)
+            last_id = batch[-1]
+            if progress is not None:
+                progress(rebuilt)
+
+
+# manner histograms, maintained by review.signals
+
+def manner_codes(manner):
+        return codes_of(manner, MANNER_WIDTH)
+
+def pack_histogram(counts):
+        return struct.pack("<%dI" % len(counts), *counts)
+
+def unpack_histogram(data, manner_type):
+        size = MANNER_CODE_CNT[manner_type]
+        if not data:
+            return [0] * size
+        return list(struct.unpack("<%dI" % size, bytes(data)))
+
+def histogram_field(manner_type):
+        return "%s_manner" % manner_type
+
+# codes given by the reviewer in any review of the user as one mask, reviews of
+# deleted reviewers are counted as one reviewer like UserMannerSerializer did
+def reviewer_mask(reviewyee_id, reviewer_id, manner_type, exclude_id=None):
+        reviews = Review.objects.filter(
+            reviewyee_id=reviewyee_id, reviewer_id=reviewer_id, manner_type=manner_type
+        )
+        if exclude_id is not None:
+            reviews = reviews.exclude(id=exclude_id)
+        mask = 0
+        for manner in reviews.values_list("manner", flat=True):
+            mask |= manner
+        return mask
+
+def count_histograms(reviews):
+        masks = defaultdict(int)
+        for reviewyee_id, reviewer_id, manner_type, manner in reviews:
+            if manner_type in MANNER_CODE_CNT:
+                masks[(reviewyee_id, reviewer_id, manner_type)] |= manner
+        
+        histograms = defaultdict(
+            lambda: {manner_type: [0] * size for manner_type, size in MANNER_CODE_CNT.items()}
+        )
+        for (reviewyee_id, reviewer_id, manner_type), mask in masks.items():
+            counts = histograms[reviewyee_id][manner_type]
+            for code in codes_of(mask, len(counts)):
+                counts[code] += 1
+        return histograms
+
+def build_histogram(user_id):
+        reviews = Review.objects.filter(reviewyee_id=user_id).values_list(
+            "reviewyee_id", "reviewer_id", "manner_type", "manner"
+        )
+        counts = count_histograms(reviews)[user_id]
+        histogram, created = MannerHistogram.objects.update_or_create(
+            user_id=user_id,
+            defaults={
+                histogram_field(manner_type): pack_histogram(counts[manner_type])
+                for manner_type in MANNER_CODE_CNT
+            },
+        )
+        return histogram
+
+# add +1/-1 per code to the histogram of the user, build it from scratch if missing
+def apply_histogram_delta(user_id, manner_type, deltas, create=True):
+        deltas = {code: delta for code, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        
+        field = histogram_field(manner_type)
+        with transaction.atomic():
+            histogram = MannerHistogram.objects.select_for_update().filter(user_id=user_id).first()
+            if histogram is None:
+                if create:
+                    build_histogram(user_id)
+                return
+            counts = unpack_histogram(getattr(histogram, field), manner_type)
+            for code, delta in deltas.items():
+                if code < len(counts):
+                    counts[code] = max(counts[code] + delta, 0)
+            MannerHistogram.objects.filter(id=histogram.id).update(**{field: pack_histogram(counts)})
+
+# {manner_type: [distinct reviewers per code]} of the user
+def manner_histogram(user):
+        try:
+            histogram = user.manner_histogram
+        except MannerHistogram.DoesNotExist:
+            histogram = build_histogram(user.id)
+        return {
+            manner_type: unpack_histogram(getattr(histogram, histogram_field(manner_type)), manner_type)
+            for manner_type in MANNER_CODE_CNT
+        }
+
+# rebuild histograms of the users in one transaction, existing histograms are
+# locked before counting like rebuild_temparature_chunk. histograms created
+# meanwhile by build_histogram are counted from scratch too and kept
+def rebuild_histogram_chunk(user_ids, batch_size=1000):
+        fields = [histogram_field(manner_type) for manner_type in MANNER_CODE_CNT]
+        with transaction.atomic():
+            existing = dict(
+                MannerHistogram.objects.select_for_update()
+                .filter(user_id__gte=user_ids[0], user_id__lte=user_ids[-1])
+                .values_list("user_id", "id")
+            )
+            reviews = Review.objects.filter(
+                reviewyee_id__gte=user_ids[0], reviewyee_id__lte=user_ids[-1]
+            ).order_by().values_list("reviewyee_id", "reviewer_id", "manner_type", "manner")
+            histograms = count_histograms(reviews.iterator())
+            rows = [
+                MannerHistogram(
+                    id=existing.get(user_id),
+                    user_id=user_id,
+                    **{
+                        histogram_field(manner_type): pack_histogram(
+                            histograms[user_id][manner_type] if user_id in histograms else [0] * size
+                        )
+                        for manner_type, size in MANNER_CODE_CNT.items()
+                    }
+                )
+                for user_id in user_ids
+            ]
+            MannerHistogram.objects.bulk_update(
+                [row for row in rows if row.id is not None], fields, batch_size=batch_size
+            )
+            MannerHistogram.objects.bulk_create(
+                [row for row in rows if row.id is None], batch_size=batch_size, ignore_conflicts=True
+            )
+
+# rebuild histograms of every user, batch_size users at a time
+def rebuild_histograms(batch_size=1000):
+        user_ids = User.objects.order_by("id").values_list("id", flat=True)
+        last_id = 0
+        rebuilt = 0
+        while True:
+            batch = list(user_ids.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                return rebuilt
+            rebuild_histogram_chunk(batch, batch_size=batch_size)
+            rebuilt += len(batch)
+            last_id = batch[-1]
+
+
+# article reviews, used by ReviewArticleViewSet and the purchase actions of ArticleViewSet
+
+ARTICLE_REVIEW_TYPES = ("seller", "buyer")
+
+# the review the user sent and the one the user received for the article, one query
+def article_reviews_of(article, user):
+        sent = received = None
+        for review in Review.objects.filter(article=article, review_type__in=ARTICLE_REVIEW_TYPES):
+            if review.reviewer_id == user.id:
+                sent = review
+            elif review.reviewyee_id == user.id:
+                received = review
+        return sent, received
+
+# write the review unless the reviewer already reviewed the article, returns
+# (review, received review) with review None for a second review
+def create_article_review(article, review):
+        sent, received = article_reviews_of(article, review.reviewer)
+        if sent is not None:
+            return None, received
+        try:
+            with transaction.atomic():
+                review.save()
+        except IntegrityError:
+            # written by a concurrent request of the same reviewer
+            return None, received
+        return review, received
+
+# delete both reviews of the article. the collector selects them for the
+# post_delete signals of review.signals, which keep temparature and histograms
+# in step, and deletes them with one DELETE ... WHERE id IN
+def delete_article_reviews(article):
+        with transaction.atomic():
+            deleted, _ = Review.objects.filter(
+                article=article, review_type__in=ARTICLE_REVIEW_TYPES
+            ).delete()
+        return deleted
+
+# seller and buyer reviews a user received, listed by ReviewViewSet
+
+REVIEW_PAGE_SIZE = 20
+REVIEW_MAX_PAGE_SIZE = 50
+# reviews shown on the profile screen
+REVIEW_SUMMARY_SIZE = 3
+
+def received_reviews(user):
+        return Review.objects.filter(reviewyee=user, review_type__in=ARTICLE_REVIEW_TYPES)
+
+# load everything ReviewSerializer reads, so a page costs a constant number of queries
+def prefetch_reviews(reviews):
+        return reviews.select_related("review_location").prefetch_related(
+            Prefetch("reviewer", queryset=prefetch_users())
+        )
+
+# keyset pagination on (created_at, id) over review_received_idx, newest first
+def paginate_reviews(reviews, cursor=None, size=REVIEW_PAGE_SIZE):
+        reviews = reviews.order_by("-created_at", "-id")
+        if cursor is not None:
+            created_at, review_id = cursor
+            reviews = reviews.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=review_id)
+            )
+        
+        page = list(prefetch_reviews(reviews)[: size + 1])
+        next_cursor = None
+        if len(page) > size:
+            page = page[:size]
+            next_cursor = encode_cursor(page[-1])
+        return page, next_cursor
+
+# review counts and the newest reviews of the user, without the full list
+def review_summary(user):
+        counts = received_reviews(user).aggregate(
+            seller_review_cnt=Count("id", filter=Q(review_type="seller")),
+            buyer_review_cnt=Count("id", filter=Q(review_type="buyer")),
+        )
+        reviews, next_cursor = paginate_reviews(received_reviews(user), size=REVIEW_SUMMARY_SIZE)
+        return {
+            "review_cnt": counts["seller_review_cnt"] + counts["buyer_review_cnt"],
+            "seller_review_cnt": counts["seller_review_cnt"],
+            "buyer_review_cnt": counts["buyer_review_cnt"],
+            "reviews": reviews,
+            "next_cursor": next_cursor,
+        }
@@ -0,0 +1,192 @@
+from collections import Counter, defaultdict
+
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from user.models import User
+from article.models import Article
+from review.models import Review
+from review.services import (
+    apply_histogram_delta,
+    apply_temparature_delta,
+    build_histogram,
+    build_temparature,
+    manner_bits,
+    manner_codes,
+    manner_field,
+    refresh_temparature,
+    reviewer_mask,
+)
+
+
+ARTICLE_STATE_FIELDS = {"seller_id", "buyer_id", "sold_at"}
+REVIEW_STATE_FIELDS = {"reviewyee_id", "review_type", "manner_type", "manner"}
+HISTOGRAM_STATE_FIELDS = {"reviewyee_id", "reviewer_id", "manner_type", "manner"}
+
+
+# state of article which temparature depends on, None if not fully loaded
+def article_state(article):
+    if ARTICLE_STATE_FIELDS & article.get_deferred_fields():
+        return None
+    return (article.seller_id, article.buyer_id, article.sold_at is not None)
+
+
+def review_state(review):
+    if REVIEW_STATE_FIELDS & review.get_deferred_fields():
+        return None
+    return (
+        review.reviewyee_id,
+        manner_field(review.review_type, review.manner_type),
+        manner_bits(review.manner),
+    )
+
+
+def article_deltas(state, sign, deltas):
+    seller_id, buyer_id, sold = state
+    if seller_id is not None:
+        deltas[seller_id]["article_cnt"] += sign
+        deltas[seller_id]["article_sold_cnt"] += sign * sold
+    if buyer_id is not None:
+        deltas[buyer_id]["article_bought_cnt"] += sign
+
+
+def review_deltas(state, sign, deltas):
+    reviewyee_id, field, bits = state
+    if reviewyee_id is not None and field is not None:
+        deltas[reviewyee_id][field] += sign * bits
+
+
+# rows are locked in user id order, so two saves touching the same users do not deadlock
+def apply_deltas(deltas, create=True):
+    for user_id in sorted(deltas):
+        apply_temparature_delta(user_id, deltas[user_id], create=create)
+
+
+@receiver(post_init, sender=Article)
+def remember_article_state(sender, instance, **kwargs):
+    instance._temparature_state = article_state(instance)
+
+
+@receiver(post_save, sender=Article)
+def update_article_temparature(sender, instance, created, **kwargs):
+    old_state = None if created else instance._temparature_state
+    new_state = article_state(instance)
+    instance._temparature_state = new_state
+
+    if not created and old_state is None:
+        # previous state unknown, rebuild current users from scratch
+        for user_id in {instance.seller_id, instance.buyer_id} - {None}:
+            build_temparature(user_id)
+            refresh_temparature(user_id)
+        return
+
+    deltas = defaultdict(Counter)
+    if old_state is not None:
+        article_deltas(old_state, -1, deltas)
+    article_deltas(new_state, 1, deltas)
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Article)
+def delete_article_temparature(sender, instance, **kwargs):
+    if instance._temparature_state is None:
+        return
+    deltas = defaultdict(Counter)
+    article_deltas(instance._temparature_state, -1, deltas)
+    apply_deltas(deltas, create=False)
+
+
+@receiver(post_init, sender=Review)
+def remember_review_state(sender, instance, **kwargs):
+    instance._temparature_state = review_state(instance)
+
+
+@receiver(post_save, sender=Review)
+def update_review_temparature(sender, instance, created, **kwargs):
+    old_state = None if created else instance._temparature_state
+    new_state = review_state(instance)
+    instance._temparature_state = new_state
+
+    if not created and old_state is None:
+        build_temparature(instance.reviewyee_id)
+        refresh_temparature(instance.reviewyee_id)
+        return
+
+    deltas = defaultdict(Counter)
+    if old_state is not None:
+        review_deltas(old_state, -1, deltas)
+    review_deltas(new_state, 1, deltas)
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Review)
+def delete_review_temparature(sender, instance, **kwargs):
+    if instance._temparature_state is None:
+        return
+    deltas = defaultdict(Counter)
+    review_deltas(instance._temparature_state, -1, deltas)
+    apply_deltas(deltas, create=False)
+
+
+def histogram_state(review):
+    if HISTOGRAM_STATE_FIELDS & review.get_deferred_fields():
+        return None
+    return (review.reviewyee_id, review.reviewer_id, review.manner_type, review.manner)
+
+
+# a reviewer counts once per code, so the histogram of the reviewyee changes only
+# where the codes of all reviews of the reviewer change
+def update_histograms(review_id, old_state, new_state, create=True):
+    groups = {state[:3] for state in (old_state, new_state) if state is not None}
+    for group in groups:
+        reviewyee_id, reviewer_id, manner_type = group
+        before = after = reviewer_mask(
+            reviewyee_id, reviewer_id, manner_type, exclude_id=review_id
+        )
+        if old_state is not None and old_state[:3] == group:
+            before |= old_state[3]
+        if new_state is not None and new_state[:3] == group:
+            after |= new_state[3]
+        deltas = Counter({code: 1 for code in manner_codes(after & ~before)})
+        deltas.update({code: -1 for code in manner_codes(before & ~after)})
+        apply_histogram_delta(reviewyee_id, manner_type, deltas, create=create)
+
+
+@receiver(post_init, sender=Review)
+def remember_histogram_state(sender, instance, **kwargs):
+    instance._histogram_state = histogram_state(instance)
+
+
+@receiver(post_save, sender=Review)
+def update_review_histogram(sender, instance, created, **kwargs):
+    old_state = None if created else instance._histogram_state
+    new_state = histogram_state(instance)
+    instance._histogram_state = new_state
+
+    if not created and old_state is None:
+        build_histogram(instance.reviewyee_id)
+        return
+    update_histograms(instance.id, old_state, new_state)
+
+
+@receiver(post_delete, sender=Review)
+def delete_review_histogram(sender, instance, **kwargs):
+    if instance._histogram_state is None:
+        return
+    update_histograms(instance.id, instance._histogram_state, None, create=False)
+
+
+# reviews of a deleted user lose their reviewer without signals and merge
+# with other reviews of deleted reviewers, rebuild the users they were about
+@receiver(pre_delete, sender=User)
+def remember_reviewed_users(sender, instance, **kwargs):
+    instance._reviewed_user_ids = set(
+        Review.objects.filter(reviewer=instance).values_list("reviewyee_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=User)
+def rebuild_reviewed_histograms(sender, instance, **kwargs):
+    user_ids = User.objects.filter(id__in=getattr(instance, "_reviewed_user_ids", ()))
+    for user_id in user_ids.values_list("id", flat=True):
+        build_histogram(user_id)
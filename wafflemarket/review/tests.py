@@ -1,14 +1,40 @@
+from io import StringIO
+from unittest.mock import patch
+
 from rest_framework import status
 
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from factory.django import DjangoModelFactory
 
-from review.models import Review, Temparature
+from review.models import MannerHistogram, Review, Temparature
+from review.serializers import (
+    ReviewArticleSerializer,
+    ReviewArticleValidator,
+    ReviewUserSerializer,
+    ReviewUserValidator,
+    UserMannerSerializer,
+)
+from review.services import (
+    MANNER_WIDTH,
+    REVIEW_SUMMARY_SIZE,
+    build_temparature,
+    calculate_temparature,
+    calculate_temparatures,
+    manner_histogram,
+    manner_sums,
+    temparature_columns,
+    update_temparature,
+)
 from user.models import User
 from user.serializers import jwt_token_of
 from user.tests import UserFactory
+from wafflemarket.fields import codes_of, mask_from_string, mask_to_string
 from location.tests import LocationFactory
+from article.models import Article
 from article.tests import ArticleFactory
 
 class TempFactory(DjangoModelFactory):
@@ -260,12 +286,13 @@ class PostSellerReviewTestCase(TestCase):
     def test_post_seller_review_success(self):
         pk = str(self.article1.id)
         data = self.post_data.copy()
-        response = self.client.post(
-            "/api/v1/review/article/%s/seller/"%pk,
-            data=data,
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        with self.assertNumQueries(21):
+            response = self.client.post(
+                "/api/v1/review/article/%s/seller/"%pk,
+                data=data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         
         res_data = response.json()
@@ -287,14 +314,15 @@ class PostSellerReviewTestCase(TestCase):
         self.assertEqual(review.reviewyee, self.user2)
         self.assertIsNotNone(review.created_at)
         self.assertEqual(review.manner_type, "good")
-        self.assertEqual(review.manner, "10000100")
-        
-        response = self.client.post(
-            "/api/v1/review/article/%s/seller/"%pk,
-            data=data,
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        self.assertEqual(review.manner, mask_from_string("10000100"))
+        
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                "/api/v1/review/article/%s/seller/"%pk,
+                data=data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         
         res_data = response.json()
@@ -303,6 +331,31 @@ class PostSellerReviewTestCase(TestCase):
         reviews = Review.objects.filter(article=self.article1, review_type="seller")
         self.assertEqual(reviews.count(), 1)
         
+        
+    def test_post_seller_review_concurrent(self):
+        pk = str(self.article1.id)
+        # written by a concurrent request after the check of this one
+        ReviewFactory(
+            review_type="seller",
+            reviewer=self.user1,
+            reviewyee=self.user2,
+            article=self.article1,
+            manner_type="good",
+            manner=mask_from_string("1"),
+        )
+        with patch("review.services.article_reviews_of", return_value=(None, None)):
+            response = self.client.post(
+                "/api/v1/review/article/%s/seller/"%pk,
+                data=self.post_data.copy(),
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        
+        reviews = Review.objects.filter(article=self.article1, review_type="seller")
+        self.assertEqual(reviews.count(), 1)
+        
+
 class PostBuyerReviewTestCase(TestCase):
     @classmethod
     def setUp(cls):
@@ -532,12 +585,13 @@ class PostBuyerReviewTestCase(TestCase):
     def test_post_buyer_review_success(self):
         pk = str(self.article1.id)
         data = self.post_data.copy()
-        response = self.client.post(
-            "/api/v1/review/article/%s/buyer/"%pk,
-            data=data,
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user2_token,
-            )
+        with self.assertNumQueries(21):
+            response = self.client.post(
+                "/api/v1/review/article/%s/buyer/"%pk,
+                data=data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user2_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         
         res_data = response.json()
@@ -559,14 +613,15 @@ class PostBuyerReviewTestCase(TestCase):
         self.assertEqual(review.reviewyee, self.user1)
         self.assertIsNotNone(review.created_at)
         self.assertEqual(review.manner_type, "good")
-        self.assertEqual(review.manner, "10000100")
-        
-        response = self.client.post(
-            "/api/v1/review/article/%s/buyer/"%pk,
-            data=data,
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user2_token,
-            )
+        self.assertEqual(review.manner, mask_from_string("10000100"))
+        
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                "/api/v1/review/article/%s/buyer/"%pk,
+                data=data,
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user2_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         
         res_data = response.json()
@@ -657,7 +712,7 @@ class GetSentReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 불만족합니다.",
             manner_type="bad",
-            manner="1111100000000000"
+            manner=mask_from_string("1111100000000000")
         )
         
         cls.review2 = ReviewFactory(
@@ -668,7 +723,7 @@ class GetSentReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review3 = ReviewFactory(
@@ -679,7 +734,7 @@ class GetSentReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
     def test_get_sent_review_no_login(self):
@@ -742,12 +797,13 @@ class GetSentReviewTestCase(TestCase):
     def test_get_sent_review_seller_success(self):
         pk = str(self.article1.id)
         
-        response = self.client.get(
-            "/api/v1/review/article/%s/sent/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/v1/review/article/%s/sent/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         res_data = response.json()
@@ -770,12 +826,13 @@ class GetSentReviewTestCase(TestCase):
     def test_get_sent_review_buyer_success(self):
         pk = str(self.article2.id)
         
-        response = self.client.get(
-            "/api/v1/review/article/%s/sent/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/v1/review/article/%s/sent/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         res_data = response.json()
@@ -869,7 +926,7 @@ class DeleteSentReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 불만족합니다.",
             manner_type="bad",
-            manner="1111100000000000"
+            manner=mask_from_string("1111100000000000")
         )
         
         cls.review2 = ReviewFactory(
@@ -880,7 +937,7 @@ class DeleteSentReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review3 = ReviewFactory(
@@ -891,7 +948,7 @@ class DeleteSentReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
     def test_delete_sent_review_no_login(self):
@@ -967,12 +1024,13 @@ class DeleteSentReviewTestCase(TestCase):
     def test_delete_sent_review_seller_success(self):
         pk = str(self.article1.id)
         
-        response = self.client.delete(
-            "/api/v1/review/article/%s/sent/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        with self.assertNumQueries(14):
+            response = self.client.delete(
+                "/api/v1/review/article/%s/sent/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         reviews = Review.objects.all()
@@ -982,12 +1040,13 @@ class DeleteSentReviewTestCase(TestCase):
     def test_delete_sent_review_buyer_success(self):
         pk = str(self.article1.id)
         
-        response = self.client.delete(
-            "/api/v1/review/article/%s/sent/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user2_token,
-            )
+        with self.assertNumQueries(14):
+            response = self.client.delete(
+                "/api/v1/review/article/%s/sent/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user2_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         reviews = Review.objects.all()
@@ -1079,7 +1138,7 @@ class GetReceivedReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 불만족합니다.",
             manner_type="bad",
-            manner="1111100000000000"
+            manner=mask_from_string("1111100000000000")
         )
         
         cls.review2 = ReviewFactory(
@@ -1090,7 +1149,7 @@ class GetReceivedReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review3 = ReviewFactory(
@@ -1101,7 +1160,7 @@ class GetReceivedReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
     def test_get_received_review_no_login(self):
@@ -1164,12 +1223,13 @@ class GetReceivedReviewTestCase(TestCase):
     def test_get_received_review_seller_success(self):
         pk = str(self.article1.id)
         
-        response = self.client.get(
-            "/api/v1/review/article/%s/received/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user1_token,
-            )
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/v1/review/article/%s/received/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user1_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         res_data = response.json()
@@ -1184,12 +1244,13 @@ class GetReceivedReviewTestCase(TestCase):
     def test_get_received_review_buyer_success(self):
         pk = str(self.article1.id)
         
-        response = self.client.get(
-            "/api/v1/review/article/%s/received/"%pk,
-            data={},
-            content_type="application/json",
-            HTTP_AUTHORIZATION=self.user2_token,
-            )
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/v1/review/article/%s/received/"%pk,
+                data={},
+                content_type="application/json",
+                HTTP_AUTHORIZATION=self.user2_token,
+                )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         
         res_data = response.json()
@@ -1357,7 +1418,7 @@ class PutUserReviewTestCase(TestCase):
         self.assertEqual(review.reviewer, self.user2)
         self.assertIsNotNone(review.created_at)
         self.assertEqual(review.manner_type, "good")
-        self.assertEqual(review.manner, "110")
+        self.assertEqual(review.manner, mask_from_string("110"))
         
         # not first put
         data = {
@@ -1388,7 +1449,7 @@ class PutUserReviewTestCase(TestCase):
         self.assertEqual(review.reviewer, self.user2)
         self.assertIsNotNone(review.created_at)
         self.assertEqual(review.manner_type, "good")
-        self.assertEqual(review.manner, "100")
+        self.assertEqual(review.manner, mask_from_string("100"))
         
 
 class GetUserReviewTestCase(TestCase):
@@ -1477,7 +1538,7 @@ class GetUserReviewTestCase(TestCase):
             review = None,
             review_location = None,
             manner_type = type,
-            manner = "11000000"
+            manner = mask_from_string("11000000")
         )
         
         response = self.client.get(
@@ -1560,6 +1621,17 @@ class GetUserReviewTestCase(TestCase):
             buyer=cls.user1
         )
         
+        cls.article3 = ArticleFactory(
+            seller=cls.user1,
+            location=cls.location1,
+            price=10000,
+            title="의자 판매",
+            content="튼튼한 의자 판매해요.",
+            category="가구/인테리어",
+            sold_at=timezone.now(),
+            buyer=cls.user3
+        )
+        
         cls.review1 = ReviewFactory(
             review_type = "seller",
             reviewer = cls.user1,
@@ -1568,18 +1640,18 @@ class GetUserReviewTestCase(TestCase):
             reviewyee = cls.user2,
             review="거래 매우 불만족합니다.",
             manner_type = "bad",
-            manner = "1111100000000000"
+            manner = mask_from_string("1111100000000000")
         )
         
         cls.review2 = ReviewFactory(
             review_type="seller",
             reviewer = cls.user1,
-            article = cls.article1,
+            article = cls.article3,
             review_location = cls.location1,
             reviewyee = cls.user3,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review3 = ReviewFactory(
@@ -1590,7 +1662,7 @@ class GetUserReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review4 = ReviewFactory(
@@ -1601,7 +1673,7 @@ class GetUserReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 만족합니다.",
             manner_type="good",
-            manner="11000000"
+            manner=mask_from_string("11000000")
         )
         
         cls.review4 = ReviewFactory(
@@ -1612,7 +1684,7 @@ class GetUserReviewTestCase(TestCase):
             reviewyee = cls.user1,
             review="거래 매우 불만족합니다.",
             manner_type="bad",
-            manner="1111100000000000"
+            manner=mask_from_string("1111100000000000")
         )
         
     def test_get_user_review_no_login(self):
@@ -1712,3 +1784,591 @@ class GetUserReviewTestCase(TestCase):
             HTTP_AUTHORIZATION=self.user1_token,
             )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TemparatureTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(
+            phone_number="01011112222",
+            email="wafflemarket@test.com",
+            username="steve",
+        )
+        cls.user2 = UserFactory(
+            phone_number="01022223333",
+            username="mark",
+        )
+        cls.user3 = UserFactory(
+            phone_number="01033334444",
+            username="smith",
+        )
+        cls.location1 = LocationFactory(
+            code="1111011700",
+            place_name="서울특별시 종로구 당주동",
+        )
+        
+        cls.articles = [
+            ArticleFactory(
+                seller=cls.user1,
+                location=cls.location1,
+                price=10000,
+                title="식물 판매 %d"%i,
+                content="공기정화식물 판매해요.",
+                category="식물",
+            )
+            for i in range(8)
+        ]
+    
+    # compare incrementally maintained temparature with update_temparature
+    def assertTemparatureConsistent(self):
+        for user in User.objects.all():
+            incremental = user.temparature
+            update_temparature(user)
+            self.assertAlmostEqual(incremental, user.temparature)
+    
+    def test_temparature_articles(self):
+        self.assertTemparatureConsistent()
+        
+        for article in self.articles[:5]:
+            article.buyer = self.user2
+            article.sold_at = timezone.now()
+            article.save()
+        self.assertTemparatureConsistent()
+        
+        # change buyer and cancel purchase
+        article = Article.objects.get(id=self.articles[0].id)
+        article.buyer = self.user3
+        article.save()
+        article = Article.objects.get(id=self.articles[1].id)
+        article.buyer = None
+        article.sold_at = None
+        article.save()
+        self.assertTemparatureConsistent()
+        
+        Article.objects.get(id=self.articles[2].id).delete()
+        self.assertTemparatureConsistent()
+        
+    def test_temparature_reviews(self):
+        for article in self.articles[:3]:
+            article.buyer = self.user2
+            article.sold_at = timezone.now()
+            article.save()
+        
+        review1 = ReviewFactory(
+            review_type="seller",
+            reviewer=self.user1,
+            reviewyee=self.user2,
+            article=self.articles[0],
+            manner_type="good",
+            manner=mask_from_string("11010000"),
+        )
+        ReviewFactory(
+            review_type="buyer",
+            reviewer=self.user2,
+            reviewyee=self.user1,
+            article=self.articles[0],
+            manner_type="bad",
+            manner=mask_from_string("111000000000000"),
+        )
+        ReviewFactory(
+            review_type="user",
+            reviewer=self.user3,
+            reviewyee=self.user1,
+            manner_type="good",
+            manner=mask_from_string("110"),
+        )
+        review4 = ReviewFactory(
+            review_type="user",
+            reviewer=self.user3,
+            reviewyee=self.user1,
+            manner_type="bad",
+            manner=mask_from_string("10"),
+        )
+        self.assertTemparatureConsistent()
+        
+        review1.manner = mask_from_string("11111111")
+        review1.save()
+        review4 = Review.objects.get(id=review4.id)
+        review4.manner = mask_from_string("11")
+        review4.save()
+        self.assertTemparatureConsistent()
+        
+        Review.objects.get(id=review1.id).delete()
+        self.assertTemparatureConsistent()
+        
+    def test_rebuild_temparature(self):
+        for article in self.articles[:6]:
+            article.buyer = self.user2
+            article.sold_at = timezone.now()
+            article.save()
+        ReviewFactory(
+            review_type="buyer",
+            reviewer=self.user2,
+            reviewyee=self.user1,
+            article=self.articles[0],
+            manner_type="good",
+            manner=mask_from_string("11110000"),
+        )
+        
+        # aggregates out of sync after a bulk update
+        Article.objects.filter(id=self.articles[7].id).update(buyer=self.user3)
+        Temparature.objects.all().delete()
+        User.objects.update(temparature=36.5)
+        
+        call_command("rebuild_temparature", stdout=StringIO())
+        self.assertEqual(Temparature.objects.count(), User.objects.count())
+        self.assertTemparatureConsistent()
+
+    
+    def test_purchase_deletes_reviews(self):
+        token = "JWT " + jwt_token_of(self.user1)
+        for article in self.articles[:2]:
+            article.buyer = self.user2
+            article.sold_at = timezone.now()
+            article.save()
+            ReviewFactory(
+                review_type="seller",
+                reviewer=self.user1,
+                reviewyee=self.user2,
+                article=article,
+                manner_type="good",
+                manner=mask_from_string("11"),
+            )
+            ReviewFactory(
+                review_type="buyer",
+                reviewer=self.user2,
+                reviewyee=self.user1,
+                article=article,
+                manner_type="bad",
+                manner=mask_from_string("101"),
+            )
+        
+        # canceling the purchase deletes both reviews in one statement
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete(
+                "/api/v1/article/%d/purchase/" % self.articles[0].id,
+                HTTP_AUTHORIZATION=token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        deletes = [query for query in queries if query["sql"].startswith('DELETE FROM "review_review"')]
+        self.assertEqual(len(deletes), 1)
+        self.assertFalse(Review.objects.filter(article=self.articles[0]).exists())
+        self.assertTemparatureConsistent()
+        
+        # so does changing the buyer
+        response = self.client.put(
+            "/api/v1/article/%d/buyer/" % self.articles[1].id,
+            data={"buyer_id": self.user3.id},
+            content_type="application/json",
+            HTTP_AUTHORIZATION=token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(Review.objects.filter(article=self.articles[1]).exists())
+        self.assertTemparatureConsistent()
+    
+    def test_calculate_temparatures(self):
+        rows = [
+            (article_cnt, article_sold_cnt, article_bought_cnt, good, bad, good + 1, bad * 3, good * 2, bad + 2)
+            for article_cnt in range(9)
+            for article_sold_cnt in range(0, 9, 2)
+            for article_bought_cnt in range(0, 9, 3)
+            for good in (0, 1, 7, 40)
+            for bad in (0, 1, 5, 20)
+        ]
+        columns = [list(column) for column in zip(*rows)]
+        self.assertEqual(
+            calculate_temparatures(*columns), [calculate_temparature(*row) for row in rows]
+        )
+    
+    def test_rebuild_temparature_batches(self):
+        for i, article in enumerate(self.articles):
+            article.buyer = [self.user2, self.user3][i % 2]
+            article.sold_at = timezone.now()
+            article.save()
+            ReviewFactory(
+                review_type="buyer",
+                reviewer=self.user1,
+                reviewyee=article.buyer,
+                article=article,
+                manner_type="bad" if i % 3 else "good",
+                manner=mask_from_string("1011" if i % 3 else "11100001"),
+            )
+        ReviewFactory(
+            review_type="user",
+            reviewer=self.user2,
+            reviewyee=self.user1,
+            manner_type="bad",
+            manner=mask_from_string("11"),
+        )
+        User.objects.update(temparature=0)
+        
+        # batches smaller than the users
+        out = StringIO()
+        call_command("rebuild_temparature", batch_size=2, verbosity=2, stdout=out)
+        self.assertIn("rebuilt temparature of 3 users", out.getvalue())
+        self.assertEqual(Temparature.objects.count(), User.objects.count())
+        for user in User.objects.all():
+            rebuilt = user.temparature
+            update_temparature(user)
+            self.assertEqual(rebuilt, user.temparature)
+
+    def test_rebuild_temparature_concurrent_build(self):
+        for article in self.articles[:3]:
+            article.buyer = self.user3
+            article.sold_at = timezone.now()
+            article.save()
+        # stale aggregates of user1, none of user3
+        Temparature.objects.filter(user=self.user1).update(article_cnt=0)
+        Temparature.objects.filter(user=self.user3).delete()
+        
+        # a signal builds the aggregates of user3 while the chunk is counted
+        def build_and_count(user_ids):
+            build_temparature(self.user3.id)
+            return temparature_columns(user_ids)
+        
+        with patch("review.services.temparature_columns", side_effect=build_and_count):
+            call_command("rebuild_temparature", stdout=StringIO())
+        self.assertEqual(Temparature.objects.count(), User.objects.count())
+        self.assertEqual(Temparature.objects.get(user=self.user1).article_cnt, 8)
+        self.assertEqual(Temparature.objects.get(user=self.user3).article_bought_cnt, 3)
+        self.assertTemparatureConsistent()
+
+# saves commit outside of a test transaction here
+class TemparatureCommitTestCase(TransactionTestCase):
+    def test_delta_commits_with_save(self):
+        seller = UserFactory(phone_number="01011112222", username="steve")
+        buyer = UserFactory(phone_number="01022223333", username="mark")
+        article = ArticleFactory(
+            seller=seller,
+            price=10000,
+            title="식물 판매",
+            content="공기정화식물 판매해요.",
+            category="식물",
+            buyer=buyer,
+            sold_at=timezone.now(),
+        )
+        
+        # a failing delta rolls back the review it belongs to
+        with patch("review.signals.apply_temparature_delta", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                ReviewFactory(
+                    review_type="buyer",
+                    reviewer=buyer,
+                    reviewyee=seller,
+                    article=article,
+                    manner_type="good",
+                    manner=mask_from_string("11"),
+                )
+        self.assertFalse(Review.objects.exists())
+        self.assertEqual(Temparature.objects.get(user=seller).buyer_good_manner, 0)
+
+class MannerHistogramTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.users = [
+            UserFactory(phone_number="0101111%04d" % i, username="user%d" % i)
+            for i in range(5)
+        ]
+        cls.user1_token = "JWT " + jwt_token_of(cls.users[0])
+        cls.reviewyee = cls.users[0]
+    
+    # set-based counting UserMannerSerializer used before the histograms
+    def count_manners(self, user, manner_type):
+        manner_cnt = [set() for _ in range(8 if manner_type == "good" else 15)]
+        for review in Review.objects.filter(reviewyee=user, manner_type=manner_type):
+            for i in codes_of(review.manner, len(manner_cnt)):
+                manner_cnt[i].add(review.reviewer)
+        return [len(reviewers) for reviewers in manner_cnt]
+    
+    def assertHistogramConsistent(self):
+        for user in User.objects.all():
+            user = User.objects.get(id=user.id)
+            histogram = manner_histogram(user)
+            self.assertEqual(histogram["good"], self.count_manners(user, "good"))
+            self.assertEqual(histogram["bad"], self.count_manners(user, "bad"))
+    
+    def test_histogram_reviews(self):
+        reviewers = self.users[1:]
+        review1 = ReviewFactory(
+            review_type="buyer",
+            reviewer=reviewers[0],
+            reviewyee=self.reviewyee,
+            manner_type="good",
+            manner=mask_from_string("11010000"),
+        )
+        # the same reviewer counts once per code
+        review2 = ReviewFactory(
+            review_type="user",
+            reviewer=reviewers[0],
+            reviewyee=self.reviewyee,
+            manner_type="good",
+            manner=mask_from_string("110"),
+        )
+        ReviewFactory(
+            review_type="seller",
+            reviewer=reviewers[1],
+            reviewyee=self.reviewyee,
+            manner_type="good",
+            manner=mask_from_string("10000001"),
+        )
+        ReviewFactory(
+            review_type="buyer",
+            reviewer=reviewers[2],
+            reviewyee=self.reviewyee,
+            manner_type="bad",
+            manner=mask_from_string("100000001000001"),
+        )
+        histogram = manner_histogram(User.objects.get(id=self.reviewyee.id))
+        self.assertEqual(histogram["good"][:4], [2, 1, 0, 1])
+        self.assertHistogramConsistent()
+        
+        review1 = Review.objects.get(id=review1.id)
+        review1.manner = mask_from_string("00000110")
+        review1.save()
+        self.assertHistogramConsistent()
+        
+        review2 = Review.objects.get(id=review2.id)
+        review2.reviewyee = reviewers[3]
+        review2.save()
+        self.assertHistogramConsistent()
+        
+        Review.objects.get(id=review1.id).delete()
+        self.assertHistogramConsistent()
+        
+        # reviews of deleted reviewers are merged
+        ReviewFactory(
+            review_type="user",
+            reviewer=reviewers[3],
+            reviewyee=self.reviewyee,
+            manner_type="good",
+            manner=mask_from_string("100"),
+        )
+        reviewers[1].delete()
+        reviewers[3].delete()
+        self.assertHistogramConsistent()
+    
+    def test_manner_view(self):
+        for i, reviewer in enumerate(self.users[1:]):
+            ReviewFactory(
+                review_type="user",
+                reviewer=reviewer,
+                reviewyee=self.reviewyee,
+                manner_type="good",
+                manner=mask_from_string(["100", "110", "011", "111"][i]),
+            )
+        
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                "/api/v1/review/user/%d/manner/" % self.reviewyee.id,
+                HTTP_AUTHORIZATION=self.user1_token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        manner = response.json()["manner"]
+        self.assertEqual(list(manner.values()), [3, 3, 2, 0, 0, 0, 0, 0])
+        self.assertEqual(list(manner), UserMannerSerializer.good_manner_list)
+    
+    def test_rebuild_histogram(self):
+        for i, reviewer in enumerate(self.users[1:]):
+            ReviewFactory(
+                review_type="seller",
+                reviewer=reviewer,
+                reviewyee=self.users[i % 2],
+                manner_type="good" if i % 3 else "bad",
+                manner=mask_from_string("11000001" if i % 3 else "010000000000001"),
+            )
+        
+        # histograms out of sync after a bulk update
+        Review.objects.filter(manner_type="good").update(manner=mask_from_string("00111000"))
+        MannerHistogram.objects.filter(user=self.users[1]).delete()
+        
+        call_command("rebuild_manner_histogram", stdout=StringIO())
+        self.assertEqual(MannerHistogram.objects.count(), User.objects.count())
+        self.assertHistogramConsistent()
+        
+        # batches smaller than the users
+        Review.objects.filter(manner_type="good").update(manner=mask_from_string("11000000"))
+        MannerHistogram.objects.filter(user=self.users[0]).delete()
+        out = StringIO()
+        call_command("rebuild_manner_histogram", batch_size=2, stdout=out)
+        self.assertIn("rebuilt manner histogram of %d users" % User.objects.count(), out.getvalue())
+        self.assertEqual(MannerHistogram.objects.count(), User.objects.count())
+        self.assertHistogramConsistent()
+
+
+class MannerMaskTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.user1 = UserFactory(phone_number="01011110001", username="user1")
+        cls.user2 = UserFactory(phone_number="01011110002", username="user2")
+    
+    def test_article_manner_round_trip(self):
+        for manner_type, manner_code in (
+            ("good", ReviewArticleValidator.good_manner_code),
+            ("bad", ReviewArticleValidator.bad_manner_code),
+        ):
+            for manner in manner_code:
+                review = Review(
+                    manner_type=manner_type,
+                    manner=ReviewArticleValidator.create_manner_mask(manner_type, [manner]),
+                )
+                self.assertEqual(ReviewArticleSerializer.get_evaluation(review), [manner])
+            
+            manner_list = list(manner_code)
+            review = Review(
+                manner_type=manner_type,
+                manner=ReviewArticleValidator.create_manner_mask(manner_type, manner_list),
+            )
+            self.assertEqual(review.manner, (1 << len(manner_code)) - 1)
+            self.assertEqual(ReviewArticleSerializer.get_evaluation(review), manner_list)
+    
+    def test_user_manner_round_trip(self):
+        for manner_type, manner_code in (
+            ("good", ReviewUserValidator.good_manner_code),
+            ("bad", ReviewUserValidator.bad_manner_code),
+        ):
+            for manner in manner_code:
+                review = Review(
+                    manner_type=manner_type,
+                    manner=ReviewUserValidator.create_manner_mask(manner_type, [manner]),
+                )
+                self.assertEqual(ReviewUserSerializer().get_evaluation(review), [manner])
+        
+        # codes past the user review codes are kept on update
+        manner = ReviewUserValidator.update_manner_mask(
+            "good", mask_from_string("10100001"), ["응답이 빨라요."]
+        )
+        self.assertEqual(manner, mask_from_string("00100001"))
+    
+    def test_mask_strings(self):
+        for flags in ("", "0", "1", "10000100", "0" + "1" * 16, "100000001000001"):
+            mask = mask_from_string(flags)
+            self.assertEqual(mask_to_string(mask, len(flags)), flags)
+            self.assertEqual(codes_of(mask, len(flags)), [i for i, v in enumerate(flags) if v == "1"])
+        self.assertEqual(mask_from_string("110"), 3)
+    
+    def test_has_bit_and_bit_count(self):
+        manners = ["10000100", "0001", "100000001000001", "0"]
+        for manner in manners:
+            ReviewFactory(
+                review_type="user",
+                reviewer=self.user1,
+                reviewyee=self.user2,
+                manner_type="bad",
+                manner=mask_from_string(manner),
+            )
+        
+        for code in range(MANNER_WIDTH):
+            self.assertEqual(
+                Review.objects.filter(manner__has_bit=code).count(),
+                sum(1 for manner in manners if manner[code:code + 1] == "1"),
+            )
+        
+        sums = list(manner_sums(Review.objects.all()))
+        self.assertEqual(len(sums), 1)
+        self.assertEqual(sums[0]["manner_sum"], sum(manner.count("1") for manner in manners))
+
+
+class ReviewListTestCase(TestCase):
+    @classmethod
+    def setUp(cls):
+        cls.location = LocationFactory(code="1111011700", place_name="서울특별시 종로구 당주동")
+        cls.reviewyee = UserFactory(phone_number="01011110000", username="reviewyee")
+        cls.user1_token = "JWT " + jwt_token_of(cls.reviewyee)
+        cls.reviews = []
+        for i in range(7):
+            reviewer = UserFactory(
+                phone_number="0102222%04d" % i, username="reviewer%d" % i, location=cls.location
+            )
+            cls.reviews.append(
+                ReviewFactory(
+                    review_type="seller" if i % 2 else "buyer",
+                    reviewer=reviewer,
+                    reviewyee=cls.reviewyee,
+                    review_location=cls.location,
+                    review="리뷰 %d" % i,
+                    manner_type="good",
+                    manner=mask_from_string("11"),
+                )
+            )
+        # user reviews are not listed
+        ReviewFactory(
+            review_type="user",
+            reviewer=reviewer,
+            reviewyee=cls.reviewyee,
+            manner_type="good",
+            manner=mask_from_string("1"),
+        )
+        # ties on created_at are ordered by id
+        created_at = timezone.now()
+        Review.objects.filter(id__in=[review.id for review in cls.reviews[2:5]]).update(
+            created_at=created_at
+        )
+        cls.expected = [
+            review.review
+            for review in Review.objects.filter(review_type__in=("seller", "buyer")).order_by(
+                "-created_at", "-id"
+            )
+        ]
+    
+    def get_page(self, cursor, size):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                "/api/v1/review/user/%d/review/" % self.reviewyee.id,
+                data={"cursor": cursor, "size": size},
+                HTTP_AUTHORIZATION=self.user1_token,
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.json(), len(queries)
+    
+    def test_review_pages(self):
+        reviews = []
+        query_cnts = set()
+        cursor = ""
+        while True:
+            page, query_cnt = self.get_page(cursor, 3)
+            query_cnts.add(query_cnt)
+            self.assertLessEqual(len(page["reviews"]), 3)
+            reviews += page["reviews"]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual([review["review"] for review in reviews], self.expected)
+        self.assertEqual(reviews[0]["reviewer"]["location"]["place_name"], "서울특별시 종로구 당주동")
+        
+        # the page size does not change the number of queries
+        page, query_cnt = self.get_page("", 7)
+        self.assertIsNone(page["next_cursor"])
+        self.assertEqual(query_cnts, {query_cnt})
+    
+    def test_review_cursor_invalid(self):
+        response = self.client.get(
+            "/api/v1/review/user/%d/review/" % self.reviewyee.id,
+            data={"cursor": "invalid"},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_review_summary(self):
+        response = self.client.get(
+            "/api/v1/review/user/%d/" % self.reviewyee.id,
+            data={"summary": "true"},
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        review = response.json()["review"]
+        self.assertEqual(review["review_cnt"], 7)
+        self.assertEqual(review["seller_review_cnt"], 3)
+        self.assertEqual(review["buyer_review_cnt"], 4)
+        self.assertEqual(
+            [review["review"] for review in review["reviews"]],
+            self.expected[:REVIEW_SUMMARY_SIZE],
+        )
+        self.assertIsNotNone(review["next_cursor"])
+        self.assertIn("manner", response.json())
+        
+        # the whole list without summary
+        response = self.client.get(
+            "/api/v1/review/user/%d/" % self.reviewyee.id,
+            HTTP_AUTHORIZATION=self.user1_token,
+        )
+        self.assertEqual([review["review"] for review in response.json()["review"]], self.expected)
@@ -4,18 +4,27 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from django.db.models import Q
+from django.db import transaction
 
 from .models import Review
 from .serializers import ( 
     ReviewArticleSerializer,    
     ReviewArticleValidator, 
+    ReviewCursorValidator,
     ReviewUserSerializer, 
     ReviewUserValidator, 
     ReviewSerializer, 
     UserMannerSerializer, 
     UserReviewSerializer, 
+    UserReviewSummarySerializer,
     )
+from .services import (
+    article_reviews_of,
+    create_article_review,
+    paginate_reviews,
+    prefetch_reviews,
+    received_reviews,
+)
 from user.models import User
 from article.models import Article
 
@@ -29,126 +38,86 @@ class ReviewArticleViewSet(viewsets.GenericViewSet):
     @action(detail=True, methods=["GET", "DELETE",])
     def sent(self, request, pk):
         
-        if Article.objects.filter(pk=pk).exists():
-            article = Article.objects.get(pk=pk)
-        else:
+        article = Article.objects.filter(pk=pk).first()
+        if article is None:
             return Response({"존재하지 않는 게시글입니다."}, status=status.HTTP_404_NOT_FOUND)
         
-        if request.user not in [article.seller, article.buyer]:
+        if request.user.id not in [article.seller_id, article.buyer_id]:
             return Response(
                 {"해당 게시글의 판매자 혹은 구매자만이 후기를 조회 혹은 삭제할 수 있습니다."}, 
                 status=status.HTTP_403_FORBIDDEN,
                 )
         
+        review, received = article_reviews_of(article, request.user)
+        if review is None:
+            return Response({"후기가 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+        
         # get review(article review) which logined user sent
         if self.request.method == "GET":
-            if Review.objects.filter(article=article, reviewer=request.user).exists():
-                review = Review.objects.get(article=article, reviewer=request.user)
-                received = Review.objects.filter(article=article, reviewyee=request.user).exists()
-                return Response(
-                    ReviewArticleSerializer(review, context={"type" : "sent", "to_view" : ("received", received)}).data, 
-                    status=status.HTTP_200_OK
-                    )
-            else:
-                return Response({"후기가 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+            return Response(
+                ReviewArticleSerializer(review, context={"type" : "sent", "to_view" : ("received", received is not None)}).data, 
+                status=status.HTTP_200_OK
+                )
             
         # delete  review(article review) which logined user sent
         if self.request.method == "DELETE":
-            if Review.objects.filter(article=article, reviewer=request.user).exists():
-                review = Review.objects.get(article=article, reviewer=request.user)
+            with transaction.atomic():
                 review.delete()
-                return Response({"deleted" : True}, status=status.HTTP_200_OK)
-            else:
-                return Response({"후기가 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"deleted" : True}, status=status.HTTP_200_OK)
     
     
     # get or delete  review(article review) which logined user received [GET] [DELETE]
     @action(detail=True, methods=["GET",])
     def received(self, request, pk):
         
-        if Article.objects.filter(pk=pk).exists():
-            article = Article.objects.get(pk=pk)
-        else:
+        article = Article.objects.filter(pk=pk).first()
+        if article is None:
             return Response({"존재하지 않는 게시글입니다."}, status=status.HTTP_404_NOT_FOUND)
         
-        if request.user not in [article.seller, article.buyer]:
+        if request.user.id not in [article.seller_id, article.buyer_id]:
             return Response(
                 {"해당 게시글의 판매자 혹은 구매자만이 후기를 조회할 수 있습니다."}, 
                 status=status.HTTP_403_FORBIDDEN,
                 )
         
         # get review(article review) which logined user received
-        if self.request.method == "GET":
-            if Review.objects.filter(article=article, reviewyee=request.user).exists():
-                if(article.seller==request.user):
-                    review = Review.objects.get(article=article, reviewer=article.buyer, reviewyee=request.user)
-                elif(article.buyer==request.user):
-                    review = Review.objects.get(article=article, reviewer=article.seller, reviewyee=request.user)
-
-                sent = Review.objects.filter(article=article, reviewer=request.user).exists()
-                return Response(
-                    ReviewArticleSerializer(review, context={"type" : "received", "to_view" : ("sent", sent)}).data, 
-                    status=status.HTTP_200_OK,
-                    )
-            else:
-                return Response({"후기가 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+        sent, review = article_reviews_of(article, request.user)
+        if review is None:
+            return Response({"후기가 존재하지 않습니다."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(
+            ReviewArticleSerializer(review, context={"type" : "received", "to_view" : ("sent", sent is not None)}).data, 
+            status=status.HTTP_200_OK,
+            )
     
     
     # create review(article review) as a seller [POST]
     @action(detail=True, methods=["POST",])
     def seller(self, request, pk):
         
-        if Article.objects.filter(pk=pk).exists():
-            article = Article.objects.get(pk=pk)
-        else:
+        article = Article.objects.filter(pk=pk).first()
+        if article is None:
             return Response({"존재하지 않는 게시글입니다."}, status=status.HTTP_404_NOT_FOUND)
         
-        if article.seller != request.user or article.buyer is None:
+        if article.seller_id != request.user.id or article.buyer_id is None:
             return Response({"리뷰를 작성할 권한이 없습니다."}, status=status.HTTP_403_FORBIDDEN)
         
-        if Review.objects.filter(article=article, reviewer=request.user):
-            return Response({"하나의 거래글 당 하나의 후기만 작성할 수 있습니다."}, status=status.HTTP_403_FORBIDDEN)
-        
-        review = request.data.get('review', None)
-        if review is not None: 
-            review_location = request.user.location
-        else:
-            review_location = None
-            
-        serializer = ReviewArticleValidator(data=request.data, partial=True)
-        serializer.is_valid(raise_exception=True)
-        
-        review = Review(review_type="seller",
-                        reviewer=article.seller,
-                        reviewyee=article.buyer,
-                        article=article,
-                        review_location = review_location,
-                        **serializer.validated_data
-                        )
-        review.save()
-        
-        received = Review.objects.filter(article=article, reviewyee=request.user).exists()
-        return Response(
-                ReviewArticleSerializer(review, context={"type" : "sent", "to_view" : ("received", received)}).data, 
-                status=status.HTTP_201_CREATED,
-                )
+        return self.create_review(request, article, "seller", article.buyer_id)
         
     
     # create review(article review) as a buyer [POST]
     @action(detail=True, methods=["POST",]) 
     def buyer(self, request, pk):
         
-        if Article.objects.filter(pk=pk).exists():
-            article = Article.objects.get(pk=pk)
-        else:
+        article = Article.objects.filter(pk=pk).first()
+        if article is None:
             return Response({"존재하지 않는 게시글입니다."}, status=status.HTTP_404_NOT_FOUND)
             
-        if article.buyer != request.user:
+        if article.buyer_id != request.user.id:
             return Response({"리뷰를 작성할 권한이 없습니다."}, status=status.HTTP_403_FORBIDDEN)
         
-        if Review.objects.filter(article=article, reviewer=request.user):
-            return Response({"하나의 거래글 당 하나의 후기만 작성할 수 있습니다."}, status=status.HTTP_403_FORBIDDEN)
-        
+        return self.create_review(request, article, "buyer", article.seller_id)
+    
+    def create_review(self, request, article, review_type, reviewyee_id):
         review = request.data.get('review', None)
         if review is not None: 
             review_location = request.user.location
@@ -158,18 +127,21 @@ class ReviewArticleViewSet(viewsets.GenericViewSet):
         serializer = ReviewArticleValidator(data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         
-        review = Review(review_type="buyer", 
-                        reviewer=article.buyer, 
-                        reviewyee=article.seller,
-                        article=article, 
-                        review_location = review_location,
-                        **serializer.validated_data
-                        )
-        review.save()
+        review, received = create_article_review(
+            article,
+            Review(review_type=review_type,
+                   reviewer=request.user,
+                   reviewyee_id=reviewyee_id,
+                   article=article,
+                   review_location = review_location,
+                   **serializer.validated_data
+                   ),
+        )
+        if review is None:
+            return Response({"하나의 거래글 당 하나의 후기만 작성할 수 있습니다."}, status=status.HTTP_403_FORBIDDEN)
         
-        received = Review.objects.filter(article=article, reviewyee=request.user).exists()
         return Response(
-                ReviewArticleSerializer(review, context={"type" : "sent", "to_view" : ("received", received)}).data, 
+                ReviewArticleSerializer(review, context={"type" : "sent", "to_view" : ("received", received is not None)}).data, 
                 status=status.HTTP_201_CREATED,
                 )
     
@@ -222,11 +194,7 @@ class ReviewUserView(APIView):
         else:
             return Response({"존재하지 않는 사용자입니다."}, status=status.HTTP_404_NOT_FOUND)
         
-        if type=="good":
-            manner = "0"*3
-        elif type=="bad":
-            manner = "0"*2
-        else:
+        if type not in ("good", "bad"):
             return Response({"매너칭찬, 비매너평가 중 하나를 선택해야 합니다."}, status-status.HTTP_400_BAD_REQUEST)
         
         reviewer = request.user
@@ -244,7 +212,7 @@ class ReviewUserView(APIView):
                             review = None,
                             review_location = None,
                             manner_type=type,
-                            manner = manner
+                            manner = 0
                             )
             review.save()
             
@@ -261,7 +229,22 @@ class ReviewViewSet(viewsets.GenericViewSet):
     def review(self, request, pk):
         if User.objects.filter(pk=pk).exists():
             reviewyee = User.objects.get(pk=pk)
-            reviews = Review.objects.filter(Q(review_type="seller") | Q(review_type="buyer"), reviewyee=reviewyee)
+            reviews = received_reviews(reviewyee)
+            
+            # keyset pages with ?cursor=, the first page with an empty cursor
+            if "cursor" in request.GET:
+                serializer = ReviewCursorValidator(data=request.GET)
+                serializer.is_valid(raise_exception=True)
+                reviews, next_cursor = paginate_reviews(reviews, **serializer.validated_data)
+                return Response(
+                    {
+                        "reviews": ReviewSerializer(reviews, many=True).data,
+                        "next_cursor": next_cursor,
+                    },
+                    status=status.HTTP_200_OK,
+                )
+            
+            reviews = prefetch_reviews(reviews).order_by("-created_at", "-id")
             return Response(ReviewSerializer(reviews, many=True).data, status=status.HTTP_200_OK,)
         else:
             return Response({"존재하지 않는 사용자입니다."}, status=status.HTTP_404_NOT_FOUND)
@@ -270,7 +253,7 @@ class ReviewViewSet(viewsets.GenericViewSet):
     @action(detail=True, methods=["GET",])
     def manner(self, request, pk):
         if User.objects.filter(pk=pk).exists():
-            user = User.objects.get(pk=pk)
+            user = User.objects.select_related("manner_histogram").get(pk=pk)
             return Response(UserMannerSerializer(user).data, status=status.HTTP_200_OK)
         else:
             return Response({"존재하지 않는 사용자입니다."}, status=status.HTTP_404_NOT_FOUND)
@@ -278,7 +261,10 @@ class ReviewViewSet(viewsets.GenericViewSet):
     # get review and manner evaluations which specific user received
     def retrieve(self, request, pk):
         if User.objects.filter(pk=pk).exists():
-            user = User.objects.get(pk=pk)
+            user = User.objects.select_related("manner_histogram").get(pk=pk)
+            # ?summary=true for the profile screen
+            if request.query_params.get("summary") == "true":
+                return Response(UserReviewSummarySerializer(user).data, status=status.HTTP_200_OK)
             return Response(UserReviewSerializer(user).data, status=status.HTTP_200_OK)
         else:
             return Response({"존재하지 않는 사용자입니다."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
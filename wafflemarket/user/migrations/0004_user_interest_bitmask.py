@@ -0,0 +1,56 @@
+from django.db import migrations
+
+import wafflemarket.fields
+from wafflemarket.fields import mask_from_string, mask_to_string
+
+
+# rows of queryset in pk order, at most batch_size of them in memory at a time
+def batches(queryset, batch_size=1000):
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1].id
+
+
+def interest_to_mask(apps, schema_editor):
+    User = apps.get_model("user", "User")
+    for users in batches(User.objects.only("id", "interest")):
+        for user in users:
+            user.interest_mask = mask_from_string(user.interest)
+        User.objects.bulk_update(users, ["interest_mask"])
+
+
+def mask_to_interest(apps, schema_editor):
+    User = apps.get_model("user", "User")
+    for users in batches(User.objects.only("id", "interest_mask")):
+        for user in users:
+            user.interest = mask_to_string(user.interest_mask, 17)
+        User.objects.bulk_update(users, ["interest"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0003_user_temparature'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='interest_mask',
+            field=wafflemarket.fields.BitmaskField(default=131071),
+        ),
+        migrations.RunPython(interest_to_mask, mask_to_interest),
+        migrations.RemoveField(
+            model_name='user',
+            name='interest',
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='interest_mask',
+            new_name='interest',
+        ),
+    ]
@@ -17,6 +17,7 @@ from django.utils import timezone
 
 from user.services import upload_profile_image
 from location.models import Location
+from wafflemarket.fields import BitmaskField
 
 
 class CustomUserManager(BaseUserManager):
@@ -114,7 +115,8 @@ class User(AbstractBaseUser, PermissionsMixin):
     )
     temparature = models.FloatField(default=36.5)
 
-    interest = models.CharField(max_length=255, default="1" * 17)
+    # bit i for category code i of UserCategoryView
+    interest = BitmaskField(default=(1 << 17) - 1)
     created_at = models.DateTimeField(auto_now_add=True, editable=False)
     leaved_at = models.DateTimeField(null=True)
     last_login = models.DateTimeField(null=True)
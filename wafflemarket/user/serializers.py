@@ -15,7 +15,6 @@ from django.utils import timezone
 from user.models import User, Auth
 from location.serializers import LocationSerializer
 from article.models import Article
-from review.services import update_temparature
 
 
 User = get_user_model()
@@ -218,7 +217,6 @@ class UserSerializer(serializers.ModelSerializer):
         return article_cnt
     
     def get_temparature(self, user):
-        update_temparature(user)
         return user.temparature
 
     def get_created_at(self, user):
@@ -275,6 +273,9 @@ class UserSimpleSerializer(serializers.ModelSerializer):
         return LocationSerializer(user.location, context=self.context).data
 
     def get_article_cnt(self, user):
+        # annotated by article.services.prefetch_users
+        if hasattr(user, "article_cnt"):
+            return user.article_cnt
         article_cnt = Article.objects.filter(seller=user).count()
         return article_cnt
 
@@ -287,7 +288,6 @@ class UserSimpleSerializer(serializers.ModelSerializer):
         return url[: url.find("?")]
     
     def get_temparature(self, user):
-        update_temparature(user)
         return user.temparature
 
 
@@ -380,10 +380,7 @@ class UserCategorySerializer(serializers.Serializer):
         }
         code = category_code[category]
         if enabled is True:
-            enabled = "1"
+            user.interest |= 1 << code
         else:
-            enabled = "0"
-        interest = list(user.interest)
-        interest[code] = enabled
-        user.interest = "".join(interest)
+            user.interest &= ~(1 << code)
         user.save()
\ No newline at end of file
@@ -5,6 +5,7 @@ from factory.django import DjangoModelFactory
 
 from user.models import User
 from user.serializers import jwt_token_of
+from wafflemarket.fields import mask_from_string
 
 
 class UserFactory(DjangoModelFactory):
@@ -148,7 +149,7 @@ class PutUserCategoryTestCase(TestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "1" * 17)
+        self.assertEqual(user.interest, mask_from_string("1" * 17))
 
     def test_put_category_wrong_information(self):
         # invalid category
@@ -163,7 +164,7 @@ class PutUserCategoryTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.json()["non_field_errors"][0], "카테고리가 부적절해요.")
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "1" * 17)
+        self.assertEqual(user.interest, mask_from_string("1" * 17))
 
         # invalid enabled
         data = self.put_data.copy()
@@ -177,7 +178,7 @@ class PutUserCategoryTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.json()["enabled"][0], "Must be a valid boolean.")
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "1" * 17)
+        self.assertEqual(user.interest, mask_from_string("1" * 17))
 
     def test_put_category_success(self):
 
@@ -193,7 +194,7 @@ class PutUserCategoryTestCase(TestCase):
         self.assertNotIn("디지털기기", response.json()["category"])
         self.assertIn("가구/인테리어", response.json()["category"])
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "0" + "1" * 16)
+        self.assertEqual(user.interest, mask_from_string("0" + "1" * 16))
 
         response = self.client.put(
             "/api/v1/user/category/",
@@ -205,7 +206,7 @@ class PutUserCategoryTestCase(TestCase):
         self.assertNotIn("디지털기기", response.json()["category"])
         self.assertNotIn("가구/인테리어", response.json()["category"])
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "00" + "1" * 15)
+        self.assertEqual(user.interest, mask_from_string("00" + "1" * 15))
 
         # successfully change enabled 'true' to 'false'
         data = self.put_data.copy()
@@ -220,7 +221,7 @@ class PutUserCategoryTestCase(TestCase):
         self.assertIn("디지털기기", response.json()["category"])
         self.assertNotIn("가구/인테리어", response.json()["category"])
         user = User.objects.get(phone_number="01033334444")
-        self.assertEqual(user.interest, "10" + "1" * 15)
+        self.assertEqual(user.interest, mask_from_string("10" + "1" * 15))
 
 
 class GetUserCategoryTestCase(TestCase):
@@ -230,7 +231,7 @@ class GetUserCategoryTestCase(TestCase):
             phone_number="01011112222",
             email="wafflemarket@test.com",
             username="steve",
-            interest="11001100110011001",
+            interest=mask_from_string("11001100110011001"),
         )
         cls.user_token = "JWT " + jwt_token_of(
             User.objects.get(phone_number="01011112222")
@@ -12,6 +12,7 @@ from django.http import HttpResponse
 from django.shortcuts import render
 
 import wafflemarket.settings as settings
+from wafflemarket.fields import codes_of
 from user.serializers import (
     UserLoginSerializer,
     UserCreateSerializer,
@@ -22,7 +23,8 @@ from user.serializers import (
     UserCategorySerializer,
 )
 from article.models import Article
-from article.serializers import ArticleSerializer
+from article.serializers import ArticleListSerializer
+from article.services import prefetch_articles
 from review.models import Review
 
 
@@ -201,10 +203,9 @@ class UserCategoryView(APIView):
             15: "도서/티켓/음반",
             16: "기타 중고물품",
         }
-        interest_list = []
-        for code, enabled in enumerate(user.interest):
-            if enabled == "1":
-                interest_list.append(code_category[code])
+        interest_list = [
+            code_category[code] for code in codes_of(user.interest, len(code_category))
+        ]
         return {"category": interest_list}
 
     def put(self, request):
@@ -226,9 +227,9 @@ class UserLikedView(APIView):
 
     def get(self, request):
         user = request.user
-        article = user.liked_articles.all()
+        article = prefetch_articles(user.liked_articles.all(), user)
         return Response(
-            ArticleSerializer(article, many=True, context = {"user" : request.user}).data, status=status.HTTP_200_OK
+            ArticleListSerializer(article, many=True, context = {"user" : request.user}).data, status=status.HTTP_200_OK
         )
          
 class UserHistoryView(APIView):
@@ -250,5 +251,6 @@ class UserHistoryView(APIView):
         else:
             return Response({"올바른 요청을 보내세요."}, status=status.HTTP_400_BAD_REQUEST)
                 
-        data = ArticleSerializer(article, many=True, context = {"user" : request.user}).data
+        article = prefetch_articles(article, request.user)
+        data = ArticleListSerializer(article, many=True, context = {"user" : request.user}).data
         return Response(data, status=status.HTTP_200_OK)
@@ -0,0 +1,63 @@
+from django.db import models
+
+
+# flags as an integer, bit i is code i
+def mask_of(codes):
+    mask = 0
+    for code in codes:
+        mask |= 1 << code
+    return mask
+
+
+def codes_of(mask, width):
+    return [code for code in range(width) if mask >> code & 1]
+
+
+def popcount(mask):
+    return bin(mask).count("1")
+
+
+# flag string of the old CharField columns, "1" at position i for code i
+def mask_from_string(flags):
+    return mask_of(code for code, flag in enumerate(flags) if flag == "1")
+
+
+def mask_to_string(mask, width):
+    return "".join("1" if mask >> code & 1 else "0" for code in range(width))
+
+
+class BitmaskField(models.PositiveIntegerField):
+    pass
+
+
+# Review.objects.filter(manner__has_bit=3)
+@BitmaskField.register_lookup
+class HasBit(models.Lookup):
+    lookup_name = "has_bit"
+
+    def get_db_prep_lookup(self, value, connection):
+        return ("%s", [1 << int(value)])
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return "(%s & %s) <> 0" % (lhs, rhs), lhs_params + rhs_params
+
+
+# number of set bits of a bitmask column of width bits,
+# BIT_COUNT on mysql and a sum of shifted bits elsewhere
+class BitCount(models.Func):
+    output_field = models.IntegerField()
+
+    def __init__(self, expression, width, **extra):
+        self.width = width
+        super().__init__(expression, **extra)
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        terms = ["((%s >> %d) & 1)" % (sql, bit) for bit in range(self.width)]
+        return "(%s)" % " + ".join(terms), params * self.width
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return "BIT_COUNT(%s)" % sql, params
@@ -221,3 +221,53 @@ CHANNEL_LAYERS = {
         },
     },
 }
+
+# cache alias sharing neighborhood map version between workers (location.services)
+# None keeps the map process local
+NEIGHBORHOOD_CACHE = None
+
+# article hits are buffered and written in batches (article.counters)
+# LocalHitCounter keeps hits in each worker and flushes them every FLUSH_INTERVAL
+# seconds and on shutdown. use article.counters.RedisHitCounter with LOCATION to
+# share hits between workers, then run flush_hits --interval as a worker.
+# flush_hits refuses to run with LocalHitCounter, it could not see the hits
+HIT_COUNTER = {
+    "BACKEND": "article.counters.LocalHitCounter",
+    "FLUSH_INTERVAL": 10,
+}
+
+# memory of per node view dedup filter, about 1.44 * CAPACITY * log2(1 / ERROR_RATE) bits
+VIEW_FILTER = {
+    "CAPACITY": 100000,
+    "ERROR_RATE": 0.001,
+}
+
+# threads storing product images and generating thumbnails (article.images)
+# 0 generates thumbnails inline after the upload
+PRODUCT_IMAGE_WORKERS = 4
+
+# chat messages are broadcast at once and written in batches (chat.buffer)
+# LocalChatBuffer takes blocks of ID_BLOCK_SIZE ids from the database and keeps
+# unwritten messages in the worker until they are written or it shuts down.
+# ids of one worker grow with time, ids of different workers may not,
+# an ID_BLOCK_SIZE of 1 orders them across workers at a query per message.
+# use chat.buffer.RedisChatBuffer with LOCATION to share them between workers
+CHAT_BUFFER = {
+    "BACKEND": "chat.buffer.LocalChatBuffer",
+    "ID_BLOCK_SIZE": 1000,
+    "FLUSH_SIZE": 100,
+    "FLUSH_INTERVAL": 0.05,
+}
+
+# chat replay and history frames (chat.consumers)
+CHAT_HISTORY = {
+    "BATCH_SIZE": 100,
+    "REPLAY_LIMIT": 1000,
+}
+
+# chats older than AGE_DAYS and chats of rooms whose article was deleted are moved
+# to gzipped archives of BATCH_SIZE chats in file storage (chat.archive)
+CHAT_ARCHIVE = {
+    "AGE_DAYS": 180,
+    "BATCH_SIZE": 5000,
+}